@@ -0,0 +1,37 @@
+"""
+Async versions of the read endpoints, served under /api/async/
+
+They run the same viewsets as the sync routes through
+``core.asyncviews.async_view``. Writes stay on the sync routes.
+"""
+from django.urls import path
+
+from core.asyncviews import async_view
+from recipe.views import IngredientViewSet, RecipeViewSet
+from tags.views import TagViewSet
+
+
+app_name = 'async'
+
+urlpatterns = [
+    path(
+        'recipe/recipes/',
+        async_view(RecipeViewSet.as_view({'get': 'list'})),
+        name='recipe-list',
+    ),
+    path(
+        'recipe/recipes/<int:pk>/',
+        async_view(RecipeViewSet.as_view({'get': 'retrieve'})),
+        name='recipe-detail',
+    ),
+    path(
+        'recipe/ingredients/',
+        async_view(IngredientViewSet.as_view({'get': 'list'})),
+        name='ingredient-list',
+    ),
+    path(
+        'tag/tags/',
+        async_view(TagViewSet.as_view({'get': 'list'})),
+        name='tag-list',
+    ),
+]
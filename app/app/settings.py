@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.DatabasePoolMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -82,12 +85,51 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # core.dbpool keeps connections open in a per-process pool;
+        # DB_POOL=0 opens a new connection for every request instead
+        'ENGINE': (
+            'core.dbpool' if os.environ.get('DB_POOL', '1') == '1'
+            else 'django.db.backends.postgresql'
+        ),
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'POOL': {
+            # Connections per process, shared by its threads, including
+            # the ASYNC_API_WORKERS
+
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # Seconds to wait for a free connection before failing with 503
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            # Idle seconds after which a connection is pinged before reuse
+            'HEALTH_CHECK_INTERVAL': float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+            'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        },
+    }
+}
+
+# Read replicas: DB_REPLICA_HOSTS=host1,host2 adds the aliases replica_1,
+# replica_2, ... with the primary's name and credentials. Safe API reads
+# are routed there by core.routers.
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Users who wrote are kept on the primary this long to read their writes
+REPLICA_PIN_CACHE = {
+    'ALIAS': os.environ.get('REPLICA_PIN_CACHE_ALIAS', 'default'),
+    'TIMEOUT': int(os.environ.get('REPLICA_PIN_SECONDS', 5)),
 }
 
 
@@ -110,6 +152,40 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# New passwords are hashed with PASSWORD_HASHER. Hashes made with the other
+# hashers still verify and are upgraded in the background at the next login.
+_PASSWORD_HASHERS = {
+    'argon2': 'core.hashers.Argon2PasswordHasher',
+    'scrypt': 'core.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PASSWORD_HASHER],
+    *(path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# Costs of the hashers in core.hashers; changing one upgrades existing
+# hashes at login. Compare them with `manage.py bench_hashers`.
+PASSWORD_ARGON2 = {
+    'TIME_COST': int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2)),
+    'MEMORY_COST': int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19 * 1024)),  # KiB
+    'PARALLELISM': int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1)),
+}
+PASSWORD_SCRYPT = {
+    'WORK_FACTOR': int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14)),
+    'BLOCK_SIZE': int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', 8)),
+    'PARALLELISM': int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', 1)),
+}
+
+# Processes verifying passwords at login; 0 hashes inline. Every server
+# process starts its own pool, so keep this small
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+
+AUTHENTICATION_BACKENDS = ['core.backends.PooledPasswordBackend']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -142,8 +218,103 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.IdCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+}
+
+# Token lookups are cached in-process (LRU, LOCAL_* settings) in front of
+# the shared Django cache named by ALIAS. Token deletion and user saves
+# evict entries; other processes see the change within LOCAL_TIMEOUT seconds.
+TOKEN_AUTH_CACHE = {
+    'ALIAS': os.environ.get('TOKEN_AUTH_CACHE_ALIAS', 'default'),
+    'TIMEOUT': int(os.environ.get('TOKEN_AUTH_CACHE_TIMEOUT', 300)),
+    'LOCAL_MAX_SIZE': int(os.environ.get('TOKEN_AUTH_CACHE_LOCAL_MAX_SIZE', 10000)),
+    'LOCAL_TIMEOUT': int(os.environ.get('TOKEN_AUTH_CACHE_LOCAL_TIMEOUT', 10)),
+}
+
+# Cached recipe list/detail responses, invalidated per user by recipe.cache
+RECIPE_CACHE = {
+    'ALIAS': os.environ.get('RECIPE_CACHE_ALIAS', 'default'),
+    'TIMEOUT': int(os.environ.get('RECIPE_CACHE_TIMEOUT', 600)),
+}
+
+# Threads rendering uploaded recipe images; 0 renders inline after commit
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_QUALITY = int(os.environ.get('RECIPE_IMAGE_QUALITY', 85))
+
+# Limits checked by recipe.uploads while an image upload streams in. At most
+# RECIPE_IMAGE_SNIFF_SIZE plus one chunk is held in memory per upload.
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = int(os.environ.get('RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = int(os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 40_000_000))
+RECIPE_IMAGE_UPLOAD_CHUNK_SIZE = int(os.environ.get('RECIPE_IMAGE_UPLOAD_CHUNK_SIZE', 64 * 1024))
+RECIPE_IMAGE_SNIFF_SIZE = int(os.environ.get('RECIPE_IMAGE_SNIFF_SIZE', 256 * 1024))
+
+# Largest list accepted by the recipe bulk endpoint
+RECIPE_BULK_MAX_ITEMS = int(os.environ.get('RECIPE_BULK_MAX_ITEMS', 1000))
+
+# Rows fetched per server-side cursor round trip by the recipe export
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 2000))
+
+# Serve the recipe stats totals from the per-user RecipeSummary rows, which
+# every recipe write keeps current, instead of aggregating over the recipes
+RECIPE_STATS_SUMMARY = os.environ.get('RECIPE_STATS_SUMMARY', '1') == '1'
+# Most used tags and ingredients listed by the recipe stats
+RECIPE_STATS_TOP = int(os.environ.get('RECIPE_STATS_TOP', 5))
+
+# Tag and ingredient autocomplete (core.autocomplete): matches returned
+# by default and at most, and the per-process cache of answers. TIMEOUT
+# bounds how long other processes serve answers from before a write.
+AUTOCOMPLETE_LIMIT = int(os.environ.get('AUTOCOMPLETE_LIMIT', 10))
+AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('AUTOCOMPLETE_MAX_LIMIT', 50))
+AUTOCOMPLETE_CACHE = {
+    'ENABLED': os.environ.get('AUTOCOMPLETE_CACHE', '1') == '1',
+    'MAX_SIZE': int(os.environ.get('AUTOCOMPLETE_CACHE_MAX_SIZE', 10000)),
+    'TIMEOUT': int(os.environ.get('AUTOCOMPLETE_CACHE_TIMEOUT', 30)),
 }
 
+# Build list responses from .values() rows instead of DRF serializer
+# fields (core.fastpath); the output is the same
+FAST_LIST_SERIALIZATION = os.environ.get('FAST_LIST_SERIALIZATION', '1') == '1'
+
+# Threads serving the /api/async/ views. They share the process's
+# connection pool, so with DB_POOL=1 at most DB_POOL_MAX_SIZE of them are
+# started; raise both together. 0 runs the views on Django's shared sync
+# thread.
+ASYNC_API_WORKERS = int(os.environ.get('ASYNC_API_WORKERS', 32))
+
+
+# Per-endpoint query counts, SQL/serializer time and response sizes
+# (core.metrics), served at /metrics/ only when METRICS_TOKEN is set.
+# API_SERVER_TIMING adds them to every response, for development and
+# benchmarks; it exposes timings to clients, so it is off by default.
+API_METRICS = os.environ.get('API_METRICS', '1') == '1'
+API_SERVER_TIMING = os.environ.get('API_SERVER_TIMING', '0') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Most queries a request to '<METHOD> <view name>' may run, counting
+# authentication. Exceeding one logs a warning, and fails the test suite,
+# whose runner sets API_QUERY_BUDGETS_ENFORCED.
+API_QUERY_BUDGETS = {
+    'GET recipe:recipe-list': 4,
+    'GET recipe:recipe-detail': 4,
+    'GET recipe:recipe-search': 4,
+    'GET recipe:recipe-stats': 4,
+    'GET recipe:recipe-image-status': 2,
+    'GET recipe:ingredient-list': 2,
+    'GET recipe:ingredient-autocomplete': 2,
+    'GET tags:tag-list': 2,
+    'GET tags:tag-autocomplete': 2,
+    'GET user:me': 1,
+    'POST user:token': 5,
+    'GET async:recipe-list': 4,
+    'GET async:recipe-detail': 4,
+    'GET async:ingredient-list': 2,
+    'GET async:tag-list': 2,
+}
+API_QUERY_BUDGETS_ENFORCED = False
+
+TEST_RUNNER = 'core.testing.TestRunner'
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
\ No newline at end of file
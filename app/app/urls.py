@@ -22,6 +22,8 @@ from drf_spectacular.views import (
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/',SpectacularAPIView.as_view(), name='api-schema'),
@@ -29,7 +31,9 @@ urlpatterns = [
 
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
-    path('api/tag/', include('tags.urls'))
+    path('api/tag/', include('tags.urls')),
+    path('api/async/', include('app.async_urls')),
+    path('metrics/', metrics_view, name='metrics'),
 
 ]
 
@@ -0,0 +1,91 @@
+"""
+Async views for ASGI deployments
+
+Django 3.2 has no async ORM, and under ASGI it runs every sync view on one
+shared thread. ``async_view`` wraps an existing DRF view so the event loop
+hands the whole request (authentication, queries and rendering) to a
+bounded thread pool instead. Requests then run in parallel, up to
+``ASYNC_API_WORKERS`` at a time, and behave exactly like the sync view.
+
+The threads take their connections from the default database's pool
+(``core.dbpool``), so there are never more of them than the pool has
+connections: a thread beyond that would only wait ``DB_POOL_TIMEOUT``
+seconds for one and then fail the request with a 503.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+from core.dbpool.base import pool_size
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def max_workers():
+    """``ASYNC_API_WORKERS``, capped at the database pool size"""
+    workers = settings.ASYNC_API_WORKERS
+    size = pool_size(connections[DEFAULT_DB_ALIAS].settings_dict)
+    return workers if size is None else min(workers, size)
+
+
+def get_executor():
+    """Process-wide pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max_workers(),
+                thread_name_prefix='async-api',
+            )
+        return _executor
+
+
+async def run_sync(func, *args, **kwargs):
+    """Await ``func`` running on the pool.
+
+    With ``ASYNC_API_WORKERS = 0`` it runs through ``sync_to_async`` on
+    Django's shared thread instead, which the tests rely on to see their
+    transaction.
+    """
+    if settings.ASYNC_API_WORKERS == 0:
+        return await sync_to_async(func)(*args, **kwargs)
+
+    call = functools.partial(_with_connections, func, *args, **kwargs)
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), context.run, call)
+
+
+def _with_connections(func, *args, **kwargs):
+    # Pool threads keep their own connections; honour CONN_MAX_AGE the way
+    # request_started/request_finished do for request threads
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Return an async view running the sync ``view`` on the pool"""
+
+    def render(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        # Render off the event loop too
+        if callable(getattr(response, 'render', None)):
+            response = response.render()
+        return response
+
+    async def wrapper(request, *args, **kwargs):
+        return await run_sync(render, request, *args, **kwargs)
+
+    wrapper.csrf_exempt = getattr(view, 'csrf_exempt', False)
+    return wrapper
@@ -0,0 +1,119 @@
+"""
+Authentication classes for the API
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as translate
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.cache import LocalCache
+
+
+_local_cache = None
+
+
+def _settings():
+    return settings.TOKEN_AUTH_CACHE
+
+
+def get_local_cache():
+    global _local_cache
+    if _local_cache is None:
+        config = _settings()
+        _local_cache = LocalCache(
+            config['LOCAL_MAX_SIZE'], config['LOCAL_TIMEOUT']
+        )
+    return _local_cache
+
+
+def get_shared_cache():
+    return caches[_settings()['ALIAS']]
+
+
+def _shared_key(key):
+    # Never put the raw token into the shared cache
+    return 'auth:token-values:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _values(instance, exclude=()):
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.attname not in exclude
+    }
+
+
+def _instance(model, values):
+    # Fields left out of values are deferred and loaded on access
+    return model.from_db(
+        router.db_for_write(model), list(values), list(values.values())
+    )
+
+
+def invalidate_tokens(*keys):
+    """Drop tokens from this process's cache and from the shared cache"""
+    local_cache = get_local_cache()
+    for key in keys:
+        local_cache.delete(key)
+    get_shared_cache().delete_many([_shared_key(key) for key in keys])
+
+
+def clear_token_cache():
+    """Reset the in-process cache, e.g. between tests or after reconfiguring"""
+    global _local_cache
+    _local_cache = None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in ``TokenAuthentication`` that caches token lookups.
+
+    Tokens are checked first in a bounded in-process LRU, then in the Django
+    cache named by ``TOKEN_AUTH_CACHE['ALIAS']``, and only then in the
+    database. Cached entries are dropped when a token is deleted or its user
+    is saved (see ``core.signals``). Other processes pick up those changes
+    when their local entries expire after ``LOCAL_TIMEOUT`` seconds.
+
+    The caches hold the field values of the token and its user, without the
+    password hash, and every request gets new objects built from them, so
+    a view changing ``request.user`` does not change it for other requests.
+    """
+
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        local_cache = get_local_cache()
+        values = local_cache.get(key)
+
+        if values is None:
+            shared_cache = get_shared_cache()
+            values = shared_cache.get(_shared_key(key))
+            if values is None:
+                try:
+                    token = model.objects.select_related('user').get(key=key)
+                except model.DoesNotExist:
+                    raise exceptions.AuthenticationFailed(
+                        translate('Invalid token.')
+                    )
+                values = (
+                    _values(token),
+                    _values(token.user, exclude=('password',)),
+                )
+                shared_cache.set(
+                    _shared_key(key), values, _settings()['TIMEOUT']
+                )
+            local_cache.set(key, values)
+
+        token_values, user_values = values
+        if not user_values['is_active']:
+            raise exceptions.AuthenticationFailed(
+                translate('User inactive or deleted.')
+            )
+
+        user_model = model._meta.get_field('user').related_model
+        token = _instance(model, token_values)
+        token.user = _instance(user_model, user_values)
+
+        return (token.user, token)
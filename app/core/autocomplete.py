@@ -0,0 +1,121 @@
+"""
+Prefix autocomplete for tag and ingredient names
+
+``suggest`` returns the most used names starting with a prefix, matched
+case-insensitively on the ``LOWER(name) text_pattern_ops`` index from
+migration 0015. Answers are kept in a per-model in-process cache. A cached
+prefix that had at most ``limit`` matches holds all of them, so it also
+answers every longer prefix by filtering in memory on the ``LOWER(name)``
+Postgres returned with it, so cached and queried matches agree: typing
+"tom", "toma", "tomat" costs one query. The cache of a model is cleared
+when one of its rows is created, renamed or deleted (see
+``recipe.signals``). Other processes pick up those changes, and usage
+counts moving the ranking, when their entries expire after
+``AUTOCOMPLETE_CACHE['TIMEOUT']`` seconds.
+"""
+from django.conf import settings
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.cache import LocalCache
+
+
+_caches = {}
+
+
+def _cache(model):
+    cache = _caches.get(model)
+    if cache is None:
+        config = settings.AUTOCOMPLETE_CACHE
+        cache = _caches.setdefault(
+            model, LocalCache(config['MAX_SIZE'], config['TIMEOUT'])
+        )
+    return cache
+
+
+def invalidate(model):
+    """Forget this process's cached answers for ``model``"""
+    cache = _caches.get(model)
+    if cache is not None:
+        cache.clear()
+
+
+def clear_cache():
+    """Drop every cached answer, e.g. between tests or after reconfiguring"""
+    _caches.clear()
+
+
+def _query(model, prefix, limit):
+    # One row more than asked tells whether the matches are complete
+    rows = list(
+        model.objects.filter_name_prefix(prefix)
+        .order_by('-usage_count', 'lower_name', 'id')
+        .values('id', 'name', 'usage_count', 'lower_name')[:limit + 1]
+    )
+    return rows[:limit], len(rows) <= limit
+
+
+def suggest(model, prefix, limit):
+    """Up to ``limit`` rows of ``model`` whose name starts with ``prefix``,
+    most used first, as ``{'id', 'name', 'usage_count', 'lower_name'}``
+    dicts.
+    """
+    prefix = prefix.lower()
+    if not settings.AUTOCOMPLETE_CACHE['ENABLED']:
+        return _query(model, prefix, limit)[0]
+
+    cache = _cache(model)
+    cached = cache.get((prefix, limit))
+    if cached is not None:
+        return cached[0]
+    # The longest shorter prefix whose matches are all cached
+    for end in range(len(prefix) - 1, 0, -1):
+        cached = cache.get((prefix[:end], limit))
+        if cached is not None and cached[1]:
+            rows = [
+                row for row in cached[0]
+                if row['lower_name'].startswith(prefix)
+            ]
+            cache.set((prefix, limit), (rows, True))
+            return rows
+
+    rows, complete = _query(model, prefix, limit)
+    cache.set((prefix, limit), (rows, complete))
+    return rows
+
+
+def _positive_int(value, default):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+class AutocompleteMixin:
+    """``GET .../autocomplete/?q=<prefix>&limit=<n>`` on a name viewset"""
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("q", OpenApiTypes.STR, required=True),
+            OpenApiParameter("limit", OpenApiTypes.INT),
+        ],
+    )
+    @action(methods=["GET"], detail=False, pagination_class=None)
+    def autocomplete(self, request):
+        prefix = request.query_params.get("q", "").strip()
+        if not prefix:
+            return Response(
+                {"q": "This parameter is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = _positive_int(
+            request.query_params.get("limit"), settings.AUTOCOMPLETE_LIMIT
+        )
+        limit = min(limit, settings.AUTOCOMPLETE_MAX_LIMIT)
+        rows = suggest(self.queryset.model, prefix, limit)
+        serializer = self.get_serializer(rows, many=True)
+        return Response(serializer.data)
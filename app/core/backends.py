@@ -0,0 +1,34 @@
+"""
+Authentication backends
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from core import hashers
+
+
+class PooledPasswordBackend(ModelBackend):
+    """``ModelBackend`` that checks passwords on the hashing process pool.
+
+    A hash from an outdated hasher or with outdated costs is upgraded in the
+    background after a successful login, instead of while the user waits.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            hashers.check_password(password, None)
+            return None
+
+        valid, must_update = hashers.check_password(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            hashers.schedule_rehash(user, password)
+        return user
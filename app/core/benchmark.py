@@ -0,0 +1,373 @@
+"""
+API benchmark: seeded datasets, request scenarios and baseline comparison
+
+``seed`` builds a reproducible dataset through the models: users with
+tokens, recipes, and global tags and ingredients linked to them. Every
+object it creates is named with the ``bench`` prefix, and ``seed``
+removes the previous run's objects first. ``build_requests`` turns a
+scenario into the requests a client cycles through. Clients use the
+seeded users' tokens in turn, so the per-user caches behave as in
+production. The requests are sent by ``run_in_process`` through Django's
+test client on threads, or over HTTP by ``core.loadtest``. ``compare``
+checks the results against a stored baseline.
+
+Seeding and clearing delete rows, so they refuse to run unless the
+database is a dedicated one (see ``is_dedicated_database``).
+``dedicated_database`` otherwise creates a throwaway database the way the
+test runner does.
+"""
+import platform
+import random
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from core.loadtest import LoadRequest, LoadResult
+from core.metrics import parse_query_count
+from core.models import Ingredient, Recipe, Tag
+from recipe.search import update_search_vectors
+from recipe.stats import record_created
+from recipe.usage import count_links
+
+
+PASSWORD = 'bench-password-123'
+EMAIL = 'bench-{}@example.com'
+TAG_NAME = 'bench tag {}'
+INGREDIENT_NAME = 'bench ingredient {}'
+MULTIPART_BOUNDARY = 'bench-boundary'
+# Recipe descriptions are drawn from these
+WORDS = (
+    'simmer', 'roast', 'fresh', 'garlic', 'onion', 'butter', 'slow', 'crispy',
+    'tomato', 'lemon', 'basil', 'spicy', 'sweet', 'smoky', 'chicken', 'rice',
+    'bake', 'grill', 'whisk', 'fold', 'season', 'pepper', 'salt', 'honey',
+)
+
+SCENARIOS = (
+    'recipe-list', 'recipe-detail', 'tag-list', 'ingredient-list', 'token',
+    'upload',
+)
+
+# Changes of these summary values beyond the tolerance are regressions;
+# True means higher is better
+COMPARED = {'rps': True, 'p95_ms': False}
+
+
+# Databases the benchmark may write to: test databases and bench_* ones
+DEDICATED_DATABASE_PREFIXES = ('test_', 'bench_')
+
+
+class Dataset:
+    """What ``seed`` created: ``[(email, token key, [recipe ids])]``"""
+
+    def __init__(self, users):
+        self.users = users
+
+
+def is_dedicated_database(alias=DEFAULT_DB_ALIAS):
+    name = connections[alias].settings_dict['NAME'] or ''
+    return name.startswith(DEDICATED_DATABASE_PREFIXES)
+
+
+def _check_database():
+    if not is_dedicated_database():
+        names = ' or '.join(
+            f'{prefix}*' for prefix in DEDICATED_DATABASE_PREFIXES
+        )
+        raise RuntimeError(
+            f'The benchmark only writes to databases named {names}'
+        )
+
+
+@contextmanager
+def dedicated_database():
+    """Use the configured database if it is dedicated, else a throwaway one.
+
+    The throwaway database is created and migrated like a test database and
+    dropped when the block exits. Replicas still point at the configured
+    database, so reads stay on the throwaway one meanwhile.
+    """
+    if is_dedicated_database():
+        yield
+        return
+    connection = connections[DEFAULT_DB_ALIAS]
+    name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        with override_settings(DATABASE_REPLICAS=[]):
+            yield
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+
+def machine():
+    """Name of this machine, recorded with results.
+
+    Timings are only compared between results of the same machine.
+    """
+    return platform.node()
+
+
+def clear():
+    """Delete the objects created by ``seed``"""
+    _check_database()
+    get_user_model().objects.filter(
+        email__startswith='bench-', email__endswith='@example.com'
+    ).delete()
+    Tag.objects.filter(name__startswith='bench tag ').delete()
+    Ingredient.objects.filter(name__startswith='bench ingredient ').delete()
+
+
+def seed(users=10, recipes=50, tags=20, ingredients=50, links=3, seed=0):
+    """Create a dataset; the same arguments always give the same data.
+
+    Each user gets ``recipes`` recipes, each linked to ``links`` of the
+    tags and ``links`` of the ingredients.
+    """
+    _check_database()
+    rng = random.Random(seed)
+    with transaction.atomic():
+        clear()
+        # Hashing once keeps seeding fast; every user shares the password
+        password = make_password(PASSWORD)
+        owners = get_user_model().objects.bulk_create([
+            get_user_model()(
+                email=EMAIL.format(index), name=f'Bench {index}',
+                password=password,
+            )
+            for index in range(users)
+        ])
+        tokens = Token.objects.bulk_create([
+            Token(user=owner, key=Token.generate_key()) for owner in owners
+        ])
+        tag_objects = Tag.objects.bulk_create([
+            Tag(name=TAG_NAME.format(index)) for index in range(tags)
+        ])
+        ingredient_objects = Ingredient.objects.bulk_create([
+            Ingredient(name=INGREDIENT_NAME.format(index))
+            for index in range(ingredients)
+        ])
+        recipe_objects = Recipe.objects.bulk_create([
+            Recipe(
+                user=owner,
+                title=f'Bench recipe {owner_index}-{index}',
+                description=' '.join(
+                    rng.choice(WORDS) for _ in range(rng.randint(5, 40))
+                ),
+                time_minutes=rng.randint(5, 180),
+                price=Decimal(rng.randint(100, 5000)) / 100,
+                link=f'https://example.com/{owner_index}/{index}',
+            )
+            for owner_index, owner in enumerate(owners)
+            for index in range(recipes)
+        ])
+        _link(recipe_objects, 'tags', tag_objects, links, rng)
+        _link(recipe_objects, 'ingredients', ingredient_objects, links, rng)
+        # bulk_create sends no signals
+        update_search_vectors(recipe.id for recipe in recipe_objects)
+        record_created(recipe_objects)
+
+    recipe_ids = {}
+    for recipe in recipe_objects:
+        recipe_ids.setdefault(recipe.user_id, []).append(recipe.id)
+    return Dataset([
+        (owner.email, token.key, recipe_ids.get(owner.id, []))
+        for owner, token in zip(owners, tokens)
+    ])
+
+
+def _link(recipes, field_name, targets, count, rng):
+    if not targets:
+        return
+    through = getattr(Recipe, field_name).through
+    column = through._meta.get_field(targets[0]._meta.model_name).attname
+    rows = [
+        through(recipe_id=recipe.id, **{column: target.id})
+        for recipe in recipes
+        for target in rng.sample(targets, min(count, len(targets)))
+    ]
+    through.objects.bulk_create(rows)
+    count_links(type(targets[0]), [getattr(row, column) for row in rows])
+
+
+def sample_image():
+    image = Image.new('RGB', (640, 480), (200, 120, 40))
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def build_requests(scenario, dataset):
+    """The requests one client cycles through for ``scenario``"""
+    requests = []
+    image = sample_image() if scenario == 'upload' else None
+    for email, key, recipe_ids in dataset.users:
+        auth = {'Authorization': f'Token {key}'}
+        if scenario == 'recipe-list':
+            requests.append(
+                LoadRequest(reverse('recipe:recipe-list'), headers=auth)
+            )
+        elif scenario == 'recipe-detail':
+            requests.extend(
+                LoadRequest(
+                    reverse('recipe:recipe-detail', args=[pk]), headers=auth
+                )
+                for pk in recipe_ids
+            )
+        elif scenario == 'tag-list':
+            requests.append(
+                LoadRequest(reverse('tags:tag-list'), headers=auth)
+            )
+        elif scenario == 'ingredient-list':
+            requests.append(
+                LoadRequest(reverse('recipe:ingredient-list'), headers=auth)
+            )
+        elif scenario == 'token':
+            body = urlencode({'email': email, 'password': PASSWORD}).encode()
+            requests.append(LoadRequest(
+                reverse('user:token'), 'POST',
+                {'Content-Type': 'application/x-www-form-urlencoded'}, body,
+            ))
+        elif scenario == 'upload':
+            requests.extend(
+                LoadRequest(
+                    reverse('recipe:recipe-upload-image', args=[pk]), 'POST',
+                    {
+                        **auth,
+                        'Content-Type': 'multipart/form-data; '
+                        f'boundary={MULTIPART_BOUNDARY}',
+                    },
+                    _multipart('image', 'bench.jpg', 'image/jpeg', image),
+                )
+                for pk in recipe_ids[:1]
+            )
+        else:
+            raise ValueError(f'Unknown scenario: {scenario}')
+    return requests
+
+
+def _multipart(field, filename, content_type, content):
+    return (
+        f'--{MULTIPART_BOUNDARY}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; '
+        f'filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + content + f'\r\n--{MULTIPART_BOUNDARY}--\r\n'.encode()
+
+
+def run_in_process(requests, concurrency=8, duration=5.0, host='localhost'):
+    """Send ``requests`` round robin through Django's test client.
+
+    Each of ``concurrency`` threads acts as one client. With a concurrency
+    of 1 the client runs on the calling thread instead.
+    """
+    latencies, errors, queries = [], [], []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def client(offset):
+        django_client = Client(SERVER_NAME=host, raise_request_exception=False)
+        index = offset
+        while time.perf_counter() < deadline:
+            request = requests[index % len(requests)]
+            index += 1
+            headers = dict(request.headers or {})
+            content_type = headers.pop(
+                'Content-Type', 'application/octet-stream'
+            )
+            environ = {
+                f"HTTP_{name.upper().replace('-', '_')}": value
+                for name, value in headers.items()
+            }
+            started = time.perf_counter()
+            response = django_client.generic(
+                request.method, request.path, request.body, content_type,
+                **environ
+            )
+            elapsed = time.perf_counter() - started
+            count = parse_query_count(response.get('Server-Timing', ''))
+            with lock:
+                if response.status_code >= 400:
+                    errors.append(1)
+                    continue
+                latencies.append(elapsed)
+                if count is not None:
+                    queries.append(count)
+
+    def thread_client(offset):
+        try:
+            client(offset)
+        finally:
+            connections.close_all()
+
+    # Query counts are read from the Server-Timing header
+    with override_settings(API_SERVER_TIMING=True):
+        if concurrency == 1:
+            client(0)
+        else:
+            threads = [
+                threading.Thread(target=thread_client, args=(offset,))
+                for offset in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    elapsed = time.perf_counter() - start
+    return LoadResult(latencies, len(errors), elapsed, queries)
+
+
+def compare(results, baseline, tolerance=0.1, timings=True):
+    """Compare ``{scenario: summary}`` dicts.
+
+    Returns ``(rows, regressions)``. Each row is ``(scenario, name, baseline
+    value, new value, change)``, where the change is relative, or absolute
+    for queries per request. A throughput or p95 latency change for the
+    worse by more than ``tolerance`` is a regression. So is a rise in
+    queries per request by more than ``tolerance`` plus 0.05, which
+    leaves room for a few cache misses but not an extra query per request.
+    With ``timings=False``, e.g. for a baseline from another machine, only
+    queries per request are compared.
+    """
+    rows, regressions = [], []
+    for scenario, summary in results.items():
+        old = baseline.get(scenario)
+        if old is None:
+            continue
+        for name, higher_is_better in COMPARED.items() if timings else ():
+            if not old.get(name):
+                continue
+            change = (summary[name] - old[name]) / old[name]
+            rows.append((scenario, name, old[name], summary[name], change))
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                regressions.append(
+                    f'{scenario} {name}: {old[name]} -> {summary[name]}'
+                )
+        old_queries = old.get('queries_per_request')
+        new_queries = summary.get('queries_per_request')
+        if old_queries is not None and new_queries is not None:
+            rows.append((
+                scenario, 'queries_per_request', old_queries, new_queries,
+                new_queries - old_queries,
+            ))
+            if new_queries - old_queries > old_queries * tolerance + 0.05:
+                regressions.append(
+                    f'{scenario} queries_per_request: '
+                    f'{old_queries} -> {new_queries}'
+                )
+
+    return rows, regressions
@@ -0,0 +1,8 @@
+"""
+PostgreSQL backend with a per-process connection pool
+
+Select it with ``'ENGINE': 'core.dbpool'`` and configure it through the
+``POOL`` entry of the database settings (see ``app/settings.py``).
+Django still opens and closes a connection per request; closing returns
+it to the pool instead of ending the session.
+"""
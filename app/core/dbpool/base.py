@@ -0,0 +1,83 @@
+import functools
+
+import psycopg2
+import psycopg2.extras
+from django.db.backends.postgresql.base import (
+    DatabaseWrapper as PostgresDatabaseWrapper,
+)
+
+from core.dbpool.creation import DatabaseCreation
+from core.dbpool.pool import DEFAULT_MAX_SIZE, ConnectionPool, get_pool
+
+
+# settings_dict['POOL'] key -> ConnectionPool argument
+POOL_OPTIONS = {
+    'MAX_SIZE': 'max_size',
+    'TIMEOUT': 'timeout',
+    'HEALTH_CHECK_INTERVAL': 'health_check_interval',
+    'MAX_LIFETIME': 'max_lifetime',
+}
+
+
+def pool_size(settings_dict):
+    """Most connections a process opens to the database of
+    ``settings_dict``, or None when it does not use a pool
+    """
+    if settings_dict['ENGINE'] != 'core.dbpool':
+        return None
+    return settings_dict.get('POOL', {}).get('MAX_SIZE', DEFAULT_MAX_SIZE)
+
+
+def connect(conn_params, isolation_level=None):
+
+    # What Django's get_new_connection does for a fresh session
+    connection = psycopg2.connect(**conn_params)
+    if isolation_level not in (None, connection.isolation_level):
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(
+        conn_or_curs=connection, loads=lambda x: x
+    )
+    return connection
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        self._pool = self._get_pool(conn_params)
+        connection = self._pool.getconn()
+        # Set by Django's get_new_connection only for newly opened sessions
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps using a connection closed inside atomic() until
+                # the block exits, so it cannot go back to the pool
+                self._pool.discard(self.connection)
+            else:
+                self._pool.putconn(self.connection)
+
+    def _get_pool(self, conn_params):
+        key = (
+            self.alias,
+            conn_params.get('database'),
+            tuple(sorted(
+                (name, str(value)) for name, value in conn_params.items()
+            )),
+        )
+        settings = self.settings_dict.get('POOL', {})
+        options = {
+            argument: settings[name]
+            for name, argument in POOL_OPTIONS.items() if name in settings
+        }
+        opener = functools.partial(
+            connect, conn_params,
+            self.settings_dict['OPTIONS'].get('isolation_level'),
+        )
+        return get_pool(key, lambda: ConnectionPool(opener, **options))
@@ -0,0 +1,13 @@
+from django.db.backends.postgresql.creation import (
+    DatabaseCreation as PostgresDatabaseCreation,
+)
+
+from core.dbpool.pool import close_pools
+
+
+class DatabaseCreation(PostgresDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Pooled sessions would block DROP DATABASE
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
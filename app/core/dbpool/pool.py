@@ -0,0 +1,236 @@
+"""
+Bounded, health-checked pool of psycopg2 connections
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from django.db.utils import OperationalError
+from psycopg2 import extensions
+
+
+logger = logging.getLogger(__name__)
+
+# Checkouts that waited longer than this are logged
+SLOW_WAIT = 0.1
+
+# Connections per pool unless POOL['MAX_SIZE'] says otherwise
+DEFAULT_MAX_SIZE = 10
+
+STAT_NAMES = (
+    'opened', 'closed', 'reused', 'waits', 'wait_ms', 'timeouts',
+    'failed_health_checks',
+)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolExhausted(OperationalError):
+    """No connection became free within the pool's timeout"""
+
+
+def get_pool(key, create):
+    """The process-wide pool for ``key``, made by ``create()`` on first use"""
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = create()
+        return pool
+
+
+def pool_stats():
+    """``{(alias, database): stats}`` for every pool of this process"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {
+        (alias, database): pool.stats()
+        for (alias, database, _), pool in pools.items()
+    }
+
+
+def close_pools(database=None):
+    """Close the idle connections of all pools, or of one database's"""
+    with _pools_lock:
+        pools = [
+            pool for (alias, name, _), pool in _pools.items()
+            if database is None or name == database
+        ]
+    for pool in pools:
+        pool.close_idle()
+
+
+class ConnectionPool:
+    """Up to ``max_size`` open connections shared by the threads of a process.
+
+    ``getconn`` hands out the most recently returned idle connection, or
+    opens a new one while below ``max_size``. Otherwise it waits up to
+    ``timeout`` seconds and then raises ``PoolExhausted``. Idle connections
+    are pinged before reuse once they have been idle for
+    ``health_check_interval`` seconds, and replaced after ``max_lifetime``.
+    """
+
+    def __init__(self, connect, max_size=DEFAULT_MAX_SIZE, timeout=5.0,
+                 health_check_interval=30.0, max_lifetime=1800.0):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle = collections.deque()  # (connection, returned at)
+        self._opened_at = {}
+        self._size = 0
+        self._pid = os.getpid()
+        self._stats = collections.Counter(dict.fromkeys(STAT_NAMES, 0))
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        wait_started = None
+        while True:
+            with self._cond:
+                self._check_fork()
+                while not self._idle and self._size >= self.max_size:
+                    now = time.monotonic()
+                    if wait_started is None:
+                        wait_started = now
+                        self._stats['waits'] += 1
+                    if now >= deadline:
+                        self._stats['timeouts'] += 1
+                        raise PoolExhausted(
+                            f'All {self.max_size} database connections are '
+                            f'in use; none was returned within '
+                            f'{self.timeout}s'
+                        )
+                    self._cond.wait(deadline - now)
+
+                if wait_started is not None:
+                    waited = time.monotonic() - wait_started
+                    self._stats['wait_ms'] += int(waited * 1000)
+                    if waited > SLOW_WAIT:
+                        logger.warning(
+                            'Waited %.3fs for a database connection', waited
+                        )
+                    wait_started = None
+
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                else:
+                    connection = None
+                    self._size += 1
+
+            if connection is None:
+                return self._open()
+            if self._healthy(connection, returned_at):
+                with self._cond:
+                    self._stats['reused'] += 1
+                return connection
+            self._discard(connection)
+
+    def putconn(self, connection):
+        """Return a connection; broken or expired ones are closed instead"""
+        if os.getpid() != self._pid:
+            return
+        if (
+            connection.closed
+            or self._expired(connection)
+            or not self._reset(connection)
+        ):
+
+            self._discard(connection)
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, connection):
+        """Close a checked out connection instead of returning it"""
+        self._discard(connection)
+
+    def close_idle(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), collections.deque()
+        for connection, returned_at in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                **self._stats,
+            }
+
+    def _open(self):
+        try:
+            connection = self._connect()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opened_at[connection] = time.monotonic()
+            self._stats['opened'] += 1
+        return connection
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            if self._opened_at.pop(connection, None) is not None:
+                self._size -= 1
+            self._stats['closed'] += 1
+            self._cond.notify()
+
+    def _expired(self, connection):
+        opened_at = self._opened_at.get(connection, 0)
+        return time.monotonic() - opened_at > self.max_lifetime
+
+    def _healthy(self, connection, returned_at):
+        if connection.closed or self._expired(connection):
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            with self._cond:
+                self._stats['failed_health_checks'] += 1
+            return False
+        return True
+
+    def _reset(self, connection):
+        # Never hand out a connection with a transaction left open
+        status = connection.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _check_fork(self):
+        # Connections opened before a fork belong to the parent; closing
+        # them here would end the parent's sessions, so just forget them
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._opened_at.clear()
+            self._size = 0
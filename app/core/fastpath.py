@@ -0,0 +1,180 @@
+"""
+Read-only fast path for list endpoints
+
+DRF builds every row by walking the serializer's field objects, which
+dominates CPU time on long lists. ``FastSerializer`` walks the fields once,
+then builds plain dicts straight from ``.values()`` rows, with one query per
+nested relation, like a prefetch. It understands the shapes used by the
+list serializers here: model fields and nested many-to-many
+``ModelSerializer``s. Any other field raises ``Unsupported`` and
+``FastListMixin`` falls back to DRF.
+
+Nested rows come in primary key order, so the regular path must prefetch
+them ordered by ``pk`` for the two to match.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core.metrics import timed
+from core.renderers import FastJSONRenderer
+
+
+# Fields whose to_representation returns database values unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+)
+# Fields whose to_representation accepts the raw database value
+CONVERTED_FIELDS = (
+    serializers.DateField,
+    serializers.DateTimeField,
+    serializers.DecimalField,
+    serializers.FloatField,
+    serializers.UUIDField,
+)
+
+
+class Unsupported(Exception):
+    """The serializer has a field the fast path cannot reproduce"""
+
+
+class FastSerializer:
+    """Serialize ``.values()`` rows the way ``serializer`` does objects"""
+
+    def __init__(self, serializer):
+        model = serializer.Meta.model
+        opts = model._meta
+        self.pk = opts.pk.attname
+        # (output name, values() key or None, converter, nested FastSerializer)
+        self.fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                relation = self._relation(opts, field)
+                nested = (relation, FastSerializer(field.child))
+                self.fields.append((name, None, None, nested))
+            elif isinstance(field, PASSTHROUGH_FIELDS + CONVERTED_FIELDS):
+                column = self._column(opts, field)
+                convert = (
+                    None if isinstance(field, PASSTHROUGH_FIELDS)
+                    else field.to_representation
+                )
+                self.fields.append((name, column, convert, None))
+            else:
+                raise Unsupported(f'{type(serializer).__name__}.{name}')
+
+        self.values = list(dict.fromkeys(
+            [self.pk] + [column for _, column, _, _ in self.fields if column]
+        ))
+
+    @staticmethod
+    def _column(opts, field):
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            raise Unsupported(field.source)
+        if not model_field.concrete or model_field.is_relation:
+            raise Unsupported(field.source)
+        return model_field.attname
+
+    @staticmethod
+    def _relation(opts, field):
+        if not isinstance(field.child, serializers.ModelSerializer):
+            raise Unsupported(field.source)
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            raise Unsupported(field.source)
+        if not isinstance(model_field, models.ManyToManyField):
+            raise Unsupported(field.source)
+        return model_field
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        ids = [row[self.pk] for row in rows]
+        nested = {}
+        for name, _, _, relation in self.fields:
+            if relation is not None:
+                nested[name] = self._fetch_related(*relation, ids)
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert, relation in self.fields:
+                if relation is not None:
+                    item[name] = nested[name].get(row[self.pk], [])
+                    continue
+                value = row[column]
+                if convert is not None and value is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+    def _fetch_related(self, relation, child, ids):
+        # One query over the through table, joined to the related rows
+        if not ids:
+            return {}
+        through = relation.remote_field.through
+        source = relation.m2m_field_name()
+        target = relation.m2m_reverse_field_name()
+        links = (
+            through._default_manager
+            .filter(**{f'{source}_id__in': ids})
+            .order_by(f'{target}_id')
+            .values_list(
+                f'{source}_id',
+                *(f'{target}__{column}' for column in child.values)
+            )
+        )
+        owners, rows = [], []
+        for owner, *values in links:
+            owners.append(owner)
+            rows.append(dict(zip(child.values, values)))
+
+        by_owner = defaultdict(list)
+        for owner, item in zip(owners, child.to_representation(rows)):
+            by_owner[owner].append(item)
+        return by_owner
+
+
+class FastListMixin:
+    """Serve ``list`` through ``FastSerializer`` and ``FastJSONRenderer``.
+
+    Turned off with ``FAST_LIST_SERIALIZATION = False``.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        try:
+            fast = FastSerializer(self.get_serializer())
+        except Unsupported:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Relations are fetched by FastSerializer instead
+        queryset = queryset.prefetch_related(None).values(*fast.values)
+        page = self.paginate_queryset(queryset)
+        with timed('serialize'):
+            data = fast.to_representation(queryset if page is None else page)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action != 'list' or not settings.FAST_LIST_SERIALIZATION:
+            return renderers
+        return [
+            FastJSONRenderer() if type(renderer) is JSONRenderer else renderer
+            for renderer in renderers
+        ]
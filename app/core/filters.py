@@ -0,0 +1,24 @@
+"""
+Query parameter filters shared by the tag and ingredient lists
+"""
+from core.models import Recipe
+
+
+# relation -> column of the recipe's through table
+RELATIONS = {
+    'tags': 'tag_id',
+    'ingredients': 'ingredient_id',
+}
+
+
+def filter_assigned(queryset, relation, params, user):
+    """With ``assigned_only=1``, keep rows used by one of ``user``'s recipes"""
+    if params.get('assigned_only') not in ('1', 'true'):
+        return queryset
+
+    through = getattr(Recipe, relation).through
+    used = through.objects.filter(recipe__user=user).values(
+        RELATIONS[relation]
+    )
+
+    return queryset.filter(id__in=used)
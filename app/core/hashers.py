@@ -0,0 +1,241 @@
+"""
+Password hashers with tunable costs, and a process pool to run them on
+
+The hashers read their cost parameters from ``PASSWORD_ARGON2`` and
+``PASSWORD_SCRYPT``. Changing a parameter makes ``must_update`` true for
+existing hashes, so Django re-hashes them at the user's next login the same
+way it upgrades hashes from a non-preferred hasher.
+
+``check_password`` verifies a password on a process pool of
+``PASSWORD_HASH_WORKERS`` processes. Request threads then only wait on a
+future, and at most that many hashes are computed at once, so a burst of
+logins cannot take every core away from the rest of the API. If a worker
+dies the pool is replaced, and the check in flight is hashed inline.
+"""
+import base64
+import hashlib
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import close_old_connections, connection
+from django.utils.crypto import constant_time_compare
+
+
+logger = logging.getLogger(__name__)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Django's Argon2id hasher with costs from ``PASSWORD_ARGON2``"""
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2['TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2['MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2['PARALLELISM']
+
+
+class ScryptPasswordHasher(hashers.BasePasswordHasher):
+    """scrypt with costs from ``PASSWORD_SCRYPT``.
+
+    Hashes are encoded like those of Django 4's hasher of the same name,
+    ``scrypt$<n>$<salt>$<r>$<p>$<hash>``, so they keep working after an
+    upgrade.
+    """
+    algorithm = 'scrypt'
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT['WORK_FACTOR']
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT['BLOCK_SIZE']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT['PARALLELISM']
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+            # OpenSSL's default limit of 32 MiB is too low for larger n
+            maxmem=256 * n * r * p, dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
+
+    def decode(self, encoded):
+        algorithm, work_factor, salt, block_size, parallelism, hash_ = (
+            encoded.split('$', 6)
+        )
+
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'work_factor': int(work_factor),
+            'salt': salt,
+            'block_size': int(block_size),
+            'parallelism': int(parallelism),
+            'hash': hash_,
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(
+            password, decoded['salt'],
+            decoded['work_factor'], decoded['block_size'],
+            decoded['parallelism'],
+        )
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            'algorithm': decoded['algorithm'],
+            'work factor': decoded['work_factor'],
+            'block size': decoded['block_size'],
+            'parallelism': decoded['parallelism'],
+            'salt': hashers.mask_hash(decoded['salt']),
+            'hash': hashers.mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return (
+            decoded['work_factor'] != self.work_factor
+            or decoded['block_size'] != self.block_size
+            or decoded['parallelism'] != self.parallelism
+        )
+
+    def harden_runtime(self, password, encoded):
+        # The cost parameters are part of the hash; nothing to make up for
+        pass
+
+
+_executor = None
+_rehash_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide pool of hashing processes, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Forking a process that runs request threads is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def _get_rehash_executor():
+    global _rehash_executor
+    with _executor_lock:
+        if _rehash_executor is None:
+            _rehash_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='password-rehash',
+            )
+        return _rehash_executor
+
+
+def _init_worker():
+    # Spawned workers start without Django; DJANGO_SETTINGS_MODULE is inherited
+    import django
+    django.setup()
+
+
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _run(func, *args):
+    if settings.PASSWORD_HASH_WORKERS == 0:
+        return func(*args)
+    executor = get_executor()
+    try:
+        return executor.submit(func, *args).result()
+    except BrokenProcessPool:
+        # A worker died, e.g. killed for memory, and the pool cannot recover
+        # from that. Hash this password inline; the next one starts a new pool.
+        logger.exception('Password hashing pool is broken, hashing inline')
+        _discard_executor(executor)
+        return func(*args)
+
+
+def _verify(password, encoded):
+    if encoded is None:
+        # Hash anyway so unknown users take as long as known ones
+        hashers.make_password(password)
+        return False, False
+    needs_update = []
+    valid = hashers.check_password(
+        password, encoded, setter=needs_update.append
+    )
+    return valid, bool(needs_update)
+
+
+def check_password(password, encoded):
+    """Return ``(valid, must_update)`` for ``password`` against ``encoded``.
+
+    Pass ``encoded=None`` for a user that does not exist, to spend the same
+    time hashing. With ``PASSWORD_HASH_WORKERS = 0`` the hash is computed
+    inline.
+    """
+    return _run(_verify, password, encoded)
+
+
+def make_password(password):
+    return _run(hashers.make_password, password)
+
+
+def schedule_rehash(user, password):
+    """Re-hash ``user``'s password with the preferred hasher in the background.
+
+    The new hash is only saved if the password has not changed meanwhile.
+    With ``PASSWORD_HASH_WORKERS = 0`` this runs inline.
+    """
+    args = (type(user), user.pk, user.password, password)
+    if settings.PASSWORD_HASH_WORKERS == 0:
+        _rehash(*args)
+    else:
+        _get_rehash_executor().submit(_rehash_in_worker, *args)
+
+
+def _rehash(model, pk, old_encoded, password):
+    encoded = make_password(password)
+    model._default_manager.filter(pk=pk, password=old_encoded).update(
+        password=encoded
+    )
+
+
+def _rehash_in_worker(*args):
+    close_old_connections()
+    try:
+        _rehash(*args)
+    except Exception:
+        logger.exception('Re-hashing the password of user %s failed', args[1])
+    finally:
+        connection.close()
@@ -0,0 +1,179 @@
+"""
+Minimal asyncio HTTP/1.1 load generator used by the benchmark commands
+
+Each simulated client keeps one keep-alive connection and sends requests
+back to back until the deadline. Only what the API responses need is
+implemented: ``Content-Length`` and chunked bodies, plain HTTP. The query
+count in each response's Server-Timing header is collected too.
+"""
+import asyncio
+import statistics
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from core.metrics import parse_query_count
+
+
+# One request a client sends; headers is a dict and body bytes
+LoadRequest = namedtuple(
+    'LoadRequest', 'path method headers body', defaults=('GET', None, b'')
+)
+
+
+class LoadResult:
+    """Latencies (seconds), query counts and error count of one load run"""
+
+    def __init__(self, latencies, errors, elapsed, queries=()):
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+        self.queries = list(queries)
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def rps(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0.0
+        if len(self.latencies) == 1:
+            return self.latencies[0]
+        cuts = statistics.quantiles(self.latencies, n=100, method='inclusive')
+        return cuts[percent - 1]
+
+    @property
+    def queries_per_request(self):
+        # None when the server sent no Server-Timing query counts
+        return statistics.mean(self.queries) if self.queries else None
+
+    def summary(self):
+        queries = self.queries_per_request
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'rps': round(self.rps, 1),
+            'p50_ms': round(self.percentile(50) * 1000, 2),
+            'p95_ms': round(self.percentile(95) * 1000, 2),
+            'p99_ms': round(self.percentile(99) * 1000, 2),
+            'queries_per_request': (
+                None if queries is None else round(queries, 2)
+            ),
+        }
+
+
+async def _read_response(reader, headers=None):
+    """Read one response; returns ``(status, keep_alive)``.
+
+    ``headers``, when given, is filled with the lower-cased headers.
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    status = int(status_line.split()[1])
+
+    if headers is None:
+        headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    keep_alive = headers.get('connection', '').lower() != 'close'
+    return status, keep_alive
+
+
+def _encode(parts, request):
+    headers = {'Host': parts.netloc, **(request.headers or {})}
+    if request.body:
+        headers['Content-Length'] = len(request.body)
+    head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+    path = parts.path.rstrip('/') + request.path
+    start_line = f'{request.method} {path} HTTP/1.1\r\n'
+    return f'{start_line}{head}\r\n'.encode() + request.body
+
+
+async def _client(url, requests, offset, deadline, result):
+    latencies, errors, queries = result
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or 80
+    encoded = [_encode(parts, request) for request in requests]
+    writer = None
+    # Clients start at different requests of the cycle
+    index = offset
+
+    while time.perf_counter() < deadline:
+        request = encoded[index % len(encoded)]
+        index += 1
+        start = time.perf_counter()
+        headers = {}
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            status, keep_alive = await _read_response(reader, headers)
+        except (
+            OSError, ConnectionError, ValueError, asyncio.IncompleteReadError
+        ):
+
+            errors.append(1)
+            if writer is not None:
+                writer.close()
+            writer = None
+            continue
+
+        if status >= 400:
+            errors.append(1)
+        else:
+            latencies.append(time.perf_counter() - start)
+            count = parse_query_count(headers.get('server-timing', ''))
+            if count is not None:
+                queries.append(count)
+        if not keep_alive:
+            writer.close()
+            writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def _run(url, requests, concurrency, duration):
+    latencies, errors, queries = [], [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+        _client(url, requests, offset, deadline, (latencies, errors, queries))
+        for offset in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    return LoadResult(latencies, len(errors), elapsed, queries)
+
+
+def run_requests(url, requests, concurrency=100, duration=10.0):
+    """Send ``requests`` (LoadRequests) to ``url`` round robin.
+
+    Returns a LoadResult.
+    """
+
+    return asyncio.run(_run(url, list(requests), concurrency, duration))
+
+
+def run_load(url, paths, headers=None, concurrency=100, duration=10.0):
+    """GET ``url`` + each of ``paths`` round robin; returns a LoadResult"""
+    requests = [LoadRequest(path, headers=headers) for path in paths]
+    return run_requests(url, requests, concurrency, duration)
@@ -0,0 +1,60 @@
+"""
+Django command measuring login throughput of the password hashers
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Verify a password repeatedly with each hasher in ``PASSWORD_HASHERS``.
+
+    Verifying is what a login costs, and it runs on one core, so CPU time
+    per verification gives logins per second per core. Multiply by
+    ``PASSWORD_HASH_WORKERS`` for the ceiling of one process.
+    """
+    help = 'Measure logins per second per core for each password hasher'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--duration', type=float, default=2.0, help='Seconds per hasher'
+        )
+        parser.add_argument('--algorithm', action='append', dest='algorithms',
+                            help='Only measure this hasher; may be repeated')
+
+    def handle(self, *args, **options):
+        if options['duration'] <= 0:
+            raise CommandError('--duration must be positive')
+
+        hashers = get_hashers()
+        if options['algorithms']:
+            hashers = [
+                h for h in hashers if h.algorithm in options['algorithms']
+            ]
+            if not hashers:
+                raise CommandError('No configured hasher matches --algorithm')
+
+        self.stdout.write(
+            f"{'algorithm':24}{'ms/login':>10}{'logins/s/core':>15}"
+        )
+        for hasher in hashers:
+            cpu_ms, count = self.measure(hasher, options['duration'])
+            per_login = cpu_ms / count
+            self.stdout.write(
+                f'{hasher.algorithm:24}{per_login:>10.2f}'
+                f'{1000 / per_login:>15.1f}'
+            )
+        default = settings.PASSWORD_HASHERS[0].rsplit('.', 1)[-1]
+        self.stdout.write(self.style.SUCCESS(f'New passwords use {default}'))
+
+    def measure(self, hasher, duration):
+        encoded = hasher.encode('correct horse battery staple', hasher.salt())
+        count = 0
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        while count == 0 or time.perf_counter() - started < duration:
+            hasher.verify('correct horse battery staple', encoded)
+            count += 1
+        return (time.process_time() - cpu_started) * 1000, count
@@ -0,0 +1,188 @@
+"""
+Django command load testing the API against a seeded dataset
+"""
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+from core.loadtest import run_requests
+
+
+class Command(BaseCommand):
+    """Seed a dataset, load each scenario and compare with a baseline.
+
+    Without ``--url`` the requests go through Django's test client on
+    threads in this process. With ``--url`` they go over HTTP to a server
+    using the same database. Seeding replaces the objects of the previous
+    run, which are all named with a ``bench`` prefix, so it only writes to
+    a dedicated database, one named ``bench_*`` or ``test_*``. In-process
+    runs against any other database create a throwaway test database
+    instead; ``--url`` runs refuse to start. Query counts come from the
+    Server-Timing header, so they need ``API_METRICS``, and with ``--url``
+    the server needs ``API_SERVER_TIMING`` as well.
+
+    ``--output`` saves the results as JSON. ``--baseline`` compares them
+    with such a file and fails when a scenario regressed: throughput, p95
+    latency or queries per request worse by more than ``--tolerance``.
+    Timings depend on the hardware, so they are only compared with a
+    baseline recorded on the same machine; otherwise only queries per
+    request are. ``benchmarks/baseline.json`` holds the reference query
+    counts; record a baseline with ``--output`` to compare timings too.
+    """
+    help = 'Measure API latency, throughput and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--recipes', type=int, default=50, help='Per user')
+        parser.add_argument('--tags', type=int, default=20)
+        parser.add_argument('--ingredients', type=int, default=50)
+        parser.add_argument('--links', type=int, default=3,
+                            help='Tags and ingredients per recipe')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            choices=benchmark.SCENARIOS,
+                            help='Only run this scenario; may be repeated')
+        parser.add_argument('--url',
+                            help='Load this server instead of running '
+                                 'in-process')
+        parser.add_argument('--host', default='localhost',
+                            help='Host name for in-process requests')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5.0,
+                            help='Seconds per scenario')
+        parser.add_argument('--warmup', type=float, default=2.0,
+                            help='Seconds per scenario')
+        parser.add_argument('--output',
+                            help='Write the results to this JSON file')
+        parser.add_argument('--baseline',
+                            help='Compare with results saved by --output')
+        parser.add_argument('--tolerance', type=float, default=0.1)
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Leave the seeded dataset in a dedicated '
+                                 'database')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        if options['duration'] <= 0:
+            raise CommandError('--duration must be positive')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        if options['url'] and not benchmark.is_dedicated_database():
+            raise CommandError(
+                'Seeding deletes the previous run\'s data; point this command '
+                'and the server at a database named bench_*'
+            )
+
+        dataset_options = {
+            name: options[name]
+            for name in (
+                'users', 'recipes', 'tags', 'ingredients', 'links', 'seed',
+            )
+        }
+        with benchmark.dedicated_database():
+            dataset = benchmark.seed(**dataset_options)
+            self.stdout.write(
+                f"Seeded {options['users']} users x "
+                f"{options['recipes']} recipes, {options['tags']} tags, "
+                f"{options['ingredients']} ingredients"
+            )
+            try:
+                results = self.run_scenarios(dataset, options)
+            finally:
+                if not options['keep_data']:
+                    benchmark.clear()
+
+        self.write_table(results)
+        if options['output']:
+            report = {
+                'config': {
+                    **dataset_options,
+                    'mode': 'http' if options['url'] else 'in-process',
+                    'concurrency': options['concurrency'],
+                    'duration': options['duration'],
+                    'python': platform.python_version(),
+                    'machine': benchmark.machine(),
+                },
+                'scenarios': results,
+            }
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+                output.write('\n')
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            timings = baseline['config'].get('machine') == benchmark.machine()
+            if not timings:
+                self.stdout.write(
+                    'Baseline recorded on another machine; '
+                    'comparing queries per request only'
+                )
+            self.compare(
+                results, baseline['scenarios'], options['tolerance'], timings
+            )
+
+    def run_scenarios(self, dataset, options):
+        results = {}
+        for scenario in options['scenarios'] or benchmark.SCENARIOS:
+            requests = benchmark.build_requests(scenario, dataset)
+            if not requests:
+                self.stdout.write(f'{scenario}: nothing to request, skipped')
+                continue
+            if options['warmup']:
+                self.load(requests, options, options['warmup'])
+            result = self.load(requests, options, options['duration'])
+            results[scenario] = result.summary()
+        return results
+
+    def load(self, requests, options, duration):
+        if options['url']:
+            return run_requests(
+                options['url'], requests, options['concurrency'], duration
+            )
+        return benchmark.run_in_process(
+            requests, options['concurrency'], duration, options['host']
+        )
+
+    def write_table(self, results):
+        self.stdout.write(
+            f"{'scenario':16}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'queries':>9}{'errors':>8}"
+        )
+        for scenario, row in results.items():
+            queries = row['queries_per_request']
+            if queries is None:
+                queries = '-'
+            self.stdout.write(
+                f"{scenario:16}{row['rps']:>9}{row['p50_ms']:>9}"
+                f"{row['p95_ms']:>9}{row['p99_ms']:>9}{queries:>9}"
+                f"{row['errors']:>8}"
+            )
+
+    def compare(self, results, baseline, tolerance, timings):
+        rows, regressions = benchmark.compare(
+            results, baseline, tolerance, timings
+        )
+        self.stdout.write(
+            f"{'scenario':16}{'value':>20}{'baseline':>10}{'now':>10}"
+            f"{'change':>9}"
+        )
+        for scenario, name, old, new, change in rows:
+            if name == 'queries_per_request':
+                shown = f'{change:+.2f}'
+            else:
+                shown = f'{change:+.0%}'
+            self.stdout.write(
+                f'{scenario:16}{name:>20}{old:>10}{new:>10}{shown:>9}'
+            )
+        if regressions:
+            raise CommandError(
+                'Regressed against the baseline:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(
+            self.style.SUCCESS('No regressions against the baseline')
+        )
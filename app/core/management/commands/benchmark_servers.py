@@ -0,0 +1,83 @@
+"""
+Django command comparing the WSGI and ASGI deployments under load
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import run_load
+
+
+READ_PATHS = ['recipe/recipes/', 'recipe/ingredients/', 'tag/tags/']
+
+# deployment -> prefix of the read endpoints it serves
+PREFIXES = {
+    'wsgi': '/api/',
+    'asgi': '/api/async/',
+}
+
+
+class Command(BaseCommand):
+    """Measure requests per second of the read endpoints on both servers.
+
+    Start the two deployments first, e.g. with
+    ``docker compose --profile bench up``, which serves ``app.wsgi`` with
+    gunicorn on port 8001 and ``app.asgi`` with uvicorn workers on 8002.
+    The WSGI server is loaded through the sync routes and the ASGI server
+    through their ``/api/async/`` versions.
+    """
+    help = 'Compare requests per second of the WSGI and ASGI deployments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', default='http://localhost:8001')
+        parser.add_argument('--asgi', default='http://localhost:8002')
+        parser.add_argument('--token', required=True, help='API token to send')
+        parser.add_argument(
+            '--recipe-id', type=int, help='Also load this recipe'
+        )
+        parser.add_argument('--concurrency', type=int, default=256)
+        parser.add_argument(
+            '--duration', type=float, default=10.0, help='Seconds'
+        )
+        parser.add_argument(
+            '--warmup', type=float, default=2.0, help='Seconds'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        paths = list(READ_PATHS)
+        if options['recipe_id']:
+            paths.append(f"recipe/recipes/{options['recipe_id']}/")
+        headers = {'Authorization': f"Token {options['token']}"}
+
+        results = {}
+        for deployment, prefix in PREFIXES.items():
+            url = options[deployment]
+            deployment_paths = [prefix + path for path in paths]
+            self.stdout.write(
+                f"{deployment}: {url}, {options['concurrency']} clients, "
+                f"{options['duration']}s"
+            )
+            if options['warmup']:
+                run_load(url, deployment_paths, headers,
+                         options['concurrency'], options['warmup'])
+            results[deployment] = run_load(
+                url, deployment_paths, headers,
+                options['concurrency'], options['duration'],
+            )
+
+        self.stdout.write(
+            f"{'':6}{'rps':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        for deployment, result in results.items():
+            row = result.summary()
+            self.stdout.write(
+                f"{deployment:6}{row['rps']:>10}{row['p50_ms']:>10}"
+                f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['errors']:>8}"
+            )
+        if results['wsgi'].rps:
+            ratio = results['asgi'].rps / results['wsgi'].rps
+            self.stdout.write(
+                self.style.SUCCESS(f'ASGI/WSGI throughput: {ratio:.2f}x')
+            )
@@ -0,0 +1,153 @@
+"""
+Django command to delete recipe image files nothing refers to
+"""
+import os
+import time
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import RECIPE_IMAGE_DIR, ImageBlob, Recipe
+from core.storage import image_storage
+from recipe.images import RENDITION_DIR, RENDITIONS
+
+
+class Command(BaseCommand):
+    """Delete orphaned recipe images in batches.
+
+    Runs three passes:
+
+    * blobs whose reference count dropped to zero but whose file was not
+      removed, e.g. because the process died before the commit hook ran
+    * files in the image directory without a blob row, such as uploads
+      interrupted before the recipe was saved
+    * renditions no recipe lists any more
+
+    Anything changed within ``--min-age`` seconds is left alone, since an
+    upload in progress writes its file before a recipe points at it.
+    """
+    help = 'Delete recipe images and renditions no recipe uses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--min-age', type=int, default=3600, help='Seconds'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', help='List what would be deleted'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.dry_run = options['dry_run']
+        self.min_age = options['min_age']
+        self.cutoff = time.time() - self.min_age
+        self.deleted = 0
+        self.freed = 0
+
+        self._collect_unreferenced_blobs()
+        self._collect_untracked_files()
+        self._collect_stale_renditions()
+
+        verb = 'Would delete' if self.dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {self.deleted} files ({self.freed} bytes)'
+        ))
+
+    def _collect_unreferenced_blobs(self):
+        cutoff = timezone.now() - timedelta(seconds=self.min_age)
+        orphans = ImageBlob.objects.filter(ref_count=0, updated__lt=cutoff)
+        last_id = 0
+        while True:
+            batch = list(
+                orphans.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'name')[:self.batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            for _, name in batch:
+                size = _size(image_storage, name)
+                if self.dry_run or ImageBlob.objects.delete_orphan(name):
+                    self._deleted(name, size)
+
+    def _collect_untracked_files(self):
+        for batch in self._old_files(image_storage, RECIPE_IMAGE_DIR):
+            names = [name for name, size in batch]
+            # Recipes are checked too in case a count was never recorded
+            used = set(
+                ImageBlob.objects.filter(name__in=names)
+                .values_list('name', flat=True)
+            )
+            used.update(
+                Recipe.objects.filter(image__in=names)
+                .values_list('image', flat=True)
+            )
+            self._delete_unused(image_storage, batch, used)
+
+    def _collect_stale_renditions(self):
+        for batch in self._old_files(default_storage, RENDITION_DIR):
+            names = [name for name, size in batch]
+            listed = reduce(or_, (
+                Q(**{f'image_renditions__{rendition}__in': names})
+                for rendition in RENDITIONS
+            ))
+            used = {
+                path
+                for renditions in Recipe.objects.filter(listed)
+                .values_list('image_renditions', flat=True)
+                for path in renditions.values()
+            }
+            self._delete_unused(default_storage, batch, used)
+
+    def _old_files(self, storage, directory):
+        """Yield ``[(name, size), ...]`` batches of files past the cutoff"""
+        try:
+            entries = os.scandir(storage.path(directory))
+        except FileNotFoundError:
+            return
+        batch = []
+        with entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime >= self.cutoff:
+                    continue
+                name = os.path.join(directory, entry.name)
+                batch.append((name, stat.st_size))
+
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _delete_unused(self, storage, batch, used):
+        for name, size in batch:
+            if name in used:
+                continue
+            if not self.dry_run:
+                storage.delete(name)
+            self._deleted(name, size)
+
+    def _deleted(self, name, size):
+        self.deleted += 1
+        self.freed += size
+        if self.dry_run:
+            self.stdout.write(name)
+
+
+def _size(storage, name):
+    try:
+        return storage.size(name)
+    except FileNotFoundError:
+        return 0
@@ -0,0 +1,245 @@
+"""
+Django command to bulk import recipes from NDJSON or CSV
+"""
+import csv
+import json
+import os
+import sys
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Recipe, Tag, Ingredient
+from core.storage import content_hash
+from recipe import cache
+from recipe.search import update_search_vectors
+from recipe.stats import record_created
+from recipe.usage import count_links
+from recipe.exports import split_names
+
+
+RELATIONS = [('tags', Tag), ('ingredients', Ingredient)]
+# Recipe fields set from a record
+IMPORTED_FIELDS = ('title', 'description', 'time_minutes', 'price', 'link')
+
+
+class Command(BaseCommand):
+    """Import recipes in batches, bypassing the REST API.
+
+    Accepts the files written by the recipe export endpoint. Tag and
+    ingredient names go through an in-memory name -> id cache, and recipes
+    and their M2M rows are written with ``bulk_create`` one batch at a
+    time. With ``--checkpoint`` the number of committed records is saved
+    after every batch, and a re-run of the same file for the same user
+    skips those records.
+
+    Every record is validated against the model fields first, so a value
+    too long for its column fails as an invalid record, not as a database
+    error halfway through a batch.
+    """
+    help = (
+        'Import recipes for a user from an NDJSON or CSV file '
+        '("-" for stdin)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Email of the owner')
+        parser.add_argument('--format', choices=['ndjson', 'csv'])
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', help='File recording progress')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}")
+
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'ndjson'
+        )
+        if options['checkpoint'] and path == '-':
+            raise CommandError(
+                '--checkpoint needs a file; stdin cannot be resumed'
+            )
+        checkpoint = Checkpoint(options['checkpoint'], path, user)
+        done = checkpoint.read()
+        if done:
+            self.stdout.write(f'Resuming after {done} records')
+
+        self.name_cache = {field: {} for field, model in RELATIONS}
+        source = sys.stdin if path == '-' else open(path, newline='')
+        try:
+            records = _read_records(source, file_format)
+            records = islice(records, done, None)
+            while True:
+                try:
+                    batch = list(islice(records, batch_size))
+                except (ValueError, csv.Error) as exc:
+                    raise CommandError(
+                        f'Could not parse input after record {done}: {exc}'
+                    )
+                if not batch:
+                    break
+                self._write_batch(user, batch, done, checkpoint)
+                cache.bump_version(user.pk)
+                done += len(batch)
+                checkpoint.write(done)
+                self.stdout.write(f'Imported {done} records')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Import finished: {done} records')
+        )
+
+    def _write_batch(self, user, batch, done, checkpoint):
+        recipes = []
+        for number, record in enumerate(batch, start=done + 1):
+            try:
+                recipes.append(_build_recipe(user, record))
+            except (
+                KeyError, TypeError, ValueError, InvalidOperation,
+                ValidationError,
+            ) as exc:
+
+                raise CommandError(f'Record {number} is invalid: {exc!r}')
+
+        with transaction.atomic():
+            Recipe.objects.bulk_create(recipes)
+            for field, model in RELATIONS:
+                ids = self._resolve(field, model, batch)
+                through = getattr(Recipe, field).through
+                target = f'{model._meta.model_name}_id'
+                # Names differing only in case resolve to the same row
+                rows = [
+                    through(recipe_id=recipe.id, **{target: target_id})
+                    for recipe, record in zip(recipes, batch)
+                    for target_id in dict.fromkeys(
+                        ids[name] for name in record.get(field) or []
+                    )
+                ]
+                through.objects.bulk_create(rows, ignore_conflicts=True)
+                count_links(model, [getattr(row, target) for row in rows])
+            update_search_vectors(recipe.id for recipe in recipes)
+            record_created(recipes)
+            checkpoint.write_pending(done, done + len(batch), recipes[-1].id)
+
+    def _resolve(self, field, model, batch):
+        cache = self.name_cache[field]
+        missing = {
+            name
+            for record in batch
+            for name in record.get(field) or []
+            if name not in cache
+        }
+        if missing:
+            found = model.objects.get_or_create_many(missing)
+            cache.update((name, obj.id) for name, obj in found.items())
+        return cache
+
+
+def _read_records(source, file_format):
+    if file_format == 'csv':
+        for row in csv.DictReader(source):
+            for field, model in RELATIONS:
+                row[field] = split_names(row.get(field))
+            yield row
+    else:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _build_recipe(user, record):
+    recipe = Recipe(
+        user=user,
+        title=record['title'],
+        description=record.get('description') or '',
+        time_minutes=int(record['time_minutes']),
+        price=Decimal(str(record['price'])),
+        link=record.get('link') or '',
+    )
+    recipe.clean_fields(exclude=[
+        field.name for field in Recipe._meta.fields
+        if field.name not in IMPORTED_FIELDS
+    ])
+    for field, model in RELATIONS:
+        name_field = model._meta.get_field('name')
+        for name in record.get(field) or []:
+            name_field.clean(name, None)
+    return recipe
+
+
+def _file_hash(path):
+    with open(path, 'rb') as source:
+        return content_hash(File(source))
+
+
+class Checkpoint:
+    """Progress of importing one file for one user, kept in a JSON file.
+
+    Just before a batch commits it is recorded as pending, with the id of
+    its last recipe, and after the commit as done. Resuming after a crash
+    in between looks that recipe up to tell whether the batch committed.
+    """
+
+    def __init__(self, path, source_path, user):
+        self.path = path
+        self.user = user
+        self.identity = None
+        if path:
+            self.identity = {'file': _file_hash(source_path), 'user': user.pk}
+
+    def read(self):
+        """Number of records already imported"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as checkpoint:
+            try:
+                state = json.load(checkpoint)
+            except ValueError:
+                state = None
+        if not isinstance(state, dict) or 'done' not in state:
+            raise CommandError(f'{self.path} is not an import checkpoint')
+        if {key: state.get(key) for key in self.identity} != self.identity:
+            raise CommandError(
+                f'{self.path} records an import of another file or user'
+            )
+        pending = state.get('pending')
+        if pending and Recipe.objects.filter(
+            pk=pending['last_id'], user=self.user
+        ).exists():
+            return pending['done']
+        return state['done']
+
+    def write(self, done):
+        self._write(dict(self.identity or {}, done=done))
+
+    def write_pending(self, done, pending_done, last_id):
+        self._write(dict(
+            self.identity or {},
+            done=done,
+            pending={'done': pending_done, 'last_id': last_id},
+        ))
+
+    def _write(self, state):
+        if not self.path:
+            return
+        # Write then rename so a crash never leaves a half-written checkpoint
+        with open(f'{self.path}.tmp', 'w') as checkpoint:
+            json.dump(state, checkpoint)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(f'{self.path}.tmp', self.path)
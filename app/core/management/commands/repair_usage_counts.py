@@ -0,0 +1,30 @@
+"""
+Django command to recompute tag and ingredient usage counts
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.usage import RELATIONS, recount
+
+
+class Command(BaseCommand):
+    """Recount the recipes linked to every tag and ingredient.
+
+    The counts are kept current on every write, so this only repairs
+    drift, e.g. from rows written with raw SQL. Each batch of
+    ``--batch-size`` rows is fixed by one UPDATE in its own transaction,
+    so the tables are never locked as a whole.
+    """
+    help = 'Recompute Tag and Ingredient usage_count from the recipe links'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        for model in RELATIONS.values():
+            fixed = recount(model, options['batch_size'])
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {fixed} counts fixed'
+            )
+        self.stdout.write(self.style.SUCCESS('Usage counts repaired'))
@@ -0,0 +1,296 @@
+"""
+Per-endpoint request metrics
+
+``MetricsMiddleware`` measures each request: database queries and their
+time, time spent in serializers (``timed('serialize')``) and rendering,
+and the response size. The totals are kept per endpoint, which is the
+resolved view name such as ``recipe:recipe-list``, and served in
+Prometheus text format by ``metrics_view``. Each process keeps its own
+totals, like the connection pool statistics that are served with them.
+
+Queries are counted by an execute wrapper installed once on every database
+connection, so recording costs two clock reads per query and nothing is
+done outside a measured request.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+
+from core.dbpool.pool import pool_stats
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+_QUERY_COUNT = re.compile(r'\bdb;[^,]*desc="(\d+) queries"')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more queries than ``API_QUERY_BUDGETS`` allows"""
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'sql', 'serialize', 'render')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.sql * 1000:.1f};desc="{self.queries} queries", '
+            f'serialize;dur={self.serialize * 1000:.1f}, '
+            f'render;dur={self.render * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+
+def parse_query_count(server_timing):
+    """The query count in a Server-Timing header value, or None"""
+    match = _QUERY_COUNT.search(server_timing)
+    return int(match.group(1)) if match else None
+
+
+@contextmanager
+def measure():
+    """Collect the metrics of the code in the block"""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's ``name``"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        setattr(metrics, name, getattr(metrics, name) + elapsed)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql += time.perf_counter() - started
+
+
+def install(connection):
+    """Count the queries run on ``connection``; safe to call repeatedly"""
+    if _record_query not in connection.execute_wrappers:
+        # First, so execute_wrapper() blocks still pop their own wrapper
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def check_budget(method, endpoint, queries):
+    budget = settings.API_QUERY_BUDGETS.get(f'{method} {endpoint}')
+    if budget is None or queries <= budget:
+        return
+    message = (
+        f'{method} {endpoint} ran {queries} queries; its budget is {budget}'
+    )
+    if settings.API_QUERY_BUDGETS_ENFORCED:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class TimedSerializerMixin:
+    """Count the time spent building ``serializer.data`` as serializer time"""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """``list_serializer_class`` for ``TimedSerializerMixin`` serializers"""
+
+
+class Registry:
+    """Thread-safe totals per ``(endpoint, method)``"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, method, status, duration, metrics, size):
+        with self._lock:
+            totals = self._endpoints.get((endpoint, method))
+            if totals is None:
+                totals = self._endpoints[(endpoint, method)] = {
+                    'statuses': {},
+                    'buckets': [0] * (len(DURATION_BUCKETS) + 1),
+                    'duration': 0.0,
+                    'queries': 0,
+                    'sql': 0.0,
+                    'serialize': 0.0,
+                    'bytes': 0,
+                }
+            totals['statuses'][status] = totals['statuses'].get(status, 0) + 1
+            bucket = bisect.bisect_left(DURATION_BUCKETS, duration)
+            totals['buckets'][bucket] += 1
+            totals['duration'] += duration
+            totals['queries'] += metrics.queries
+            totals['sql'] += metrics.sql
+            totals['serialize'] += metrics.serialize
+            totals['bytes'] += size
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: {
+                    **totals,
+                    'statuses': dict(totals['statuses']),
+                    'buckets': list(totals['buckets']),
+                }
+                for key, totals in self._endpoints.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = Registry()
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def render_prometheus():
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(
+            f'{name}{{{labels}}} {value}' for labels, value in samples
+        )
+
+    endpoints = sorted(registry.snapshot().items())
+    metric(
+        'api_requests_total', 'counter',
+        'Requests by endpoint, method and status.',
+        [
+            (_labels(endpoint=endpoint, method=method, status=status), count)
+            for (endpoint, method), totals in endpoints
+            for status, count in sorted(totals['statuses'].items())
+        ],
+    )
+
+    lines.append('# HELP api_request_duration_seconds Request duration.')
+    lines.append('# TYPE api_request_duration_seconds histogram')
+    name = 'api_request_duration_seconds'
+    bounds = DURATION_BUCKETS + ('+Inf',)
+    for (endpoint, method), totals in endpoints:
+        labels = _labels(endpoint=endpoint, method=method)
+        cumulative = 0
+        for bound, count in zip(bounds, totals['buckets']):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'{name}_sum{{{labels}}} {totals["duration"]}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+    for name, key, help_text in (
+        (
+            'api_db_queries_total', 'queries',
+            'Database queries run by requests.',
+        ),
+        ('api_db_seconds_total', 'sql', 'Time spent in database queries.'),
+        (
+            'api_serializer_seconds_total', 'serialize',
+            'Time spent in serializers.',
+        ),
+        ('api_response_bytes_total', 'bytes', 'Response body bytes.'),
+    ):
+        metric(name, 'counter', help_text, [
+            (_labels(endpoint=endpoint, method=method), totals[key])
+            for (endpoint, method), totals in endpoints
+        ])
+
+    pools = sorted(pool_stats().items())
+    if pools:
+        metric(
+            'db_pool_connections', 'gauge', 'Pooled connections by state.',
+            [
+                (
+                    _labels(alias=alias, database=database, state=state),
+                    stats[state],
+                )
+                for (alias, database), stats in pools
+                for state in ('idle', 'in_use')
+            ],
+        )
+        for stat in (
+            'opened', 'closed', 'reused', 'waits', 'timeouts',
+            'failed_health_checks',
+        ):
+            help_text = f'Pool {stat.replace("_", " ")}.'
+            metric(f'db_pool_{stat}_total', 'counter', help_text, [
+                (_labels(alias=alias, database=database), stats[stat])
+                for (alias, database), stats in pools
+            ])
+        metric(
+            'db_pool_wait_seconds_total', 'counter',
+            'Time spent waiting for a pooled connection.',
+            [
+                (
+                    _labels(alias=alias, database=database),
+                    stats['wait_ms'] / 1000,
+                )
+                for (alias, database), stats in pools
+            ],
+        )
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, behind ``METRICS_TOKEN``.
+
+    Without a token configured the endpoint does not exist.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    if not constant_time_compare(
+        request.headers.get('Authorization', ''),
+        f'Bearer {settings.METRICS_TOKEN}',
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
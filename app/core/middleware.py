@@ -0,0 +1,93 @@
+"""
+Middleware shared by the API apps
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from core import metrics
+from core.dbpool.pool import PoolExhausted
+
+
+class DatabasePoolMiddleware(MiddlewareMixin):
+    """Answer 503 with Retry-After when no database connection is free
+
+    Only hooks ``process_exception``, so under ASGI the mixin passes
+    requests straight through to async views instead of running them on
+    the single thread-sensitive sync thread.
+    """
+
+    retry_after = 1
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, PoolExhausted):
+            response = JsonResponse(
+                {'detail': 'The service is busy, please retry.'}, status=503
+            )
+            response['Retry-After'] = str(self.retry_after)
+            return response
+        return None
+
+
+class MetricsMiddleware:
+    """Record per-endpoint metrics and report them in a Server-Timing header.
+
+    Checks the request against ``API_QUERY_BUDGETS`` too. Goes first in
+    ``MIDDLEWARE`` so the other middleware's queries count as well. It is
+    async-capable, so under ASGI it does not push the async views onto
+    the shared sync thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.API_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with metrics.measure() as measured:
+            response = self.get_response(request)
+        return self.finish(request, response, measured, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with metrics.measure() as measured:
+            response = await self.get_response(request)
+        return self.finish(request, response, measured, started)
+
+    def finish(self, request, response, measured, started):
+        finished = time.perf_counter()
+        render_started = getattr(request, '_metrics_render_started', None)
+        if render_started is not None:
+            measured.render = finished - render_started
+
+        match = request.resolver_match
+        endpoint = match.view_name if match else 'unmatched'
+        # Streaming responses (the recipe export) have no .content
+        size = 0 if response.streaming else len(response.content)
+        metrics.registry.record(
+            endpoint, request.method, response.status_code,
+            finished - started, measured, size,
+        )
+        if settings.API_SERVER_TIMING:
+            response['Server-Timing'] = measured.server_timing(
+                finished - started
+            )
+        metrics.check_budget(request.method, endpoint, measured.queries)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called just before DRF responses are rendered
+        request._metrics_render_started = time.perf_counter()
+        return response
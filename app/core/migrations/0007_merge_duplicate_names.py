@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import Count, Min
+from django.db.models.functions import Lower
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Fold tags/ingredients that differ only by case into the oldest row"""
+    Recipe = apps.get_model('core', 'Recipe')
+
+    for model_name, field_name in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(field_name).remote_field.through
+        target = f'{model_name.lower()}_id'
+
+        groups = (
+            model.objects.annotate(lower_name=Lower('name'))
+            .values('lower_name')
+            .annotate(keep=Min('id'), total=Count('id'))
+            .filter(total__gt=1)
+        )
+        for group in groups.iterator():
+            duplicate_ids = list(
+                model.objects.annotate(lower_name=Lower('name'))
+                .filter(lower_name=group['lower_name'])
+                .exclude(id=group['keep'])
+                .values_list('id', flat=True)
+            )
+            recipe_ids = set(
+                through.objects.filter(**{f'{target}__in': duplicate_ids})
+                .values_list('recipe_id', flat=True)
+            )
+            through.objects.filter(**{f'{target}__in': duplicate_ids}).delete()
+            through.objects.bulk_create(
+                [through(recipe_id=recipe_id, **{target: group['keep']})
+                 for recipe_id in recipe_ids],
+                ignore_conflicts=True,
+            )
+            model.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_auto_20241015_1739'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_merge_duplicate_names'),
+    ]
+
+    operations = [
+        # Django 3.2 cannot express unique functional constraints, so the
+        # case-insensitive unique indexes are plain SQL
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_tag_name_lower_uniq ON core_tag (LOWER(name));',
+            'DROP INDEX core_tag_name_lower_uniq;',
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_ingredient_name_lower_uniq '
+            'ON core_ingredient (LOWER(name));',
+            'DROP INDEX core_ingredient_name_lower_uniq;',
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='core_recipe_user_id_desc'),
+        ),
+    ]
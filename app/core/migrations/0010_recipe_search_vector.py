@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:13
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Same document as recipe.search.search_vector()
+BACKFILL_SQL = '''
+UPDATE core_recipe r SET search_vector =
+    setweight(to_tsvector('english', COALESCE(r.title, '')), 'A')
+    || setweight(to_tsvector('english', COALESCE((
+        SELECT string_agg(t.name, ' ') FROM core_recipe_tags rt
+        JOIN core_tag t ON t.id = rt.tag_id WHERE rt.recipe_id = r.id
+    ), '')), 'B')
+    || setweight(to_tsvector('english', COALESCE((
+        SELECT string_agg(i.name, ' ') FROM core_recipe_ingredients ri
+        JOIN core_ingredient i ON i.id = ri.ingredient_id WHERE ri.recipe_id = r.id
+    ), '')), 'B')
+    || setweight(to_tsvector('english', COALESCE(r.description, '')), 'C');
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recipe_search_gin'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:21
+
+import core.models
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+import django.utils.timezone
+
+
+def count_existing_images(apps, schema_editor):
+    """Start the reference counts from the images recipes already use"""
+    Recipe = apps.get_model('core', 'Recipe')
+    ImageBlob = apps.get_model('core', 'ImageBlob')
+
+    counts = (
+        Recipe.objects.exclude(image__isnull=True).exclude(image='')
+        .values('image')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    ImageBlob.objects.bulk_create(
+        (ImageBlob(name=row['image'], ref_count=row['total']) for row in counts.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.AddIndex(
+            model_name='imageblob',
+            index=models.Index(condition=models.Q(('ref_count', 0)), fields=['id'], name='core_imageblob_orphan'),
+        ),
+        migrations.RunPython(count_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:52
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# RecipeSummary.PRICE_BUCKETS when this migration was written
+PRICE_BUCKETS = (5, 10, 20, 50)
+
+
+def summarize_existing_recipes(apps, schema_editor):
+    """Start the summaries from the recipes users already have"""
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeSummary = apps.get_model('core', 'RecipeSummary')
+
+    bounds = (None,) + PRICE_BUCKETS + (None,)
+    buckets = {}
+    for index, (low, high) in enumerate(zip(bounds, bounds[1:])):
+        condition = Q()
+        if low is not None:
+            condition &= Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        buckets[f'bucket_{index}'] = Count('id', filter=condition)
+
+    rows = (
+        Recipe.objects.values('user_id')
+        .annotate(
+            recipe_count=Count('id'),
+            time_minutes_total=Sum('time_minutes'),
+            price_total=Sum('price'),
+            **buckets,
+        )
+        .order_by()
+    )
+    RecipeSummary.objects.bulk_create(
+        (
+            RecipeSummary(
+                user_id=row['user_id'],
+                recipe_count=row['recipe_count'],
+                time_minutes_total=row['time_minutes_total'],
+                price_total=row['price_total'],
+                price_buckets=[row[name] for name in buckets],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_image_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_summary', serialize=False, to='core.user')),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('time_minutes_total', models.BigIntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('price_buckets', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(summarize_existing_recipes, migrations.RunPython.noop),
+    ]
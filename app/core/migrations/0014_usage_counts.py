@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+# Same counts as the repair_usage_counts command
+BACKFILL_SQL = '''
+UPDATE core_tag t SET usage_count = (
+    SELECT count(*) FROM core_recipe_tags rt WHERE rt.tag_id = t.id
+);
+UPDATE core_ingredient i SET usage_count = (
+    SELECT count(*) FROM core_recipe_ingredients ri WHERE ri.ingredient_id = i.id
+);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipe_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['-usage_count', '-id'], name='core_ingredient_usage'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-usage_count', '-id'], name='core_tag_usage'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_usage_counts'),
+    ]
+
+    operations = [
+        # LIKE 'prefix%' on LOWER(name) for the autocomplete endpoints.
+        # text_pattern_ops compares characters rather than by collation, so
+        # the index serves prefix matches whatever the database locale.
+        migrations.RunSQL(
+            'CREATE INDEX core_tag_name_prefix ON core_tag (LOWER(name) text_pattern_ops);',
+            'DROP INDEX core_tag_name_prefix;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX core_ingredient_name_prefix '
+            'ON core_ingredient (LOWER(name) text_pattern_ops);',
+            'DROP INDEX core_ingredient_name_prefix;',
+        ),
+    ]
@@ -1,17 +1,30 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Greatest, Lower
 from django.contrib.auth.models import (AbstractBaseUser,
 BaseUserManager, PermissionsMixin)
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
+
+from core.storage import image_storage
+from decimal import Decimal
+import bisect
 import uuid
 import os
 
 
+RECIPE_IMAGE_DIR = os.path.join('uploads', 'recipe')
+
+
 def recipe_image_file_path(instance, filename):
 
     ext = os.path.splitext(filename)[1]
     filename = f'{uuid.uuid4()}{ext}'
 
-    return os.path.join('uploads', 'recipe', filename)
+    return os.path.join(RECIPE_IMAGE_DIR, filename)
 
 
 class UserManager(BaseUserManager):
@@ -44,21 +57,135 @@ class User(AbstractBaseUser, PermissionsMixin):
     objects = UserManager()
 
 
+class NamedObjectManager(models.Manager):
+    """Manager for models looked up by ``name`` (tags, ingredients)
+
+    Names are unique regardless of case (see migration 0008), so lookups
+    go through ``LOWER(name)`` to use that index.
+    """
+
+    def get_or_create_many(self, names):
+        """Return a ``{name: object}`` dict, creating missing names.
+
+        Uses one lookup for the names that already exist, in any case, and
+        one bulk insert for the rest. The insert ignores conflicts, so a
+        concurrent request creating the same name does not fail. The row it
+        created is read back instead.
+        """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+
+        found = self._by_name(names)
+        missing = [name for name in names if name not in found]
+        if missing:
+            # Names differing only in case conflict with each other too; the
+            # first one is inserted
+            self.bulk_create(
+                [self.model(name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            found.update(self._by_name(missing))
+
+        return {name: found[name] for name in names}
+
+    def filter_name_iexact(self, name):
+        """Case-insensitive match that can use the ``LOWER(name)`` index"""
+        return self.annotate(lower_name=Lower('name')).filter(
+            lower_name=Lower(Value(name))
+        )
+
+    def filter_name_prefix(self, prefix):
+        """Names starting with ``prefix`` in any case, on the prefix index"""
+        return self.annotate(lower_name=Lower('name')).filter(
+            lower_name__startswith=prefix.lower()
+        )
+
+    def add_usage(self, changes):
+        """Add ``{id: change}`` to ``usage_count``.
+
+        Runs one ``UPDATE ... SET usage_count = usage_count + n`` per distinct
+        change, so concurrent writers never overwrite each other's counts.
+        """
+        by_change = {}
+        for pk, change in changes.items():
+            if change:
+                by_change.setdefault(change, []).append(pk)
+        for change, pks in by_change.items():
+            count = F('usage_count') + change
+            if change < 0:
+                # A drifted count stays at zero until repair_usage_counts
+                count = Greatest(count, Value(0))
+            self.filter(id__in=pks).update(usage_count=count)
+
+    def _by_name(self, names):
+        # Matched by the database's LOWER(), which the unique index uses;
+        # str.lower() differs from it for some characters, e.g. final sigma
+        table = connections[self.db].ops.quote_name(self.model._meta.db_table)
+        rows = ', '.join(['(%s)'] * len(names))
+        queryset = self.raw(
+            f'SELECT {table}.*, input.name AS input_name FROM {table} '
+            f'JOIN (VALUES {rows}) AS input (name) '
+            f'ON LOWER({table}.name) = LOWER(input.name)',
+            names,
+        )
+        return {obj.input_name: obj for obj in queryset}
+
+
 class Tag(models.Model):
+    # Unique on LOWER(name); the index is created in migration 0008, and
+    # the prefix index for autocomplete in 0015
     name = models.CharField(max_length=255)
+    # Recipes linked to this tag, kept by recipe.usage
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = NamedObjectManager()
+
+    class Meta:
+        indexes = [
+            # ?ordering=popular on the list
+            models.Index(
+                fields=['-usage_count', '-id'], name='core_tag_usage'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
 class Ingredient(models.Model):
+    # Unique on LOWER(name); the index is created in migration 0008, and
+    # the prefix index for autocomplete in 0015
     name = models.CharField(max_length=255)
+    # Recipes linked to this ingredient, kept by recipe.usage
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = NamedObjectManager()
+
+    class Meta:
+        indexes = [
+            # ?ordering=popular on the list
+            models.Index(
+                fields=['-usage_count', '-id'], name='core_ingredient_usage'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
 class Recipe(models.Model):
+    IMAGE_PENDING = 'pending'
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_PROCESSING, 'Processing'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
@@ -70,10 +197,246 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255,blank=True)
     tags = models.ManyToManyField(Tag,blank=True)
     ingredients = models.ManyToManyField(Ingredient,blank=True)
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(
+        null=True, upload_to=recipe_image_file_path, storage=image_storage
+    )
+    # Set by recipe.images once the uploaded image has been processed
+    image_status = models.CharField(
+        max_length=20, choices=IMAGE_STATUS_CHOICES, blank=True, default=''
+    )
+    image_renditions = models.JSONField(default=dict, blank=True)
+    # Maintained by recipe.search.update_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='core_recipe_search_gin'),
+            # Matches RecipeViewSet: filter on user, newest first
+            models.Index(
+                fields=['user', '-id'], name='core_recipe_user_id_desc'
+            ),
+            # Range filters on the recipe list
+            models.Index(
+                fields=['user', 'time_minutes'], name='core_recipe_user_time'
+            ),
+            models.Index(
+                fields=['user', 'price'], name='core_recipe_user_price'
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class ImageBlobManager(models.Manager):
+    """Reference counts of the files in ``image_storage``
+
+    ``core.signals`` calls ``acquire`` and ``release`` whenever a recipe's
+    image changes or the recipe is deleted.
+    """
+
+    def acquire(self, name):
+        """Count one more recipe using ``name``"""
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        # A single upsert, so concurrent uploads of one file both count
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (name, ref_count, updated) '
+                f'VALUES (%s, 1, %s) '
+                f'ON CONFLICT (name) DO UPDATE '
+                f'SET ref_count = {table}.ref_count + 1, '
+                f'updated = EXCLUDED.updated',
+                [name, timezone.now()],
+            )
+
+    def lock(self, name):
+        """Lock the row of ``name``, if any, until the transaction ends"""
+        list(self.select_for_update().filter(name=name).values_list('id'))
+
+    def release(self, name):
+        """Count one recipe less; the file goes once nothing uses it"""
+        self.filter(name=name, ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1, updated=timezone.now()
+        )
+        transaction.on_commit(lambda: self.delete_orphan(name), using=self.db)
 
+    def delete_orphan(self, name):
+        """Delete the file and its row if the count is zero"""
+        with transaction.atomic(using=self.db):
+            # The row lock makes a concurrent acquire wait for the outcome
+            blob = (
+                self.select_for_update()
+                .filter(name=name, ref_count=0)
+                .first()
+            )
+
+            if blob is None:
+                return False
+            image_storage.delete(name)
+            blob.delete()
+        return True
+
+
+class ImageBlob(models.Model):
+    """A file in ``image_storage`` and how many recipes use it"""
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(default=timezone.now)
+
+    objects = ImageBlobManager()
+
+    class Meta:
+        indexes = [
+            # Orphans waiting for the garbage collector
+            models.Index(
+                fields=['id'],
+                name='core_imageblob_orphan',
+                condition=models.Q(ref_count=0),
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeSummaryManager(models.Manager):
+    """Maintenance of the per-user recipe totals
+
+    ``recipe.stats`` adds the changes of every recipe write with ``add``.
+    ``refresh`` recomputes totals from the recipes when a change cannot be
+    worked out, such as a write of a recipe loaded without its price.
+    """
+
+    def add(
+        self, user_id, recipes, time_minutes, price, price_buckets,
+        create=False,
+    ):
+        """Add the given changes to a user's totals in one statement.
+
+        With ``create`` a missing row is inserted; otherwise nothing happens
+        to a user without one, so a cascading user delete cannot recreate
+        it. Returns whether a row was written.
+        """
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        # unnest() pairs the arrays element by element, in order
+        buckets = (
+            'ARRAY(SELECT a + b FROM unnest({}, {}) '
+            'WITH ORDINALITY AS d(a, b, i) ORDER BY i)'
+        )
+        price_buckets = list(price_buckets)
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            if create:
+                added = buckets.format(
+                    f'{table}.price_buckets', 'EXCLUDED.price_buckets'
+                )
+                cursor.execute(
+                    f'INSERT INTO {table} (user_id, recipe_count, '
+                    f'time_minutes_total, price_total, price_buckets, '
+                    f'updated) VALUES (%s, %s, %s, %s, %s, %s) '
+                    f'ON CONFLICT (user_id) DO UPDATE SET '
+                    f'recipe_count = '
+                    f'{table}.recipe_count + EXCLUDED.recipe_count, '
+                    f'time_minutes_total = '
+                    f'{table}.time_minutes_total + '
+                    f'EXCLUDED.time_minutes_total, '
+                    f'price_total = '
+                    f'{table}.price_total + EXCLUDED.price_total, '
+                    f'price_buckets = {added}, '
+                    f'updated = EXCLUDED.updated',
+                    [user_id, recipes, time_minutes, price, price_buckets,
+                     now],
+                )
+            else:
+                added = buckets.format('price_buckets', '%s::integer[]')
+                cursor.execute(
+                    f'UPDATE {table} SET recipe_count = recipe_count + %s, '
+                    f'time_minutes_total = time_minutes_total + %s, '
+                    f'price_total = price_total + %s, '
+                    f'price_buckets = {added}, '
+                    f'updated = %s WHERE user_id = %s',
+                    [recipes, time_minutes, price, price_buckets, now,
+                     user_id],
+                )
+            return cursor.rowcount > 0
+
+    def refresh(self, user_ids):
+        """Recompute the totals of the given users from their recipes"""
+        user_ids = set(user_ids)
+        totals = {
+            row.pop('user_id'): row
+            for row in Recipe.objects.filter(user_id__in=user_ids)
+            .values('user_id')
+            .annotate(**RecipeSummary.aggregates())
+            .order_by()
+        }
+        for user_id in user_ids:
+            row = totals.get(user_id) or {
+                'recipe_count': 0,
+                'time_minutes_total': None,
+                'price_total': None,
+            }
+            self.update_or_create(user_id=user_id, defaults={
+                'recipe_count': row['recipe_count'],
+                'time_minutes_total': row['time_minutes_total'] or 0,
+                'price_total': row['price_total'] or 0,
+                'price_buckets': [
+                    row.get(f'bucket_{index}', 0)
+                    for index in range(len(RecipeSummary.PRICE_BUCKETS) + 1)
+                ],
+                'updated': timezone.now(),
+            })
+
+
+class RecipeSummary(models.Model):
+    """A user's recipe totals, served by the recipe stats endpoint"""
+    # Upper bounds of the price distribution buckets; the last bucket is
+    # open. Changing them needs a RecipeSummary.objects.refresh() of all users.
+    PRICE_BUCKETS = (Decimal('5'), Decimal('10'), Decimal('20'), Decimal('50'))
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_summary',
+    )
+    recipe_count = models.IntegerField(default=0)
+    time_minutes_total = models.BigIntegerField(default=0)
+    price_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+
+    # Recipes per PRICE_BUCKETS bucket
+    price_buckets = ArrayField(models.IntegerField(), default=list)
+    updated = models.DateTimeField(default=timezone.now)
+
+    objects = RecipeSummaryManager()
+
+    @classmethod
+    def price_bucket(cls, price):
+        """Index of the bucket holding ``price``"""
+        return bisect.bisect_right(cls.PRICE_BUCKETS, price)
+
+    @classmethod
+    def aggregates(cls):
+        """Aggregate expressions computing the totals over recipes"""
+        bounds = (None,) + cls.PRICE_BUCKETS + (None,)
+        buckets = {}
+        for index, (low, high) in enumerate(zip(bounds, bounds[1:])):
+            condition = Q()
+            if low is not None:
+                condition &= Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            buckets[f'bucket_{index}'] = Count('id', filter=condition)
+        return {
+            'recipe_count': Count('id'),
+            'time_minutes_total': Sum('time_minutes'),
+            'price_total': Sum('price'),
+            **buckets,
+        }
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_count} recipes'
@@ -0,0 +1,259 @@
+"""
+Pagination classes shared by the API views
+"""
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination over the primary key, newest first.
+
+    Every page is a ``WHERE id < cursor ORDER BY id DESC LIMIT n`` query, so
+    deep pages cost the same as the first one. The default page size comes
+    from ``REST_FRAMEWORK['PAGE_SIZE']``; clients may ask for a different
+    size up to ``max_page_size``.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class OrderedCursorPagination(BasePagination):
+    """Keyset pagination with orderings picked by ``?ordering=``.
+
+    DRF's ``CursorPagination`` keys its cursor on the first ordering field
+    only and steps over ties with an offset, which cannot page through a
+    column like ``usage_count`` where many rows share a value. The cursor
+    here holds every ordering field of the row it points at, and a page is
+    a row-value comparison spelled out field by field, e.g.
+    ``WHERE usage_count < c OR (usage_count = c AND id < i)``, so deep
+    pages cost the same as the first one.
+
+    The view maps names to orderings in ``cursor_orderings``; each must end
+    with ``-id`` and be backed by an index. Without the parameter the newest
+    rows come first.
+    """
+    ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(request, view)
+        size = self.get_page_size(request)
+        position, self.reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(_flip(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(_after(ordering, position))
+        rows = list(queryset[:size + 1])
+        more = len(rows) > size
+        rows = rows[:size]
+        if self.reverse:
+            rows.reverse()
+
+        # Coming back from a later page there is always a next one
+        self.has_next = self.reverse or more
+        self.has_previous = more if self.reverse else position is not None
+        self.rows = rows
+        return rows
+
+    def get_ordering(self, request, view):
+        name = request.query_params.get(self.ordering_query_param)
+        if name is None:
+            return self.ordering
+        orderings = getattr(view, 'cursor_orderings', {})
+        if name not in orderings:
+            choices = ', '.join(orderings)
+            raise ValidationError({
+                self.ordering_query_param: f'Choose one of: {choices}.'
+            })
+
+        return tuple(orderings[name])
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def decode_cursor(self, request, model):
+        """The ``(position, reverse)`` the cursor parameter points at"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')))
+            values = cursor['p']
+            if len(values) != len(self.ordering):
+                raise ValueError(values)
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            if None in position:
+                raise ValueError(values)
+            return position, bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        cursor = {'p': [_value(row, field) for field in self.ordering]}
+        if reverse:
+            cursor['r'] = 1
+        encoded = b64encode(json.dumps(cursor, cls=DjangoJSONEncoder).encode())
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            encoded.decode('ascii'),
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.rows:
+            # Every row before the cursor is gone; start over
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.rows[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return _links_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def _value(row, field):
+    # Rows are model instances, or dicts on the .values() fast path
+    name = field.lstrip('-')
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _after(ordering, position):
+    """Rows that come after ``position`` in ``ordering``"""
+    condition = Q()
+    for index, field in enumerate(ordering):
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        term = Q(**{f"{field.lstrip('-')}__{lookup}": position[index]})
+        for prior, value in zip(ordering[:index], position):
+            term &= Q(**{prior.lstrip('-'): value})
+        condition |= term
+    return condition
+
+
+def _links_schema(schema):
+    return {
+        'type': 'object',
+        'properties': {
+            'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'results': schema,
+        },
+    }
+
+
+class RankedPagination(BasePagination):
+    """Page-number pagination for results ordered by a computed rank.
+
+    Cursor pagination needs a stored column to key on, which a relevance
+    rank is not. Each page fetches one extra row to tell whether there is a
+    next page, so no ``COUNT(*)`` runs over the matches.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_query_param = 'page'
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page = self._positive_int(self.page_query_param, 1)
+        size = min(
+            self._positive_int(self.page_size_query_param, self.page_size),
+            self.max_page_size,
+        )
+        offset = (self.page - 1) * size
+        rows = list(queryset[offset:offset + size + 1])
+        self.has_next = len(rows) > size
+        return rows[:size]
+
+    def get_paginated_response(self, data):
+        next_link = self._page_link(self.page + 1) if self.has_next else None
+        previous_link = (
+            self._page_link(self.page - 1) if self.page > 1 else None
+        )
+        return Response(OrderedDict([
+            ('next', next_link),
+            ('previous', previous_link),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return _links_schema(schema)
+
+    def _positive_int(self, name, default):
+        try:
+            value = int(self.request.query_params[name])
+        except (KeyError, ValueError):
+            return default
+        return value if value > 0 else default
+
+    def _page_link(self, page):
+        url = self.request.build_absolute_uri()
+        if page == 1:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, page)
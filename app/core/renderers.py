@@ -0,0 +1,43 @@
+"""
+Renderers shared by the API views
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` that encodes with orjson when it is installed.
+
+    The output is the same bytes as ``JSONRenderer``'s compact, unicode
+    output. Indented responses, the ASCII-only setting, and installs
+    without orjson all go through ``JSONRenderer`` itself.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(
+                accepted_media_type, renderer_context or {}
+            ) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            # Types orjson does not know, and datetimes, go through DRF's
+            # encoder
+            default=self.encoder_class().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+        # JSONRenderer escapes these so the output is valid JavaScript
+        return (
+            ret.replace(b'\xe2\x80\xa8', b'\\u2028')
+            .replace(b'\xe2\x80\xa9', b'\\u2029')
+        )
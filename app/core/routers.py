@@ -0,0 +1,139 @@
+"""
+Primary/replica database routing
+
+Reads go to the primary unless the current request has opted in to
+replicas. ``ReplicaReadMixin`` does that for safe requests once the user
+is authenticated, so token lookups always see fresh data. A write run by
+a safe request switches the rest of it back to the primary. A user who
+wrote recently is kept on the primary for ``REPLICA_PIN_CACHE['TIMEOUT']``
+seconds so they read their own writes despite replication lag. The pin is
+set before an unsafe request runs, so it is in place by the time its
+writes commit, and renewed when the response is ready. The router itself
+only reads this state.
+"""
+import random
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+_use_replicas = ContextVar('use_replicas', default=False)
+
+_WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def read_from_replicas():
+    _use_replicas.set(True)
+
+
+def read_from_primary():
+    _use_replicas.set(False)
+
+
+def reading_from_replicas():
+    return _use_replicas.get()
+
+
+@contextmanager
+def routing_scope():
+    """Reset the read target when the block exits"""
+    token = _use_replicas.set(False)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+def _pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE['ALIAS']]
+
+
+def _pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin_to_primary(user_id):
+    _pin_cache().set(
+        _pin_key(user_id), True, settings.REPLICA_PIN_CACHE['TIMEOUT']
+    )
+
+
+def is_pinned_to_primary(user_id):
+    return _pin_cache().get(_pin_key(user_id), False)
+
+
+class PrimaryReplicaRouter:
+    """Send opted-in reads to a random replica, everything else to default"""
+
+    def db_for_read(self, model, **hints):
+        if (
+            settings.DATABASE_REPLICAS
+            and _use_replicas.get()
+            # Reads inside a transaction must see its writes
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """Serve the view's safe requests from the read replicas"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as stack:
+            stack.enter_context(routing_scope())
+            if settings.DATABASE_REPLICAS:
+                stack.enter_context(
+                    connections[DEFAULT_DB_ALIAS].execute_wrapper(
+                        self._primary_after_write
+                    )
+                )
+            return super().dispatch(request, *args, **kwargs)
+
+    def _primary_after_write(self, execute, sql, params, many, context):
+        if _use_replicas.get() and sql.lstrip()[:6].upper() in _WRITES:
+            # Read what is being written for the rest of the request, and
+            # in the user's next requests
+            read_from_primary()
+            if self.request.user.is_authenticated:
+                pin_to_primary(self.request.user.pk)
+        return execute(sql, params, many, context)
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication has run by now, against the primary
+        super().initial(request, *args, **kwargs)
+        if not settings.DATABASE_REPLICAS:
+            return
+        if request.method in SAFE_METHODS:
+            if not is_pinned_to_primary(request.user.pk):
+                read_from_replicas()
+        elif request.user.is_authenticated:
+            # Reads starting once the writes commit must not hit a replica
+            # that has not caught up
+            pin_to_primary(request.user.pk)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Count the lag from the commit, not from the start of the request
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
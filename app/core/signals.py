@@ -0,0 +1,86 @@
+"""
+Signal handlers keeping caches and derived data in step with the models
+"""
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core import metrics
+from core.authentication import invalidate_tokens
+from core.models import ImageBlob, Recipe
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    metrics.install(connection)
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    # The cached token carries the user's values, so any change to the user
+    # (is_active above all) has to evict it
+    if created:
+        return
+    keys = list(
+        Token.objects.filter(user_id=instance.pk)
+        .values_list('key', flat=True)
+    )
+
+    if keys:
+        invalidate_tokens(*keys)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    # Deferred images are left alone; saving such an instance keeps them
+    if 'image' in instance.__dict__:
+        instance._stored_image = instance.__dict__['image']
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, created, update_fields, **kwargs):
+    if not hasattr(instance, '_stored_image'):
+        return
+    if update_fields is not None and 'image' not in update_fields:
+        return
+
+    old = None if created else _image_name(instance._stored_image)
+    new = _image_name(instance.image)
+    if new != old:
+        if new:
+            ImageBlob.objects.acquire(new)
+        if old:
+            ImageBlob.objects.release(old)
+    instance._stored_image = new
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image(sender, instance, **kwargs):
+    name = _image_name(instance.__dict__.get('image'))
+    if name:
+        ImageBlob.objects.release(name)
+    # Renditions belong to a single recipe
+    renditions = instance.__dict__.get('image_renditions') or {}
+    renditions = list(renditions.values())
+
+    if renditions:
+        transaction.on_commit(lambda: _delete_files(renditions))
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def _image_name(value):
+    # The raw attribute is a name string or a FieldFile
+    return getattr(value, 'name', value) or None
@@ -0,0 +1,112 @@
+"""
+Sparse fieldsets for read endpoints
+
+``?fields=`` names the fields to return and ``?expand=`` the nested
+relations to include on top. Without either parameter every field is
+returned. Once either is given, a relation is only returned when it is
+named in one of them, so ``?fields=id,title`` returns, and fetches,
+neither tags nor ingredients.
+"""
+from django.utils.translation import gettext as translate
+from rest_framework import serializers
+
+
+def _names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsSerializerMixin:
+    """Serializer taking ``fields``, the names of the fields to keep"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsViewMixin:
+    """Apply ``?fields=``/``?expand=`` to the serializer and the queryset.
+
+    The serializer class must use ``SparseFieldsSerializerMixin``. Call
+    ``sparse_queryset`` from ``get_queryset`` to load only the columns and
+    relations the response needs.
+    """
+    sparse_fields_actions = ('list', 'retrieve')
+
+    def get_sparse_fields(self):
+        """Serializer field names to return, or ``None`` for all of them"""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        params = self.request.query_params
+        if self.action not in self.sparse_fields_actions or (
+            'fields' not in params and 'expand' not in params
+        ):
+            return None
+
+        available = self._serializer_fields()
+        relations = {
+            name for name, field in available.items()
+            if isinstance(field, serializers.BaseSerializer)
+        }
+        requested = _names(params.get('fields', ''))
+        expand = _names(params.get('expand', ''))
+
+        errors = {}
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            errors['fields'] = [
+                translate('Unknown fields: %s.') % ', '.join(unknown)
+            ]
+        unknown = [name for name in expand if name not in relations]
+        if unknown:
+            errors['expand'] = [
+                translate('Cannot expand: %s.') % ', '.join(unknown)
+            ]
+
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        if 'fields' in params:
+            selected = set(requested)
+        else:
+            selected = set(available) - relations
+        selected.update(expand)
+        # Keep the serializer's field order
+        return [name for name in available if name in selected]
+
+    def _serializer_fields(self):
+        if not hasattr(self, '_sparse_available'):
+            self._sparse_available = self.get_serializer_class()().fields
+        return self._sparse_available
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def sparse_queryset(self, queryset, prefetch=()):
+        """Defer the columns and drop the prefetches the response leaves out.
+
+        Returns the narrowed queryset and the prefetches to keep.
+        """
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset, list(prefetch)
+
+        opts = queryset.model._meta
+        columns = {field.name for field in opts.concrete_fields}
+        serializer_fields = self._serializer_fields()
+        sources = [
+            serializer_fields[name].source for name in fields
+            if serializer_fields[name].source in columns
+        ]
+        queryset = queryset.only(opts.pk.name, *sources)
+        return queryset, [
+            lookup for lookup in prefetch
+            if getattr(lookup, 'prefetch_to', lookup) in fields
+        ]
@@ -0,0 +1,65 @@
+"""
+Content-addressed storage for recipe images
+
+Files are named after the SHA-256 of their content, so identical uploads
+end up as one file. How many recipes use each file is counted in
+``ImageBlob``; a file is deleted once its count drops to zero.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Store each distinct file once under ``<directory>/<sha256><ext>``.
+
+    Uploads may carry a precomputed ``sha256`` attribute, which saves
+    reading the file again. Files with a ``temporary_file_path`` are moved
+    into place rather than copied.
+
+    Saving locks the file's ``ImageBlob`` row. Save inside the transaction
+    that counts the new reference, so ``ImageBlob.objects.delete_orphan``
+    cannot delete a file that was just found to be stored already.
+    """
+
+    def hashed_name(self, name, content):
+        digest = getattr(content, 'sha256', None) or content_hash(content)
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, f'{digest}{extension}')
+
+    def _save(self, name, content):
+        # Imported here since core.models imports this module
+        from core.models import ImageBlob
+
+        name = self.hashed_name(name, content)
+        with transaction.atomic(using=ImageBlob.objects.db):
+            # An orphaned file may be being deleted; wait for that before
+            # deciding whether the content is stored
+            ImageBlob.objects.lock(name)
+            if self.exists(name):
+                # Same content is already stored; drop the incoming copy
+                if hasattr(content, 'temporary_file_path'):
+                    content.close()
+                    try:
+                        os.remove(content.temporary_file_path())
+                    except FileNotFoundError:
+                        pass
+                return name
+            return super()._save(name, content)
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,24 @@
+"""
+Test runner for the project
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Fail any request that runs more queries than its budget allows.
+
+    Passwords are hashed inline; tests of the worker pool turn it on with
+    ``override_settings(PASSWORD_HASH_WORKERS=...)``.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._settings = override_settings(
+            API_QUERY_BUDGETS_ENFORCED=True, PASSWORD_HASH_WORKERS=0
+        )
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        super().teardown_test_environment(**kwargs)
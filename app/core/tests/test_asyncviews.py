@@ -0,0 +1,142 @@
+"""
+Tests for the async read endpoints and the load generator
+"""
+import asyncio
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import asyncviews
+from core.loadtest import LoadResult, _read_response
+from core.models import Ingredient, Recipe, Tag
+
+
+@override_settings(ASYNC_API_WORKERS=0)
+class AsyncReadTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123'
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup',
+            time_minutes=10, price=Decimal('2.50'),
+        )
+        self.recipe.tags.add(Tag.objects.create(name='Dinner'))
+        self.recipe.ingredients.add(Ingredient.objects.create(name='Leek'))
+
+    def test_recipe_list_matches_sync(self):
+        res = self.client.get(reverse('async:recipe-list'))
+        sync = self.client.get(reverse('recipe:recipe-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), sync.json())
+
+    def test_recipe_detail(self):
+        res = self.client.get(
+            reverse('async:recipe-detail', args=[self.recipe.id])
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['title'], 'Soup')
+
+    def test_other_users_recipe_not_found(self):
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'pass123'
+        )
+        recipe = Recipe.objects.create(
+            user=other, title='Other', time_minutes=1, price=Decimal('1'),
+        )
+
+        res = self.client.get(reverse('async:recipe-detail', args=[recipe.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tag_and_ingredient_lists(self):
+        tags = self.client.get(reverse('async:tag-list'))
+        ingredients = self.client.get(reverse('async:ingredient-list'))
+
+        self.assertEqual(
+            [tag['name'] for tag in tags.json()['results']], ['Dinner']
+        )
+        self.assertEqual(
+            [item['name'] for item in ingredients.json()['results']], ['Leek']
+        )
+
+    def test_auth_required(self):
+        res = APIClient().get(reverse('async:recipe-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_writes_not_allowed(self):
+        res = self.client.post(reverse('async:recipe-list'), {'title': 'New'})
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    @override_settings(ASYNC_API_WORKERS=4)
+    def test_runs_on_pool(self):
+        with patch(
+            'core.asyncviews.get_executor', return_value=None
+        ) as get_executor:
+            result = asyncio.run(asyncviews.run_sync(lambda: 42))
+
+        get_executor.assert_called_once_with()
+        self.assertEqual(result, 42)
+
+    @override_settings(ASYNC_API_WORKERS=32)
+    def test_workers_capped_at_pool_size(self):
+        with patch('core.asyncviews.pool_size', return_value=10):
+            self.assertEqual(asyncviews.max_workers(), 10)
+        with patch('core.asyncviews.pool_size', return_value=None):
+            self.assertEqual(asyncviews.max_workers(), 32)
+
+
+class LoadGeneratorTests(SimpleTestCase):
+
+    def read(self, raw):
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(raw)
+            reader.feed_eof()
+            return await _read_response(reader), await reader.read()
+        return asyncio.run(read())
+
+    def test_reads_content_length_body(self):
+        response, rest = self.read(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}NEXT'
+        )
+
+        self.assertEqual(response, (200, True))
+        self.assertEqual(rest, b'NEXT')
+
+    def test_reads_chunked_body(self):
+        response, rest = self.read(
+            b'HTTP/1.1 404 Not Found\r\nTransfer-Encoding: chunked\r\n'
+            b'Connection: close\r\n\r\n3\r\nabc\r\n0\r\n\r\nNEXT'
+        )
+
+        self.assertEqual(response, (404, False))
+        self.assertEqual(rest, b'NEXT')
+
+    def test_summary(self):
+        result = LoadResult(
+            [i / 1000 for i in range(1, 101)], errors=1, elapsed=2
+        )
+
+        summary = result.summary()
+
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['rps'], 50)
+        self.assertEqual(summary['p50_ms'], 50.5)
+        self.assertEqual(summary['p99_ms'], 99.01)
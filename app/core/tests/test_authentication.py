@@ -0,0 +1,96 @@
+"""
+Tests for the cached token authentication
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import (
+    CachedTokenAuthentication, clear_token_cache, get_local_cache,
+)
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        clear_token_cache()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_is_cached(self):
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_shared_cache_used_when_local_cache_empty(self):
+        self.client.get(ME_URL)
+        clear_token_cache()
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deleted_token_rejected(self):
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_token_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_each_request_gets_its_own_user(self):
+        authentication = CachedTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(self.token.key)
+        first.name = 'Changed'
+
+        second, token = authentication.authenticate_credentials(self.token.key)
+
+        self.assertIsNot(second, first)
+        self.assertEqual(second.name, self.user.name)
+        self.assertIs(token.user, second)
+
+    def test_password_hash_not_cached(self):
+        self.client.get(ME_URL)
+
+        cached = get_local_cache().get(self.token.key)
+
+        self.assertNotIn(self.user.password, repr(cached))
+        user, _ = CachedTokenAuthentication().authenticate_credentials(
+            self.token.key
+        )
+
+        self.assertTrue(user.check_password('testpass123'))
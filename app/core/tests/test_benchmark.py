@@ -0,0 +1,157 @@
+"""
+Tests for the API benchmark helpers
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from core import benchmark
+from core.models import Ingredient, Recipe, RecipeSummary, Tag
+
+
+class SeedTests(TestCase):
+
+    def test_counts(self):
+        dataset = benchmark.seed(
+            users=2, recipes=3, tags=4, ingredients=5, links=2
+        )
+
+        self.assertEqual(len(dataset.users), 2)
+        self.assertEqual(Recipe.objects.count(), 6)
+        self.assertEqual(Tag.objects.count(), 4)
+        self.assertEqual(Ingredient.objects.count(), 5)
+        self.assertEqual(Recipe.tags.through.objects.count(), 12)
+        self.assertEqual(Recipe.ingredients.through.objects.count(), 12)
+        counts = RecipeSummary.objects.values_list('recipe_count', flat=True)
+        self.assertEqual(sorted(counts), [3, 3])
+        for email, key, recipe_ids in dataset.users:
+            user = get_user_model().objects.get(email=email)
+            self.assertEqual(user.auth_token.key, key)
+            self.assertTrue(user.check_password(benchmark.PASSWORD))
+            self.assertEqual(
+                sorted(recipe_ids),
+                sorted(user.recipe_set.values_list('id', flat=True)),
+            )
+
+    def test_reseeding_is_reproducible(self):
+        def snapshot():
+            return [
+                (recipe.title, recipe.description, recipe.time_minutes,
+                 recipe.price,
+                 sorted(recipe.tags.values_list('name', flat=True)))
+                for recipe in Recipe.objects.order_by('title')
+            ]
+
+        benchmark.seed(users=2, recipes=3, seed=7)
+        first = snapshot()
+        benchmark.seed(users=2, recipes=3, seed=7)
+
+        self.assertEqual(snapshot(), first)
+        self.assertEqual(get_user_model().objects.count(), 2)
+
+    def test_clear_keeps_other_objects(self):
+        Tag.objects.create(name='Vegan')
+        benchmark.seed(users=1, recipes=1, tags=1, ingredients=1)
+
+        benchmark.clear()
+
+        self.assertEqual(
+            list(Tag.objects.values_list('name', flat=True)), ['Vegan']
+        )
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class RunTests(TestCase):
+
+    def setUp(self):
+        self.dataset = benchmark.seed(
+            users=2, recipes=2, tags=3, ingredients=3, links=1
+        )
+
+    def test_build_requests(self):
+        self.assertEqual(
+            len(benchmark.build_requests('recipe-detail', self.dataset)), 4
+        )
+        self.assertEqual(
+            len(benchmark.build_requests('upload', self.dataset)), 2
+        )
+        token = benchmark.build_requests('token', self.dataset)[0]
+        self.assertEqual(token.method, 'POST')
+        self.assertIn(b'password=bench-password-123', token.body)
+
+        with self.assertRaises(ValueError):
+            benchmark.build_requests('nothing', self.dataset)
+
+    def test_run_in_process(self):
+        for scenario in benchmark.SCENARIOS:
+            requests = benchmark.build_requests(scenario, self.dataset)
+
+            result = benchmark.run_in_process(
+                requests, concurrency=1, duration=0.2, host='testserver'
+            )
+
+            self.assertEqual(result.errors, 0, scenario)
+            self.assertGreater(result.requests, 0, scenario)
+            self.assertIsNotNone(result.queries_per_request, scenario)
+
+
+class CompareTests(SimpleTestCase):
+    baseline = {
+        'tag-list': {'rps': 100, 'p95_ms': 10, 'queries_per_request': 1},
+        'token': {'rps': 20, 'p95_ms': 300, 'queries_per_request': 2},
+    }
+
+    def test_within_tolerance(self):
+        results = {
+            'tag-list': {
+                'rps': 95, 'p95_ms': 10.5, 'queries_per_request': 1.04,
+            },
+            'upload': {'rps': 1, 'p95_ms': 1000, 'queries_per_request': 9},
+        }
+
+        rows, regressions = benchmark.compare(results, self.baseline, 0.1)
+
+        self.assertEqual(regressions, [])
+        self.assertEqual(len(rows), 3)
+
+    def test_regressions(self):
+        results = {
+            'tag-list': {'rps': 80, 'p95_ms': 9, 'queries_per_request': 1},
+            'token': {'rps': 20, 'p95_ms': 400, 'queries_per_request': 3},
+        }
+
+        rows, regressions = benchmark.compare(results, self.baseline, 0.1)
+
+        self.assertEqual(regressions, [
+            'tag-list rps: 100 -> 80',
+            'token p95_ms: 300 -> 400',
+            'token queries_per_request: 2 -> 3',
+        ])
+
+    def test_queries_only(self):
+        results = {
+            'tag-list': {'rps': 80, 'p95_ms': 9, 'queries_per_request': 1},
+            'token': {'rps': 20, 'p95_ms': 400, 'queries_per_request': 3},
+        }
+
+        rows, regressions = benchmark.compare(
+            results, self.baseline, 0.1, timings=False
+        )
+
+        self.assertEqual(regressions, ['token queries_per_request: 2 -> 3'])
+        self.assertEqual({row[1] for row in rows}, {'queries_per_request'})
+
+
+class DatabaseTests(TestCase):
+
+    def test_refuses_other_databases(self):
+        self.assertTrue(benchmark.is_dedicated_database())
+
+        with patch.dict(connection.settings_dict, NAME='app'):
+            self.assertFalse(benchmark.is_dedicated_database())
+            with self.assertRaises(RuntimeError):
+                benchmark.seed(users=1, recipes=1)
+            with self.assertRaises(RuntimeError):
+                benchmark.clear()
@@ -0,0 +1,26 @@
+"""
+Tests for the in-process caches
+"""
+from django.test import SimpleTestCase
+
+from core.cache import LocalCache
+
+
+class LocalCacheTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        local_cache = LocalCache(max_size=2, timeout=60)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        local_cache.get('a')
+        local_cache.set('c', 3)
+
+        self.assertEqual(local_cache.get('a'), 1)
+        self.assertIsNone(local_cache.get('b'))
+        self.assertEqual(local_cache.get('c'), 3)
+
+    def test_entries_expire(self):
+        local_cache = LocalCache(max_size=2, timeout=-1)
+        local_cache.set('a', 1)
+
+        self.assertIsNone(local_cache.get('a'))
@@ -2,13 +2,30 @@
 Test custom Django management commands
 """
 
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from core.models import ImageBlob, Recipe, RecipeSummary, Tag, Ingredient
+from core.storage import image_storage
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -29,3 +46,313 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count,6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class ImportRecipesTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123'
+        )
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        call_command(
+            'import_recipes', path, user=self.user.email, stdout=StringIO(),
+            **options
+        )
+
+    def test_import_ndjson(self):
+        records = [
+            {'title': f'Recipe {i}', 'time_minutes': 10, 'price': '5.25',
+             'tags': ['Dinner', f'Tag {i}'], 'ingredients': ['Salt']}
+            for i in range(5)
+        ]
+        path = self.write(
+            'recipes.ndjson', '\n'.join(json.dumps(r) for r in records)
+        )
+
+        self.run_import(path, batch_size=2)
+
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(Tag.objects.filter(name='Dinner').count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.price, Decimal('5.25'))
+        summary = RecipeSummary.objects.get(user=self.user)
+        self.assertEqual(summary.recipe_count, 5)
+        self.assertEqual(summary.price_total, Decimal('26.25'))
+
+    def test_import_csv(self):
+        path = self.write(
+            'recipes.csv',
+            'title,time_minutes,price,tags,ingredients\n'
+            'Soup,20,3.50,Dinner|Quick,Salt|Water\n'
+        )
+
+        self.run_import(path)
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'Soup')
+        self.assertEqual(
+            sorted(tag.name for tag in recipe.tags.all()), ['Dinner', 'Quick']
+        )
+        self.assertEqual(recipe.ingredients.count(), 2)
+
+    def test_import_names_differing_in_case(self):
+        path = self.write(
+            'recipes.ndjson',
+            json.dumps({'title': 'Soup', 'time_minutes': 5, 'price': '1',
+                        'ingredients': ['Salt', 'salt']})
+        )
+
+        self.run_import(path)
+
+        ingredient = Ingredient.objects.get()
+        self.assertEqual(ingredient.usage_count, 1)
+        self.assertEqual(ingredient.recipe_set.count(), 1)
+
+    def write_recipes(self, count):
+        lines = [
+            json.dumps({'title': f'Recipe {i}', 'time_minutes': 1, 'price': 1})
+            for i in range(count)
+        ]
+        return self.write('recipes.ndjson', '\n'.join(lines))
+
+    def checkpoint_state(self, path, **state):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return json.dumps(dict(file=digest, user=self.user.pk, **state))
+
+    def test_import_resumes_from_checkpoint(self):
+        path = self.write_recipes(4)
+        checkpoint = self.write(
+            'progress', self.checkpoint_state(path, done=3)
+        )
+
+        self.run_import(path, checkpoint=checkpoint)
+
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)), ['Recipe 3']
+        )
+        with open(checkpoint) as f:
+            self.assertEqual(f.read(), self.checkpoint_state(path, done=4))
+
+    def test_import_checkpoint_of_other_file_rejected(self):
+        path = self.write_recipes(4)
+        checkpoint = self.write('progress', json.dumps(
+            {'file': 'other', 'user': self.user.pk, 'done': 3}
+        ))
+
+        with self.assertRaises(CommandError):
+            self.run_import(path, checkpoint=checkpoint)
+
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_import_resumes_after_crash_before_checkpoint(self):
+        # The first batch committed, but the checkpoint only got as far as
+        # recording it as pending
+        path = self.write_recipes(4)
+        committed = Recipe.objects.create(
+            user=self.user, title='Recipe 1', time_minutes=1, price=1,
+        )
+        checkpoint = self.write('progress', self.checkpoint_state(
+            path, done=0, pending={'done': 2, 'last_id': committed.id},
+        ))
+
+        self.run_import(path, checkpoint=checkpoint, batch_size=2)
+
+        titles = Recipe.objects.order_by('id').values_list('title', flat=True)
+        self.assertEqual(
+            list(titles), ['Recipe 1', 'Recipe 2', 'Recipe 3']
+        )
+
+    def test_import_pending_batch_not_committed(self):
+        path = self.write_recipes(2)
+        checkpoint = self.write('progress', self.checkpoint_state(
+            path, done=0, pending={'done': 2, 'last_id': 0},
+        ))
+
+        self.run_import(path, checkpoint=checkpoint)
+
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_import_value_too_long(self):
+        path = self.write('recipes.ndjson', '\n'.join([
+            json.dumps({'title': 'Soup', 'time_minutes': 1, 'price': 1}),
+            json.dumps({'title': 'Stew', 'time_minutes': 1, 'price': 1,
+                        'tags': ['x' * 256]}),
+        ]))
+
+        with self.assertRaisesMessage(CommandError, 'Record 2 is invalid'):
+            self.run_import(path)
+
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_import_invalid_record(self):
+        path = self.write('recipes.ndjson', json.dumps({'title': 'No price'}))
+
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+
+        self.assertFalse(Recipe.objects.exists())
+
+
+class GcRecipeImagesTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'gc@example.com', 'pass123'
+        )
+
+    def make_file(self, storage, name, old=True):
+        name = storage.save(name, ContentFile(os.urandom(16)))
+        self.addCleanup(storage.delete, name)
+        if old:
+            past = time.time() - 7200
+            os.utime(storage.path(name), (past, past))
+        return name
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_recipe_images', *args, stdout=out)
+        return out.getvalue()
+
+    def test_untracked_files_deleted(self):
+        untracked = self.make_file(image_storage, 'uploads/recipe/x.jpg')
+        recent = self.make_file(
+            image_storage, 'uploads/recipe/x.jpg', old=False
+        )
+        used = self.make_file(image_storage, 'uploads/recipe/x.jpg')
+        Recipe.objects.create(
+            user=self.user, title='Used', time_minutes=1, price=Decimal('1'),
+            image=used,
+        )
+
+        self.gc('--batch-size', '1')
+
+        self.assertFalse(image_storage.exists(untracked))
+        self.assertTrue(image_storage.exists(recent))
+        self.assertTrue(image_storage.exists(used))
+
+    def test_unreferenced_blobs_deleted(self):
+        name = self.make_file(image_storage, 'uploads/recipe/x.jpg')
+        ImageBlob.objects.create(
+            name=name, ref_count=0,
+            updated=timezone.now() - timedelta(hours=2),
+        )
+
+        out = self.gc()
+
+        self.assertFalse(image_storage.exists(name))
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertIn('Deleted 1 files', out)
+
+    def test_stale_renditions_deleted(self):
+        listed = self.make_file(
+            default_storage, 'uploads/recipe/renditions/a.jpg'
+        )
+        stale = self.make_file(
+            default_storage, 'uploads/recipe/renditions/b.jpg'
+        )
+
+        Recipe.objects.create(
+            user=self.user, title='Listed', time_minutes=1, price=Decimal('1'),
+            image_renditions={'thumbnail': listed},
+        )
+
+        self.gc()
+
+        self.assertTrue(default_storage.exists(listed))
+        self.assertFalse(default_storage.exists(stale))
+
+    def test_dry_run_keeps_files(self):
+        name = self.make_file(image_storage, 'uploads/recipe/x.jpg')
+
+        out = self.gc('--dry-run')
+
+        self.assertTrue(image_storage.exists(name))
+        self.assertIn(name, out)
+        self.assertIn('Would delete', out)
+
+
+class BenchmarkApiTests(TestCase):
+
+    def call(self, *args):
+        out = StringIO()
+        call_command(
+            'benchmark_api', '--users', '2', '--recipes', '2',
+            '--scenario', 'tag-list', '--scenario', 'recipe-detail',
+            '--concurrency', '1', '--duration', '0.2',
+            '--warmup', '0', '--host', 'testserver', *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_output_and_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+
+            out = self.call('--output', path)
+
+            with open(path) as results_file:
+                report = json.load(results_file)
+            self.assertEqual(report['config']['mode'], 'in-process')
+            self.assertEqual(
+                set(report['scenarios']), {'tag-list', 'recipe-detail'}
+            )
+
+            self.assertEqual(report['scenarios']['tag-list']['errors'], 0)
+            self.assertIn('tag-list', out)
+            self.assertFalse(Recipe.objects.exists())
+
+            out = self.call('--baseline', path, '--tolerance', '100')
+            self.assertIn('No regressions', out)
+
+            report['scenarios']['tag-list']['rps'] *= 1000
+            with open(path, 'w') as results_file:
+                json.dump(report, results_file)
+            with self.assertRaisesMessage(CommandError, 'tag-list rps'):
+                self.call('--baseline', path)
+
+            report['config']['machine'] = 'elsewhere'
+            with open(path, 'w') as results_file:
+                json.dump(report, results_file)
+            out = self.call('--baseline', path)
+            self.assertIn('queries per request only', out)
+
+    def test_http_refuses_shared_database(self):
+        with patch.dict(connection.settings_dict, NAME='app'):
+            with self.assertRaisesMessage(CommandError, 'bench_*'):
+                self.call('--url', 'http://localhost:8000')
+
+
+class RepairUsageCountsTests(TestCase):
+
+    def test_repair(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('1')
+        )
+
+        recipe.tags.add(Tag.objects.create(name='Dinner'))
+        recipe.ingredients.add(Ingredient.objects.create(name='Salt'))
+        Tag.objects.update(usage_count=0)
+        out = StringIO()
+
+        call_command('repair_usage_counts', '--batch-size', '1', stdout=out)
+
+        self.assertIn('tags: 1 counts fixed', out.getvalue())
+        self.assertIn('ingredients: 0 counts fixed', out.getvalue())
+        self.assertEqual(Tag.objects.get().usage_count, 1)
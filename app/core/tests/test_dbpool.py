@@ -0,0 +1,154 @@
+"""
+Tests for the database connection pool
+"""
+import asyncio
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+)
+from django.urls import reverse
+from psycopg2 import extensions
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.dbpool.base import pool_size
+from core.dbpool.pool import ConnectionPool, PoolExhausted
+
+from core.middleware import DatabasePoolMiddleware
+
+
+def fake_connection():
+    conn = MagicMock(closed=0, autocommit=True)
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def make_pool(self, **kwargs):
+        kwargs.setdefault('timeout', 0.01)
+        return ConnectionPool(fake_connection, **kwargs)
+
+    def test_reuses_returned_connection(self):
+        pool = self.make_pool()
+        first = pool.getconn()
+        pool.putconn(first)
+
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats()['opened'], 1)
+        self.assertEqual(pool.stats()['reused'], 1)
+
+    def test_exhausted_after_timeout(self):
+        pool = self.make_pool(max_size=2)
+        pool.getconn()
+        pool.getconn()
+
+        with self.assertRaises(PoolExhausted):
+            pool.getconn()
+
+        stats = pool.stats()
+        self.assertEqual(stats['in_use'], 2)
+        self.assertEqual(stats['waits'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+
+    def test_broken_connection_not_reused(self):
+        pool = self.make_pool(max_size=1)
+        conn = pool.getconn()
+        conn.closed = 2
+        pool.putconn(conn)
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_open_transaction_rolled_back(self):
+        pool = self.make_pool()
+        conn = pool.getconn()
+        conn.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+
+        pool.putconn(conn)
+
+        conn.rollback.assert_called_once_with()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_idle_connection_health_checked(self):
+        pool = self.make_pool(health_check_interval=0)
+        conn = pool.getconn()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = psycopg2.OperationalError
+        pool.putconn(conn)
+
+        replacement = pool.getconn()
+
+        self.assertIsNot(replacement, conn)
+        conn.close.assert_called_once_with()
+        self.assertEqual(pool.stats()['failed_health_checks'], 1)
+
+    def test_expired_connection_replaced(self):
+        pool = self.make_pool(max_lifetime=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertIsNot(pool.getconn(), conn)
+
+    def test_pool_size(self):
+        pooled = {'ENGINE': 'core.dbpool', 'POOL': {'MAX_SIZE': 3}}
+
+        self.assertEqual(pool_size(pooled), 3)
+        self.assertEqual(pool_size({'ENGINE': 'core.dbpool'}), 10)
+        self.assertIsNone(
+            pool_size({'ENGINE': 'django.db.backends.postgresql'})
+        )
+
+
+@skipUnless(
+    connection.settings_dict['ENGINE'] == 'core.dbpool',
+    'Needs the pooled backend',
+)
+class PooledBackendTests(TransactionTestCase):
+
+    def backend_pid(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_session_survives_close(self):
+        first = self.backend_pid()
+        connection.close()
+
+        self.assertEqual(self.backend_pid(), first)
+
+
+class PoolExhaustedResponseTests(TestCase):
+
+    def test_busy_response(self):
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_user('u@example.com', 'pass123')
+        )
+
+        with patch(
+            'recipe.views.RecipeViewSet.get_queryset',
+            side_effect=PoolExhausted('busy'),
+        ):
+
+            res = client.get(reverse('recipe:recipe-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+
+    def test_async_capable(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+
+        middleware = DatabasePoolMiddleware(get_response)
+
+        self.assertTrue(iscoroutinefunction(middleware))
+        res = asyncio.run(middleware(RequestFactory().get('/')))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,156 @@
+"""
+Parity tests for the list fast path: it must match DRF byte for byte
+"""
+import datetime
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.fastpath import FastSerializer, Unsupported
+from core.models import Ingredient, Recipe, Tag
+from core.renderers import FastJSONRenderer
+from recipe.serializers import RecipeSerializer
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('tags:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+class FastJSONRendererTests(SimpleTestCase):
+
+    def assertSameBytes(self, data, **kwargs):
+        self.assertEqual(
+            FastJSONRenderer().render(data, **kwargs),
+            JSONRenderer().render(data, **kwargs),
+        )
+
+    def test_matches_json_renderer(self):
+        self.assertSameBytes({
+            'text': 'Crème brûlée "quoted" \\ \n \u2028 \u2029 🍮',
+            'price': Decimal('5.25'),
+            'when': datetime.datetime(
+                2021, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc
+            ),
+            'day': datetime.date(2021, 5, 1),
+            'id': uuid.UUID(int=1),
+            'lazy': gettext_lazy('Unable to authenticate user'),
+            'nested': [{'a': None, 'b': True, 'c': 1}],
+            1: 'int key',
+        })
+
+    def test_empty_response(self):
+        self.assertSameBytes(None)
+
+    def test_indented_output_falls_back(self):
+        self.assertSameBytes(
+            {'a': [1, 2]}, accepted_media_type='application/json; indent=4',
+        )
+
+
+class FastSerializerTests(SimpleTestCase):
+
+    def test_unsupported_field(self):
+        class WithMethod(serializers.ModelSerializer):
+            extra = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Recipe
+                fields = ['id', 'extra']
+
+        with self.assertRaises(Unsupported):
+            FastSerializer(WithMethod())
+
+    def test_values_include_pk(self):
+        fast = FastSerializer(RecipeSerializer(fields=['title', 'tags']))
+
+        self.assertEqual(fast.values, ['id', 'title'])
+
+
+class FastListParityTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        vegan = Tag.objects.create(name='Vegan')
+        quick = Tag.objects.create(name='Quick \u2029 & "easy"')
+        salt = Ingredient.objects.create(name='Salt')
+        oil = Ingredient.objects.create(name='Olive oil')
+        Ingredient.objects.create(name='Unused')
+
+        titles = ['Crème brûlée', 'Soup 🍲', 'Line\u2028break', 'Stew']
+        for index, title in enumerate(titles):
+            recipe = Recipe.objects.create(
+                user=self.user, title=title, time_minutes=index * 7,
+                price=Decimal('1.5') * index,
+                link='' if index % 2 else f'http://example.com/{index}',
+            )
+            if index:
+                recipe.tags.add(quick, vegan)
+            if index > 1:
+                recipe.ingredients.add(oil, salt)
+
+    def assertParity(self, url, params=None):
+        cache.clear()
+        with override_settings(FAST_LIST_SERIALIZATION=True):
+            fast = self.client.get(url, params)
+        cache.clear()
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            slow = self.client.get(url, params)
+
+        self.assertEqual(fast.status_code, slow.status_code)
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_recipe_list(self):
+        res = self.assertParity(RECIPES_URL)
+
+        self.assertEqual(len(res.json()['results']), 4)
+
+    def test_recipe_list_skips_drf_fields(self):
+        with patch.object(
+            RecipeSerializer, 'to_representation', side_effect=AssertionError
+        ):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_recipe_list_pages(self):
+        res = self.assertParity(RECIPES_URL, {'page_size': 3})
+
+        self.assertParity(res.json()['next'])
+
+    def test_recipe_list_filtered(self):
+        tag = Tag.objects.get(name='Vegan')
+        self.assertParity(RECIPES_URL, {'tags': str(tag.id), 'min_price': '2'})
+
+    def test_recipe_list_sparse_fields(self):
+        self.assertParity(
+            RECIPES_URL, {'fields': 'id,price', 'expand': 'ingredients'}
+        )
+
+    def test_recipe_list_invalid_params(self):
+        self.assertParity(RECIPES_URL, {'fields': 'secret'})
+
+    def test_tag_list(self):
+        self.assertParity(TAGS_URL)
+        self.assertParity(TAGS_URL, {'assigned_only': 1})
+
+    def test_ingredient_list(self):
+        self.assertParity(INGREDIENTS_URL)
+        self.assertParity(
+            INGREDIENTS_URL, {'assigned_only': 1, 'page_size': 1}
+        )
@@ -0,0 +1,158 @@
+"""
+Tests for the password hashers and pooled password checks
+"""
+from io import StringIO
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import (
+    check_password, identify_hasher, make_password,
+)
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core import hashers
+
+
+SCRYPT = {'WORK_FACTOR': 2 ** 10, 'BLOCK_SIZE': 8, 'PARALLELISM': 1}
+ARGON2 = {'TIME_COST': 1, 'MEMORY_COST': 1024, 'PARALLELISM': 1}
+
+
+@override_settings(
+    PASSWORD_HASHERS=[
+        'core.hashers.ScryptPasswordHasher',
+        'core.hashers.Argon2PasswordHasher',
+    ],
+    PASSWORD_SCRYPT=SCRYPT, PASSWORD_ARGON2=ARGON2,
+)
+class HasherTests(SimpleTestCase):
+
+    def test_scrypt_round_trip(self):
+        encoded = make_password('pass123')
+
+        self.assertTrue(encoded.startswith('scrypt$1024$'))
+        self.assertTrue(check_password('pass123', encoded))
+        self.assertFalse(check_password('pass124', encoded))
+
+    def test_scrypt_cost_change_needs_update(self):
+        encoded = make_password('pass123')
+        hasher = identify_hasher(encoded)
+
+        self.assertFalse(hasher.must_update(encoded))
+        with self.settings(PASSWORD_SCRYPT={**SCRYPT, 'WORK_FACTOR': 2 ** 11}):
+            self.assertTrue(hasher.must_update(encoded))
+
+    def test_argon2_costs_from_settings(self):
+        encoded = make_password('pass123', hasher='argon2')
+
+        self.assertIn('m=1024,t=1,p=1', encoded)
+        with self.settings(PASSWORD_ARGON2={**ARGON2, 'TIME_COST': 2}):
+            self.assertTrue(identify_hasher(encoded).must_update(encoded))
+
+
+@override_settings(
+    PASSWORD_HASHERS=[
+        'core.hashers.ScryptPasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ],
+    PASSWORD_SCRYPT=SCRYPT, PASSWORD_HASH_WORKERS=0,
+)
+class PooledPasswordBackendTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123'
+        )
+
+    def test_valid_login(self):
+        self.assertEqual(
+            authenticate(username='user@example.com', password='pass123'),
+            self.user,
+        )
+
+    def test_invalid_login(self):
+        self.assertIsNone(
+            authenticate(username='user@example.com', password='wrong')
+        )
+        self.assertIsNone(
+            authenticate(username='nobody@example.com', password='pass123')
+        )
+
+    def test_outdated_hash_upgraded(self):
+        self.user.password = make_password('pass123', hasher='md5')
+        self.user.save()
+
+        self.assertEqual(
+            authenticate(username='user@example.com', password='pass123'),
+            self.user,
+        )
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertTrue(self.user.check_password('pass123'))
+
+    def test_changed_password_not_overwritten(self):
+        self.user.password = make_password('pass123', hasher='md5')
+        self.user.save()
+        # The password changes while the re-hash is pending
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            password='changed'
+        )
+
+        hashers.schedule_rehash(self.user, 'pass123')
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, 'changed')
+
+
+class HashingPoolTests(SimpleTestCase):
+
+    def tearDown(self):
+        if hashers._executor is not None:
+            hashers._executor.shutdown()
+            hashers._executor = None
+
+    @override_settings(PASSWORD_HASH_WORKERS=1)
+    def test_check_in_worker_process(self):
+        # Workers load the project settings, so use the configured hasher
+        encoded = make_password('pass123')
+
+        self.assertEqual(
+            hashers.check_password('pass123', encoded), (True, False)
+        )
+        self.assertEqual(
+            hashers.check_password('wrong', encoded), (False, False)
+        )
+
+    @override_settings(PASSWORD_HASH_WORKERS=1)
+    def test_broken_pool_falls_back_inline(self):
+        encoded = make_password('pass123')
+        hashers.check_password('pass123', encoded)
+        broken = hashers._executor
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+
+        with self.assertLogs('core.hashers', 'ERROR'):
+            self.assertEqual(
+                hashers.check_password('pass123', encoded), (True, False)
+            )
+        self.assertIsNone(hashers._executor)
+        self.assertEqual(
+            hashers.check_password('wrong', encoded), (False, False)
+        )
+        self.assertIsNot(hashers._executor, broken)
+
+
+class BenchHashersTests(SimpleTestCase):
+
+    @override_settings(PASSWORD_SCRYPT=SCRYPT)
+    def test_reports_each_hasher(self):
+        out = StringIO()
+
+        call_command(
+            'bench_hashers', '--duration', '0.01', '--algorithm', 'scrypt',
+            stdout=out,
+        )
+
+        self.assertIn('scrypt', out.getvalue())
+        self.assertIn('logins/s/core', out.getvalue())
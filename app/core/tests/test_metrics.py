@@ -0,0 +1,158 @@
+"""
+Tests for the request metrics middleware and endpoint
+"""
+import asyncio
+from unittest.mock import patch
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.dbpool.pool import STAT_NAMES
+
+from core.middleware import MetricsMiddleware
+from core.models import Tag
+
+
+TAGS_URL = reverse('tags:tag-list')
+METRICS_URL = reverse('metrics')
+
+
+class MetricsMiddlewareTests(TestCase):
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user('user@example.com', 'pass123')
+        )
+        Tag.objects.create(name='Vegan')
+
+    @override_settings(API_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('db;dur=', res['Server-Timing'])
+        self.assertIn('desc="1 queries"', res['Server-Timing'])
+        self.assertIn('total;dur=', res['Server-Timing'])
+
+    def test_totals_recorded_per_endpoint(self):
+        self.client.get(TAGS_URL)
+        res = self.client.get(TAGS_URL)
+
+        totals = metrics.registry.snapshot()[('tags:tag-list', 'GET')]
+        self.assertEqual(totals['statuses'], {200: 2})
+        self.assertEqual(totals['queries'], 2)
+        self.assertEqual(totals['bytes'], 2 * len(res.content))
+        self.assertGreater(totals['serialize'], 0)
+
+    def test_streaming_response(self):
+        res = self.client.get(reverse('recipe:recipe-export'))
+        b''.join(res.streaming_content)
+
+        totals = metrics.registry.snapshot()[('recipe:recipe-export', 'GET')]
+        self.assertEqual(totals['bytes'], 0)
+
+    def test_async_capable(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+
+        middleware = MetricsMiddleware(get_response)
+
+        self.assertTrue(iscoroutinefunction(middleware))
+        res = asyncio.run(middleware(RequestFactory().get('/')))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        totals = metrics.registry.snapshot()[('unmatched', 'GET')]
+        self.assertEqual(totals['bytes'], 2)
+
+    def test_unresolved_paths_share_one_endpoint(self):
+        self.client.get('/no/such/page/')
+
+        self.assertIn(('unmatched', 'GET'), metrics.registry.snapshot())
+
+    def test_server_timing_off_by_default(self):
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(API_QUERY_BUDGETS={'GET tags:tag-list': 0})
+    def test_budget_enforced(self):
+        with self.assertRaises(metrics.QueryBudgetExceeded):
+            self.client.get(TAGS_URL)
+
+    @override_settings(
+        API_QUERY_BUDGETS={'GET tags:tag-list': 0},
+        API_QUERY_BUDGETS_ENFORCED=False,
+    )
+    def test_budget_logged_outside_tests(self):
+        with self.assertLogs('core.metrics', 'WARNING'):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class MetricsEndpointTests(TestCase):
+
+    def setUp(self):
+        metrics.registry.clear()
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_prometheus_output(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        client.get(TAGS_URL)
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            res['Content-Type'].startswith('text/plain; version=0.0.4')
+        )
+        body = res.content.decode()
+        labels = 'endpoint="tags:tag-list",method="GET"'
+        self.assertIn(f'api_requests_total{{{labels},status="200"}} 1', body)
+        self.assertIn(
+            f'api_request_duration_seconds_count{{{labels}}} 1', body
+        )
+        self.assertIn(f'api_db_queries_total{{{labels}}} 1', body)
+
+    def test_pool_waits(self):
+        stats = dict.fromkeys(STAT_NAMES, 0)
+        stats.update(idle=1, in_use=2, waits=3, wait_ms=1500)
+
+        with patch(
+            'core.metrics.pool_stats', return_value={('default', 'app'): stats}
+        ):
+            body = metrics.render_prometheus()
+
+        labels = 'alias="default",database="app"'
+        self.assertIn(f'db_pool_waits_total{{{labels}}} 3', body)
+        self.assertIn(f'db_pool_wait_seconds_total{{{labels}}} 1.5', body)
+        self.assertIn(
+            f'db_pool_connections{{{labels},state="in_use"}} 2', body
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required_when_set(self):
+        self.assertEqual(
+            self.client.get(METRICS_URL).status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_disabled_without_token(self):
+        self.assertEqual(
+            self.client.get(METRICS_URL).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
@@ -1,10 +1,16 @@
 
 from decimal import Decimal
-from django.test import TestCase
+import hashlib
+from django.core.files.base import ContentFile
+import threading
+import time
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
 from unittest.mock import patch
 from django.contrib.auth import get_user_model
 
 from core import models
+from core.storage import image_storage
 
 
 
@@ -147,6 +153,117 @@ class ModelTests(TestCase):
 
         self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
 
+    def test_get_or_create_many(self):
+        existing = models.Tag.objects.create(name='Existing')
 
+        tags = models.Tag.objects.get_or_create_many(
+            ['Existing', 'New', 'New']
+        )
+
+        self.assertEqual(tags['Existing'], existing)
+        self.assertEqual(tags['New'].name, 'New')
+        self.assertEqual(models.Tag.objects.count(), 2)
+
+    def test_get_or_create_many_ignores_case(self):
+        salt = models.Ingredient.objects.create(name='Salt')
+
+        ingredients = models.Ingredient.objects.get_or_create_many(
+            ['salt', 'SALT', 'Pepper', 'pepper']
+        )
+
+        self.assertEqual(ingredients['salt'], salt)
+        self.assertEqual(ingredients['SALT'], salt)
+        self.assertEqual(ingredients['Pepper'], ingredients['pepper'])
+        self.assertEqual(models.Ingredient.objects.count(), 2)
+
+    def test_get_or_create_many_lowers_in_database(self):
+        # str.lower() gives a final sigma, PostgreSQL's LOWER() does not
+        first = models.Tag.objects.get_or_create_many(['ΌΣΟΣ'])
+        again = models.Tag.objects.get_or_create_many(['ΌΣΟΣ', 'όσος'])
+
+        self.assertEqual(again['ΌΣΟΣ'], first['ΌΣΟΣ'])
+        self.assertEqual(models.Tag.objects.count(), len(set(again.values())))
+
+    def test_names_unique_regardless_of_case(self):
+        models.Tag.objects.create(name='Vegan')
 
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(name='vegan')
 
+    def test_image_blob_reference_counting(self):
+        name = image_storage.save(
+            'uploads/recipe/test.txt', ContentFile(b'blob')
+        )
+        models.ImageBlob.objects.acquire(name)
+        models.ImageBlob.objects.acquire(name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.ImageBlob.objects.release(name)
+        self.assertEqual(models.ImageBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(image_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.ImageBlob.objects.release(name)
+        self.assertFalse(models.ImageBlob.objects.filter(name=name).exists())
+        self.assertFalse(image_storage.exists(name))
+
+    def test_image_storage_names_by_content(self):
+        first = image_storage.save(
+            'uploads/recipe/a.txt', ContentFile(b'same')
+        )
+        second = image_storage.save(
+            'uploads/recipe/b.txt', ContentFile(b'same')
+        )
+        self.addCleanup(image_storage.delete, first)
+
+        digest = hashlib.sha256(b'same').hexdigest()
+        self.assertEqual(first, f'uploads/recipe/{digest}.txt')
+        self.assertEqual(second, first)
+
+
+class ImageStorageLockTests(TransactionTestCase):
+
+    def test_save_waits_for_orphan_delete(self):
+        name = image_storage.save(
+            'uploads/recipe/a.txt', ContentFile(b'orphan')
+        )
+        self.addCleanup(image_storage.delete, name)
+        models.ImageBlob.objects.create(name=name, ref_count=0)
+        deleting = threading.Event()
+        proceed = threading.Event()
+        delete = image_storage.delete
+
+        def slow_delete(path):
+            deleting.set()
+            proceed.wait(5)
+            delete(path)
+
+        def in_thread(func, *args):
+            try:
+                func(*args)
+            finally:
+                connection.close()
+
+        with patch.object(image_storage, 'delete', slow_delete):
+            orphan = threading.Thread(
+                target=in_thread,
+                args=(models.ImageBlob.objects.delete_orphan, name),
+            )
+            orphan.start()
+            deleting.wait(5)
+            upload = threading.Thread(
+                target=in_thread,
+                args=(
+                    image_storage.save,
+                    'uploads/recipe/b.txt',
+                    ContentFile(b'orphan'),
+                ),
+            )
+            upload.start()
+            # The upload blocks on the row lock instead of reusing the file
+            time.sleep(0.2)
+            proceed.set()
+            orphan.join()
+            upload.join()
+
+        self.assertTrue(image_storage.exists(name))
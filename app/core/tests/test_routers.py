@@ -0,0 +1,210 @@
+"""
+Tests for the primary/replica database router
+"""
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import routers
+from core.models import Recipe, Tag
+from recipe.views import RecipeViewSet
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class RouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+
+    def test_reads_from_primary_by_default(self):
+        with routers.routing_scope():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_reads_from_replica_when_enabled(self):
+        with routers.routing_scope():
+            routers.read_from_replicas()
+
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica_1')
+
+        self.assertFalse(routers.reading_from_replicas())
+
+    def test_writes_leave_reads_alone(self):
+        with routers.routing_scope():
+            routers.read_from_replicas()
+
+            self.assertEqual(self.router.db_for_write(Recipe), 'default')
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica_1')
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica_1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaReadMixinTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.targets = []
+
+        get_queryset = RecipeViewSet.get_queryset
+
+        def recording_get_queryset(view):
+            self.targets.append(routers.reading_from_replicas())
+            return get_queryset(view)
+
+        patcher = patch.object(
+            RecipeViewSet, 'get_queryset', recording_get_queryset
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_safe_request_reads_from_replica(self):
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.targets, [True])
+        self.assertFalse(routers.reading_from_replicas())
+
+    def test_write_in_safe_request_switches_to_primary(self):
+        get_queryset = RecipeViewSet.get_queryset
+        after_write = []
+
+        def writing_get_queryset(view):
+            Tag.objects.create(name='Written')
+            after_write.append(routers.reading_from_replicas())
+            return get_queryset(view)
+
+        with patch.object(RecipeViewSet, 'get_queryset', writing_get_queryset):
+            self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(after_write, [False])
+        # The writer's next read stays on the primary as well
+        self.assertEqual(self.targets, [False])
+
+    def test_writer_pinned_to_primary(self):
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup',
+            time_minutes=5, price=Decimal('1.00'),
+        )
+        self.client.patch(
+            reverse('recipe:recipe-detail', args=[recipe.id]),
+            {'title': 'Stew'},
+        )
+        self.client.get(RECIPES_URL)
+
+        other = APIClient()
+        other_user = get_user_model().objects.create_user(
+            'other@example.com', 'pass123'
+        )
+        other.force_authenticate(other_user)
+
+        other.get(RECIPES_URL)
+
+        # Write, then the writer's read, then another user's read
+        self.assertEqual(self.targets, [False, False, True])
+
+    def test_writer_pinned_before_writing(self):
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup',
+            time_minutes=5, price=Decimal('1.00'),
+        )
+        pinned = []
+        perform_update = RecipeViewSet.perform_update
+
+        def recording_perform_update(view, serializer):
+            pinned.append(routers.is_pinned_to_primary(self.user.pk))
+            perform_update(view, serializer)
+
+        with patch.object(
+            RecipeViewSet, 'perform_update', recording_perform_update
+        ):
+            self.client.patch(
+                reverse('recipe:recipe-detail', args=[recipe.id]),
+                {'title': 'Stew'},
+            )
+
+        self.assertEqual(pinned, [True])
+
+    def test_replica_read_not_cached_after_concurrent_write(self):
+        # A write by the same user lands while the list is read
+        get_queryset = RecipeViewSet.get_queryset
+
+        def writing_get_queryset(view):
+            routers.pin_to_primary(self.user.pk)
+            return get_queryset(view)
+
+        with patch.object(RecipeViewSet, 'get_queryset', writing_get_queryset):
+            self.client.get(RECIPES_URL)
+        cache.delete(routers._pin_key(self.user.pk))
+        self.client.get(RECIPES_URL)
+
+        # Nothing was cached, so the second read queries again
+        self.assertEqual(self.targets, [True, True])
+
+    def test_token_lookup_on_primary(self):
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        seen = []
+        db_for_read = routers.PrimaryReplicaRouter.db_for_read
+
+        def recording_db_for_read(router, model, **hints):
+            if model is Token:
+                seen.append(routers.reading_from_replicas())
+            return db_for_read(router, model, **hints)
+
+        with patch.object(
+            routers.PrimaryReplicaRouter, 'db_for_read', recording_db_for_read
+        ):
+            res = client.get(reverse('tags:tag-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(seen, [False])
+
+
+@skipUnless(
+    settings.DATABASE_REPLICAS,
+    'Set DB_REPLICA_HOSTS to run against a replica alias',
+)
+class ReplicaQueryTests(TransactionTestCase):
+    databases = '__all__'
+
+    def test_list_queries_run_on_replica(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123'
+        )
+        Tag.objects.create(name='Vegan')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+
+        with patch('core.routers.random.choice', return_value=replica.alias):
+            with CaptureQueriesContext(replica) as queries:
+                res = client.get(reverse('tags:tag-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['name'], 'Vegan')
+        self.assertGreater(len(queries), 0)
@@ -0,0 +1,96 @@
+"""
+Per-user response cache for recipe reads
+
+Every user has a version counter in the cache. Cached responses and their
+ETags are keyed by that version, so bumping it after a write makes all of
+the user's cached reads unreachable without having to find and delete them.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+
+def _cache():
+    return caches[settings.RECIPE_CACHE['ALIAS']]
+
+
+def _version_key(user_id):
+    return f'recipe:version:{user_id}'
+
+
+def _fresh_version():
+    # Start from the clock so a counter lost to eviction never reuses a value
+    return time.time_ns()
+
+
+def get_version(user_id):
+    cache = _cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(user_ids):
+    cache = _cache()
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), _fresh_version(), None)
+
+
+def bump_version(*user_ids):
+    """Invalidate the cached recipe reads of the given users.
+
+    The bump runs at once and again when the surrounding transaction
+    commits. A read that runs before the commit may cache pre-write data
+    under the new version; the second bump makes that entry unreachable.
+    """
+    user_ids = set(user_ids)
+    _bump(user_ids)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(user_ids))
+
+
+def response_key(request, action, pk=None):
+    """Cache key and ETag for a read by ``request.user``"""
+    query = '&'.join(sorted(
+        f'{name}={value}'
+        for name, values in request.query_params.lists()
+        for value in values
+    ))
+    query = hashlib.md5(query.encode()).hexdigest()
+    version = get_version(request.user.pk)
+    key = f'recipe:response:{request.user.pk}:{version}:{action}:{pk}:{query}'
+    digest = hashlib.md5(
+        f'{key}:{request.accepted_media_type}'.encode()
+    ).hexdigest()
+    return key, f'"{digest}"'
+
+
+def _opaque(etag):
+    # Weak comparison ignores the W/ prefix
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_listed(etag, etags):
+    """Whether ``etags``, parsed from ``If-None-Match``, hold ``etag``.
+
+    Tags are compared weakly, as that header requires. ``*`` is left to the
+    caller: it matches any current version, so only once one was found.
+    """
+    return any(_opaque(tag) == _opaque(etag) for tag in etags)
+
+
+def get_response(key):
+    return _cache().get(key)
+
+
+def set_response(key, data):
+    _cache().set(key, data, settings.RECIPE_CACHE['TIMEOUT'])
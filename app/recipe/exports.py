@@ -0,0 +1,107 @@
+"""
+Streaming exports of a user's recipes
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.models import Recipe
+
+
+FIELDS = ['id', 'title', 'description', 'time_minutes', 'price', 'link']
+RELATIONS = ['tags', 'ingredients']
+
+# Separator used for tag and ingredient names in a CSV cell. Names holding
+# it are quoted the way CSV quotes fields; see join_names
+CSV_LIST_SEPARATOR = '|'
+
+
+def iter_recipes(queryset, chunk_size):
+    """Yield recipe dicts with their tag and ingredient names.
+
+    Rows are read through a server-side cursor and the relations are
+    fetched once per chunk, so memory use depends on ``chunk_size`` and
+    not on the number of recipes.
+    """
+    chunk = []
+    for row in queryset.values(*FIELDS).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _with_relations(chunk)
+            chunk = []
+
+    if chunk:
+        yield from _with_relations(chunk)
+
+
+def _with_relations(rows):
+    ids = [row['id'] for row in rows]
+    names = {
+        relation: _names_by_recipe(relation, ids) for relation in RELATIONS
+    }
+
+    for row in rows:
+        for relation in RELATIONS:
+            row[relation] = names[relation].get(row['id'], [])
+        yield row
+
+
+def _names_by_recipe(relation, recipe_ids):
+    descriptor = getattr(Recipe, relation)
+    through = descriptor.through
+    target = descriptor.field.related_model._meta.model_name
+
+    names = {}
+    pairs = (
+        through.objects
+        .filter(recipe_id__in=recipe_ids)
+        .order_by(f'{target}_id')
+        .values_list('recipe_id', f'{target}__name')
+    )
+    for recipe_id, name in pairs:
+        names.setdefault(recipe_id, []).append(name)
+    return names
+
+
+def ndjson_lines(queryset, chunk_size):
+    for recipe in iter_recipes(queryset, chunk_size):
+        yield json.dumps(recipe, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo:
+    # csv.writer only needs write(); hand each line straight back
+    def write(self, value):
+        return value
+
+
+def join_names(names):
+    """One CSV cell for a list of names, read back by ``split_names``"""
+    writer = csv.writer(
+        _Echo(), delimiter=CSV_LIST_SEPARATOR, lineterminator=''
+    )
+    return writer.writerow(names)
+
+
+def split_names(value):
+    if not value:
+        return []
+    row = next(csv.reader([value], delimiter=CSV_LIST_SEPARATOR))
+    return [name for name in row if name]
+
+
+def csv_lines(queryset, chunk_size):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS + RELATIONS)
+    for recipe in iter_recipes(queryset, chunk_size):
+        yield writer.writerow(
+            [recipe[field] for field in FIELDS]
+            + [join_names(recipe[relation]) for relation in RELATIONS]
+        )
+
+
+# output name -> (line generator, content type, file extension)
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson', 'ndjson'),
+    'csv': (csv_lines, 'text/csv', 'csv'),
+}
@@ -0,0 +1,70 @@
+"""
+Query parameter filters for the recipe list
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+
+from core.filters import RELATIONS
+from core.models import Recipe
+
+
+# query parameter -> (lookup, parser)
+RANGES = {
+    'min_time': ('time_minutes__gte', int),
+    'max_time': ('time_minutes__lte', int),
+    'min_price': ('price__gte', Decimal),
+    'max_price': ('price__lte', Decimal),
+}
+
+MATCH_MODES = ('any', 'all')
+
+
+def _params_to_ints(params, name):
+    try:
+        return [int(value) for value in params[name].split(',')]
+    except ValueError:
+        raise ValidationError(
+            {name: 'Expected a comma separated list of ids.'}
+        )
+
+
+def filter_recipes(queryset, params):
+    """Apply the tag, ingredient, time and price filters in ``params``.
+
+    Relation filters are ``id IN (subquery)`` over the through tables, so
+    a recipe matching several ids still comes back once and no DISTINCT
+    is needed. ``<relation>_match=all`` keeps recipes linked to every id.
+    """
+    for name, column in RELATIONS.items():
+        if not params.get(name):
+            continue
+        ids = set(_params_to_ints(params, name))
+        match = params.get(f'{name}_match', 'any')
+        if match not in MATCH_MODES:
+            raise ValidationError(
+                {f'{name}_match': 'Expected "any" or "all".'}
+            )
+
+        matching = getattr(Recipe, name).through.objects.filter(
+            **{f'{column}__in': ids}
+        )
+        if match == 'all':
+            matching = (
+                matching.values('recipe_id')
+                .annotate(matched=Count(column))
+                .filter(matched=len(ids))
+            )
+        queryset = queryset.filter(id__in=matching.values('recipe_id'))
+
+    for name, (lookup, parse) in RANGES.items():
+        if not params.get(name):
+            continue
+        try:
+            value = parse(params[name])
+        except (ValueError, InvalidOperation):
+            raise ValidationError({name: 'Expected a number.'})
+        queryset = queryset.filter(**{lookup: value})
+
+    return queryset
@@ -0,0 +1,228 @@
+"""
+Background processing of uploaded recipe images
+
+``upload_image`` only stores the original file and calls
+``schedule_renditions``. Once the transaction commits, a local thread pool
+decodes the image, applies its EXIF orientation and writes the renditions
+in ``RENDITIONS``. The renditions are re-encoded without EXIF data. Their
+paths are then recorded on the recipe together with the processing status.
+
+The original upload is kept byte for byte until then, GPS position and all.
+Once the renditions are written, an original carrying EXIF or other
+metadata is replaced by a full-size copy without it, and the uploaded file
+is released. The copy stays as close to the upload as Pillow allows:
+JPEG keeps its quantization tables and lossless WebP stays lossless.
+Originals without metadata are kept as uploaded.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps, JpegImagePlugin
+
+from core.models import RECIPE_IMAGE_DIR, ImageBlob, Recipe
+from recipe import cache
+
+
+logger = logging.getLogger(__name__)
+
+# name -> (bounding box, Pillow format, file extension)
+RENDITIONS = {
+    'thumbnail': ((200, 200), 'JPEG', 'jpg'),
+    'thumbnail_webp': ((200, 200), 'WEBP', 'webp'),
+    'large_webp': ((1200, 1200), 'WEBP', 'webp'),
+}
+RENDITION_DIR = os.path.join(RECIPE_IMAGE_DIR, 'renditions')
+# Formats whose originals may carry EXIF and are re-encoded without it
+STRIPPED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+# Image.info keys holding metadata rather than image data
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+# Lossy WebP originals are re-encoded at this quality
+ORIGINAL_QUALITY = 95
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+        return _executor
+
+
+def schedule_renditions(recipe_id):
+    """Process the recipe's image after the current transaction commits.
+
+    With ``RECIPE_IMAGE_WORKERS = 0`` the work runs inline instead.
+    """
+    transaction.on_commit(lambda: _submit(recipe_id))
+
+
+def _submit(recipe_id):
+    if settings.RECIPE_IMAGE_WORKERS == 0:
+        process_image(recipe_id)
+    else:
+        get_executor().submit(_run_in_worker, recipe_id)
+
+
+def _run_in_worker(recipe_id):
+    close_old_connections()
+    try:
+        process_image(recipe_id)
+    except Exception:
+        logger.exception('Processing the image of recipe %s failed', recipe_id)
+    finally:
+        connection.close()
+
+
+def rendition_name(source_name, rendition, extension):
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return os.path.join(RENDITION_DIR, f'{stem}_{rendition}.{extension}')
+
+
+def render(image, size, image_format):
+    """Encode a resized copy of ``image``; metadata such as EXIF is dropped"""
+    copy = image.copy()
+    copy.thumbnail(size)
+    if image_format == 'JPEG' and copy.mode not in ('RGB', 'L'):
+        copy = copy.convert('RGB')
+    buffer = BytesIO()
+    copy.save(buffer, image_format, quality=settings.RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def has_metadata(source):
+    """Whether the opened image ``source`` carries EXIF or other metadata"""
+    if source.getexif() or any(key in source.info for key in METADATA_KEYS):
+        return True
+    # PNG text chunks
+    return bool(getattr(source, 'text', None))
+
+
+def is_lossless_webp(file):
+    """Whether the WebP ``file`` holds a lossless (VP8L) image"""
+    file.seek(12)
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            return False
+        chunk, size = header[:4], int.from_bytes(header[4:], 'little')
+        if chunk in (b'VP8 ', b'VP8L'):
+            return chunk == b'VP8L'
+        # Chunks are padded to an even size
+        file.seek(size + size % 2, os.SEEK_CUR)
+
+
+def strip_metadata(image, source, lossless=False):
+    """Encode ``image``, decoded from the opened image ``source``, at full
+    size without EXIF or other metadata, in the format of ``source``
+    """
+    copy = image.copy()
+    # PNG writes the EXIF found in info; palette transparency lives there too
+    copy.info = {
+        key: value for key, value in image.info.items()
+        if key == 'transparency'
+    }
+    options = {}
+    if source.format == 'JPEG':
+        options = {
+            'qtables': source.quantization,
+            'subsampling': JpegImagePlugin.get_sampling(source),
+        }
+    elif source.format == 'WEBP':
+        options = (
+            {'lossless': True} if lossless
+            else {'quality': ORIGINAL_QUALITY}
+        )
+    buffer = BytesIO()
+    copy.save(buffer, source.format, **options)
+    return buffer.getvalue()
+
+
+def process_image(recipe_id):
+    recipe = (
+        Recipe.objects.filter(pk=recipe_id)
+        .only('id', 'user_id', 'image', 'image_renditions')
+        .first()
+    )
+    if recipe is None or not recipe.image:
+        return
+
+    source_name = recipe.image.name
+    # Filtering on the image name leaves recipes whose image was replaced
+    # meanwhile to the job scheduled for the new image
+    current = Recipe.objects.filter(pk=recipe_id, image=source_name)
+    current.update(image_status=Recipe.IMAGE_PROCESSING)
+
+    renditions = {}
+    stripped = None
+    try:
+        with recipe.image.storage.open(source_name) as source:
+            opened = Image.open(source)
+            image = ImageOps.exif_transpose(opened)
+            for name, (size, image_format, extension) in RENDITIONS.items():
+                renditions[name] = default_storage.save(
+                    rendition_name(source_name, name, extension),
+                    ContentFile(render(image, size, image_format)),
+                )
+            if opened.format in STRIPPED_FORMATS and has_metadata(opened):
+                lossless = (
+                    opened.format == 'WEBP' and is_lossless_webp(source)
+                )
+                stripped = strip_metadata(image, opened, lossless)
+    except Exception:
+        logger.exception(
+            'Could not create renditions for recipe %s', recipe_id
+        )
+        _delete_files(renditions.values())
+        current.update(image_status=Recipe.IMAGE_FAILED)
+        cache.bump_version(recipe.user_id)
+        return
+
+    with transaction.atomic():
+        original = source_name
+        if stripped is not None:
+            # Stored and counted in one transaction, see
+            # ContentAddressedStorage. If the recipe moved on, an unused file
+            # is left to gc_recipe_images
+            original = recipe.image.storage.save(
+                source_name, ContentFile(stripped)
+            )
+
+        updated = current.update(
+            image=original,
+            image_status=Recipe.IMAGE_READY,
+            image_renditions=renditions,
+        )
+        if updated and original != source_name:
+            # update() sends no signals; count the swap like core.signals
+            ImageBlob.objects.acquire(original)
+            ImageBlob.objects.release(source_name)
+    if updated:
+        stale = (
+            set(recipe.image_renditions.values())
+            - set(renditions.values())
+        )
+
+        _delete_files(stale)
+    else:
+        _delete_files(renditions.values())
+    # update() sends no signals
+    cache.bump_version(recipe.user_id)
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
@@ -0,0 +1,95 @@
+"""
+Full-text search over a user's recipes
+
+Each recipe stores a weighted ``tsvector`` of its title, tag and ingredient
+names and description in ``Recipe.search_vector`` (GIN indexed). The
+signal handlers in ``recipe.signals`` and the bulk write paths keep it up
+to date through ``update_search_vectors``.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Concat, Replace
+from django.utils.html import escape
+
+from core.models import Recipe
+
+
+# Must match the configuration used by the backfill in migration 0010
+SEARCH_CONFIG = 'english'
+
+# Control characters ts_headline puts around matches; render_headline turns
+# them into <mark> tags once the text around them is escaped
+START_SEL = '\x02'
+STOP_SEL = '\x03'
+
+
+def _names(relation):
+    # Space separated names of the recipe's tags or ingredients
+    target = getattr(Recipe, relation).field.related_model._meta.model_name
+    return Subquery(
+        getattr(Recipe, relation).through.objects
+        .filter(recipe_id=OuterRef('pk'))
+        .values('recipe_id')
+        .annotate(names=StringAgg(f'{target}__name', ' '))
+        .values('names')
+    )
+
+
+def search_vector():
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(_names('tags'), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_names('ingredients'), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipe_ids):
+    """Recompute the stored vectors of the given recipes in one UPDATE"""
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            search_vector=search_vector()
+        )
+
+
+def search_recipes(queryset, text):
+    """Filter ``queryset`` to matches for ``text``, best first.
+
+    Adds ``rank`` and a plain text ``headline`` with the matched words
+    between ``START_SEL`` and ``STOP_SEL``; see ``render_headline``.
+    """
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    source = Concat('title', Value(' '), 'description')
+    for marker in (START_SEL, STOP_SEL):
+        # Recipe text must not be able to open or close a highlight
+        source = Replace(source, Value(marker), Value(''))
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline(
+                source,
+                query,
+                config=SEARCH_CONFIG,
+                start_sel=START_SEL,
+                stop_sel=STOP_SEL,
+            ),
+        )
+        .order_by('-rank', '-id')
+    )
+
+
+def render_headline(headline):
+    """HTML of a headline: the text escaped, the matches in ``<mark>`` tags"""
+    return (
+        escape(headline)
+        .replace(START_SEL, '<mark>')
+        .replace(STOP_SEL, '</mark>')
+    )
@@ -1,17 +1,135 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers
 
+from core.metrics import TimedListSerializer, TimedSerializerMixin
 from core.models import Recipe, Tag, Ingredient
-from tags.serializers import TagSerializer
+from core.sparse import SparseFieldsSerializerMixin
+from recipe import stats, usage
+from recipe.search import render_headline, update_search_vectors
+from tags.serializers import TagSerializer, UniqueNameMixin
+
+
+def _resolve(model, items):
+    # Map nested {'name': ...} payloads to model objects, keeping input order
+    names = list(dict.fromkeys(item['name'] for item in items))
+    by_name = model.objects.get_or_create_many(names)
+    return list(dict.fromkeys(by_name[name] for name in names))
+
+
+def _link_many(recipes, field_name, model, payloads, replace=False):
+    # Write the M2M rows for many recipes with one lookup and one insert
+    through = getattr(Recipe, field_name).through
+    target = through._meta.get_field(model._meta.model_name).attname
+
+    removed = []
+    if replace:
+        linked = through.objects.filter(
+            recipe_id__in=[recipe.id for recipe in recipes]
+        )
+        removed = list(linked.values_list(target, flat=True))
+        linked.delete()
+
+    by_name = model.objects.get_or_create_many(
+        item['name'] for items in payloads for item in items
+    )
+    # Names differing only in case resolve to the same row, which must be
+    # linked and counted once
+    rows = [
+        through(recipe_id=recipe.id, **{target: target_id})
+        for recipe, items in zip(recipes, payloads)
+        for target_id in dict.fromkeys(
+            by_name[item['name']].id for item in items
+        )
+    ]
+    through.objects.bulk_create(rows, ignore_conflicts=True)
+    # bulk_create sends no signals
+    usage.count_links(model, [getattr(row, target) for row in rows], removed)
+
+
+class RecipeListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """Batched writes for ``RecipeSerializer(many=True)``"""
 
-
-class IngredientSerializer(serializers.ModelSerializer):
+    def create(self, validated_data):
+        tags_data = [item.pop('tags', []) for item in validated_data]
+        ingredients_data = [
+            item.pop('ingredients', []) for item in validated_data
+        ]
+
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(
+                [Recipe(**item) for item in validated_data]
+            )
+            _link_many(recipes, 'tags', Tag, tags_data)
+            _link_many(recipes, 'ingredients', Ingredient, ingredients_data)
+            # bulk_create sends no signals
+            update_search_vectors(recipe.id for recipe in recipes)
+            stats.record_created(recipes)
+
+        return recipes
+
+    def update(self, instances, validated_data):
+        # instances and validated_data are matched by position
+        fields = set()
+        tagged, tags_data = [], []
+        with_ingredients, ingredients_data = [], []
+
+        for instance, attrs in zip(instances, validated_data):
+            tags = attrs.pop('tags', None)
+            ingredients = attrs.pop('ingredients', None)
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+                fields.add(attr)
+            # Same rule as RecipeSerializer.update: only non-empty lists
+            # replace
+            if tags:
+                tagged.append(instance)
+                tags_data.append(tags)
+            if ingredients:
+                with_ingredients.append(instance)
+                ingredients_data.append(ingredients)
+
+        with transaction.atomic():
+            if fields:
+                Recipe.objects.bulk_update(instances, sorted(fields))
+            if tagged:
+                _link_many(tagged, 'tags', Tag, tags_data, replace=True)
+            if with_ingredients:
+                _link_many(
+                    with_ingredients, 'ingredients', Ingredient,
+                    ingredients_data, replace=True
+                )
+            # bulk_update sends no signals
+            update_search_vectors(instance.id for instance in instances)
+            if fields & {'time_minutes', 'price'}:
+                stats.record_updated(instances)
+
+        return instances
+
+
+class IngredientSerializer(
+    UniqueNameMixin, TimedSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Ingredient
         fields = ['name']
         read_only = ['id']
+        list_serializer_class = TimedListSerializer
+
+
+class IngredientDetailSerializer(IngredientSerializer):
+
+    class Meta(IngredientSerializer.Meta):
+        fields = ['id', 'name', 'usage_count']
+        read_only_fields = ['usage_count']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(
+    SparseFieldsSerializerMixin,
+    TimedSerializerMixin,
+    serializers.ModelSerializer,
+):
+
     tags = TagSerializer(many=True,required=False)
     ingredients = IngredientSerializer(many=True,required=False)
 
@@ -19,28 +137,25 @@ class RecipeSerializer(serializers.ModelSerializer):
         model=Recipe
         fields = ['id','title','time_minutes','price','link', 'tags', 'ingredients']
         read_only = ['id']
+        list_serializer_class = RecipeListSerializer
 
     def create(self, validated_data):
         # Pop the tags data from validated_data
         tags_data = validated_data.pop('tags', [])
         ingredients_data = validated_data.pop('ingredients',[])
 
-        # Create the Recipe instance
-        recipe = Recipe.objects.create(**validated_data)
-
-        # Handle tag creation or get existing tags
-        for tag_data in tags_data:
-            tag_name = tag_data['name']
-            tag, created = Tag.objects.get_or_create(name=tag_name)
-            recipe.tags.add(tag)  # Add the tag to the recipe
+        with transaction.atomic():
+            # Create the Recipe instance
+            recipe = Recipe.objects.create(**validated_data)
 
-        for ingredient_data in ingredients_data:
-            ingredient, created = Ingredient.objects.get_or_create(name=ingredient_data['name'])
-            recipe.ingredients.add(ingredient)
+            # Resolve every name in bulk and link them with one insert each
+            if tags_data:
+                recipe.tags.add(*_resolve(Tag, tags_data))
+            if ingredients_data:
+                recipe.ingredients.add(*_resolve(Ingredient, ingredients_data))
 
         return recipe
 
-
     def update(self, instance, validated_data):
         # Handle updating the recipe including its tags
         tags_data = validated_data.pop('tags', None)
@@ -50,22 +165,17 @@ class RecipeSerializer(serializers.ModelSerializer):
         for attr,value in validated_data.items():
             setattr(instance, attr, value)
 
-        instance.save()
-
-        # If tags are provided, update the tags
-        if tags_data:
-            instance.tags.clear()  # Clear existing tags
-            for tag_data in tags_data:
-                tag, created = Tag.objects.get_or_create(name=tag_data['name'])
-                instance.tags.add(tag)
-
-        if ingredients_data:
-            instance.ingredients.clear()
-            for ingredient_data in ingredients_data:
-                ingredient, created = Ingredient.objects.get_or_create(name=ingredient_data['name'])
-                instance.ingredients.add(ingredient)
+        with transaction.atomic():
+            instance.save()
 
+            # If tags are provided, replace the existing ones
+            if tags_data:
+                instance.tags.set(_resolve(Tag, tags_data))
 
+            if ingredients_data:
+                instance.ingredients.set(
+                    _resolve(Ingredient, ingredients_data)
+                )
 
         return instance
 
@@ -76,13 +186,59 @@ class RecipeDetailSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ['description']
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeSearchSerializer(RecipeSerializer):
+    rank = serializers.FloatField(read_only=True)
+    # HTML: the recipe text escaped, the matched words in <mark> tags
+    headline = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['rank', 'headline']
+
+    def get_headline(self, recipe) -> str:
+        return render_headline(recipe.headline)
+
+
+class RecipeImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
-        read_only_fields = ['id']
+        fields = ['id', 'image', 'image_status', 'renditions']
+        read_only_fields = ['id', 'image_status']
         extra_kwargs = {'image': {'required': 'True'}}
 
-
-
+    def get_renditions(self, recipe) -> dict:
+        request = self.context.get('request')
+        urls = {}
+        for name, path in recipe.image_renditions.items():
+            url = default_storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class RecipeStatsCountSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class PriceBucketSerializer(serializers.Serializer):
+    min = serializers.DecimalField(max_digits=5, decimal_places=2)
+    # None for the open-ended top bucket
+    max = serializers.DecimalField(
+        max_digits=5, decimal_places=2, allow_null=True
+    )
+    recipe_count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(TimedSerializerMixin, serializers.Serializer):
+    """Read-only output of ``recipe.stats.user_stats``"""
+    recipe_count = serializers.IntegerField()
+    average_time_minutes = serializers.FloatField(allow_null=True)
+    average_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, allow_null=True
+    )
+
+    price_distribution = PriceBucketSerializer(many=True)
+    top_tags = RecipeStatsCountSerializer(many=True)
+    top_ingredients = RecipeStatsCountSerializer(many=True)
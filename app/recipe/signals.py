@@ -0,0 +1,162 @@
+"""
+Signal handlers invalidating the cached recipe reads and autocomplete
+answers, and keeping the recipe search vectors and summaries and the
+usage counts current
+"""
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from core import autocomplete
+from core.models import Recipe, Tag, Ingredient
+from recipe import cache, search, stats, usage
+
+
+def _recipes_referencing(field, obj):
+    return Recipe.objects.filter(**{field: obj}).values_list('id', flat=True)
+
+
+def _users_referencing(field, obj):
+    return (
+        Recipe.objects.filter(**{field: obj})
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    cache.bump_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+
+    if not reverse:
+        if action.startswith('post_'):
+            cache.bump_version(instance.user_id)
+    elif action == 'pre_clear':
+        # Cleared from the tag/ingredient side: the recipes are gone afterwards
+        field = 'tags' if sender is Recipe.tags.through else 'ingredients'
+        cache.bump_version(*_users_referencing(field, instance))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        cache.bump_version(*(
+            Recipe.objects.filter(pk__in=pk_set)
+            .values_list('user_id', flat=True)
+            .distinct()
+        ))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        cache.bump_version(*_users_referencing('tags', instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        cache.bump_version(*_users_referencing('ingredients', instance))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'title', 'description'} & set(update_fields):
+        search.update_search_vectors([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_search(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not reverse:
+        if action.startswith('post_'):
+            search.update_search_vectors([instance.pk])
+    elif action == 'pre_clear':
+        field = 'tags' if sender is Recipe.tags.through else 'ingredients'
+        instance._cleared_recipe_ids = list(
+            _recipes_referencing(field, instance)
+        )
+    elif action == 'post_clear':
+        search.update_search_vectors(
+            getattr(instance, '_cleared_recipe_ids', [])
+        )
+
+    elif action in ('post_add', 'post_remove') and pk_set:
+        search.update_search_vectors(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def name_saved_search(sender, instance, created, **kwargs):
+    if not created:
+        field = 'tags' if sender is Tag else 'ingredients'
+        search.update_search_vectors(_recipes_referencing(field, instance))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def name_deleting_search(sender, instance, **kwargs):
+    field = 'tags' if sender is Tag else 'ingredients'
+    instance._linked_recipe_ids = list(_recipes_referencing(field, instance))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def name_deleted_search(sender, instance, **kwargs):
+    search.update_search_vectors(getattr(instance, '_linked_recipe_ids', []))
+
+
+@receiver(post_init, sender=Recipe)
+def remember_stats_values(sender, instance, **kwargs):
+    stats.remember(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved_stats(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    if created:
+        stats.record_created([instance])
+    elif (
+        update_fields is None
+        or {'user', 'time_minutes', 'price'} & set(update_fields)
+    ):
+
+        stats.record_updated([instance])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted_stats(sender, instance, **kwargs):
+    stats.record_deleted([instance])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_usage(
+    sender, instance, action, reverse, model, pk_set, **kwargs
+):
+
+    usage.relations_changed(sender, instance, action, reverse, model, pk_set)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting_usage(sender, instance, **kwargs):
+    usage.recipe_deleting(instance)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def name_changed_autocomplete(sender, **kwargs):
+    autocomplete.invalidate(sender)
@@ -0,0 +1,180 @@
+"""
+Statistics over a user's recipes
+
+``user_stats`` returns the recipe count, average time and price, the price
+distribution and the most used tags and ingredients. With
+``RECIPE_STATS_SUMMARY`` the totals are read from the user's
+``RecipeSummary`` row, otherwise they are aggregated over the recipes in
+one query. Either way the tag and ingredient counts take one grouped query
+each.
+
+The tag and ingredient counts are not kept per user: a summary row would
+need every link write, including reverse and bulk ones, to know the users
+of the recipes it touches. ``_top`` instead groups the user's links in the
+through table, so its cost grows with the user's own links, never with the
+whole collection. Postgres reads it from indexes that already cover it,
+``core_recipe_user_id_desc`` for the recipe ids and the through table's
+``(recipe_id, <model>_id)`` unique index for the links, and looks up the
+names of the ``limit`` rows it returns only.
+
+The summary rows are kept current incrementally: the signal handlers in
+``recipe.signals`` pass single recipe writes to ``record_created``,
+``record_updated`` and ``record_deleted``, and the bulk write paths, which
+send no signals, call them with all the recipes they wrote.
+"""
+from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery
+
+from core.models import Ingredient, Recipe, RecipeSummary, Tag
+
+
+def remember(recipe):
+    """Keep the stored values a later write is compared with"""
+    values = recipe.__dict__
+    if 'time_minutes' in values and 'price' in values:
+        recipe._stats_values = (
+            recipe.user_id, values['time_minutes'], values['price']
+        )
+
+
+class _Changes:
+    # Per-user sums of the changes to RecipeSummary columns
+
+    def __init__(self):
+        self.users = {}
+
+    def add(self, user_id, recipes, time_minutes, price):
+        totals = self.users.get(user_id)
+        if totals is None:
+            totals = self.users[user_id] = [
+                0, 0, 0, [0] * (len(RecipeSummary.PRICE_BUCKETS) + 1),
+            ]
+        totals[0] += recipes
+        totals[1] += time_minutes * recipes
+        totals[2] += price * recipes
+        totals[3][RecipeSummary.price_bucket(price)] += recipes
+
+    def apply(self, create=False):
+        """Write the sums; returns the users that had no row to update"""
+        return [
+            user_id
+            for user_id, totals in self.users.items()
+            if not RecipeSummary.objects.add(user_id, *totals, create=create)
+        ]
+
+
+def record_created(recipes):
+    changes = _Changes()
+    for recipe in recipes:
+        changes.add(recipe.user_id, 1, recipe.time_minutes, recipe.price)
+        remember(recipe)
+    changes.apply(create=True)
+
+
+def record_updated(recipes):
+    changes = _Changes()
+    stale = set()
+    for recipe in recipes:
+        old = getattr(recipe, '_stats_values', None)
+        new = (recipe.user_id, recipe.time_minutes, recipe.price)
+        if old is None or old[0] != new[0]:
+            # Loaded without its values, or moved to another user
+            stale.add(new[0])
+            if old is not None:
+                stale.add(old[0])
+        elif old != new:
+            changes.add(old[0], -1, old[1], old[2])
+            changes.add(new[0], 1, new[1], new[2])
+        remember(recipe)
+    stale.update(changes.apply())
+    if stale:
+        RecipeSummary.objects.refresh(stale)
+
+
+def record_deleted(recipes):
+    changes = _Changes()
+    stale = set()
+    for recipe in recipes:
+        old = getattr(recipe, '_stats_values', None)
+        if old is None:
+            stale.add(recipe.user_id)
+        else:
+            changes.add(old[0], -1, old[1], old[2])
+    # A user without a row has nothing to subtract from; during a cascading
+    # user delete the row is already gone
+    changes.apply()
+    if stale:
+        RecipeSummary.objects.refresh(stale)
+
+
+def _totals(user):
+    summary = None
+    if settings.RECIPE_STATS_SUMMARY:
+        summary = RecipeSummary.objects.filter(user=user).first()
+    if summary is None:
+        # A user without recipes has no row either
+        return _totals_from_recipes(user)
+    return {
+        'recipe_count': summary.recipe_count,
+        'time_minutes_total': summary.time_minutes_total,
+        'price_total': summary.price_total,
+        'price_buckets': summary.price_buckets,
+    }
+
+
+def _totals_from_recipes(user):
+    row = Recipe.objects.filter(user=user).aggregate(
+        **RecipeSummary.aggregates()
+    )
+    return {
+        'recipe_count': row['recipe_count'],
+        'time_minutes_total': row['time_minutes_total'] or 0,
+        'price_total': row['price_total'] or 0,
+        'price_buckets': [
+            row[f'bucket_{index}']
+            for index in range(len(RecipeSummary.PRICE_BUCKETS) + 1)
+        ],
+    }
+
+
+def _top(model, field, user, limit):
+    column = f'{model._meta.model_name}_id'
+    # The name subquery is evaluated after the LIMIT
+    name = model.objects.filter(pk=OuterRef(column)).values('name')
+    rows = (
+        getattr(Recipe, field).through.objects.filter(recipe__user=user)
+        .values(column)
+        .annotate(recipe_count=Count('recipe_id'))
+        .order_by('-recipe_count', column)
+        .annotate(name=Subquery(name))[:limit]
+    )
+    return [
+        {
+            'id': row[column],
+            'name': row['name'],
+            'recipe_count': row['recipe_count'],
+        }
+        for row in rows
+    ]
+
+
+def user_stats(user, top=None):
+    """The statistics ``RecipeStatsSerializer`` renders"""
+    top = settings.RECIPE_STATS_TOP if top is None else top
+    totals = _totals(user)
+    count = totals['recipe_count']
+    bounds = (0,) + RecipeSummary.PRICE_BUCKETS + (None,)
+    buckets = zip(bounds, bounds[1:], totals['price_buckets'])
+    return {
+        'recipe_count': count,
+        'average_time_minutes': (
+            totals['time_minutes_total'] / count if count else None
+        ),
+        'average_price': totals['price_total'] / count if count else None,
+        'price_distribution': [
+            {'min': low, 'max': high, 'recipe_count': recipes}
+            for low, high, recipes in buckets
+        ],
+        'top_tags': _top(Tag, 'tags', user, top),
+        'top_ingredients': _top(Ingredient, 'ingredients', user, top),
+    }
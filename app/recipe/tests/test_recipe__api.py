@@ -1,17 +1,36 @@
 from decimal import Decimal
+import csv
+import hashlib
+import io
 import json
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 import tempfile
 import os
+from unittest.mock import patch
 from PIL import Image
-from core.models import Recipe, Tag, Ingredient
+from core.pagination import IdCursorPagination
+from core.models import ImageBlob, Recipe, RecipeSummary, Tag, Ingredient
+from core import autocomplete
+from recipe import exports, images, usage
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 RECIPES_URL = reverse("recipe:recipe-list")
+BULK_URL = reverse("recipe:recipe-bulk")
+EXPORT_URL = reverse("recipe:recipe-export")
+SEARCH_URL = reverse("recipe:recipe-search")
+STATS_URL = reverse("recipe:recipe-stats")
+INGREDIENT_AUTOCOMPLETE_URL = reverse("recipe:ingredient-autocomplete")
+TAG_AUTOCOMPLETE_URL = reverse("tags:tag-autocomplete")
 # INGREDIENTS_URL = reverse("recipe:ingredient-list")
 
 
@@ -22,6 +41,10 @@ def image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def image_status_url(recipe_id):
+    return reverse('recipe:recipe-image-status', args=[recipe_id])
+
+
 def create_recipe(user, **params):
     defaults = {
         "title": "Sample recipe",
@@ -33,10 +56,10 @@ def create_recipe(user, **params):
 
     defaults.update(params)
 
-    tag1 = Tag.objects.create(name="Original Tag 1")
-    tag2 = Tag.objects.create(name="Original Tag 2")
-    ingredient1 = Ingredient.objects.create(name='Ingredient 1')
-    ingredient2 = Ingredient.objects.create(name='Ingredient 2')
+    tag1, _ = Tag.objects.get_or_create(name="Original Tag 1")
+    tag2, _ = Tag.objects.get_or_create(name="Original Tag 2")
+    ingredient1, _ = Ingredient.objects.get_or_create(name='Ingredient 1')
+    ingredient2, _ = Ingredient.objects.get_or_create(name='Ingredient 2')
     recipe = Recipe.objects.create(user=user, **defaults)
 
     recipe.tags.add(tag1, tag2)
@@ -78,7 +101,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.all().order_by("-id")
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
 
@@ -92,7 +115,36 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
+
+    def test_recipe_list_paginated(self):
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+
+        res = self.client.get(RECIPES_URL, {"page_size": 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["id"] for item in res.data["results"]],
+            [recipes[2].id, recipes[1].id],
+        )
+        self.assertIsNone(res.data["previous"])
+
+        res = self.client.get(res.data["next"])
+
+        self.assertEqual(
+            [item["id"] for item in res.data["results"]], [recipes[0].id]
+        )
+        self.assertIsNone(res.data["next"])
+
+    def test_recipe_list_page_size_capped(self):
+        create_recipe(user=self.user)
+
+        with patch.object(IdCursorPagination, "max_page_size", 1):
+            create_recipe(user=self.user)
+            res = self.client.get(RECIPES_URL, {"page_size": 50})
+
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertIsNotNone(res.data["next"])
 
     def test_get_recipe_detail(self):
         recipe = create_recipe(user=self.user)
@@ -280,6 +332,1027 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(ingredients.count(), 2)
 
 
+class RecipeFilterTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(name="Vegan")
+        self.quick = Tag.objects.create(name="Quick")
+        self.salt = Ingredient.objects.create(name="Salt")
+        self.both = self.make_recipe(
+            "Both", [self.vegan, self.quick],
+            time_minutes=10, price=Decimal("3.00"),
+        )
+        self.vegan_only = self.make_recipe(
+            "Vegan", [self.vegan], time_minutes=30, price=Decimal("8.00")
+        )
+        self.plain = self.make_recipe(
+            "Plain", [], time_minutes=60, price=Decimal("12.00")
+        )
+        self.vegan_only.ingredients.add(self.salt)
+
+    def make_recipe(self, title, tags, **params):
+        recipe = Recipe.objects.create(user=self.user, title=title, **params)
+        recipe.tags.add(*tags)
+        return recipe
+
+    def ids(self, **params):
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item["id"] for item in res.data["results"]]
+
+    def test_filter_by_tags_any(self):
+        ids = self.ids(tags=f"{self.vegan.id},{self.quick.id}")
+
+        self.assertEqual(ids, [self.vegan_only.id, self.both.id])
+
+    def test_filter_by_tags_all(self):
+        ids = self.ids(
+            tags=f"{self.vegan.id},{self.quick.id}", tags_match="all"
+        )
+
+        self.assertEqual(ids, [self.both.id])
+
+    def test_filter_by_ingredients(self):
+        ids = self.ids(ingredients=str(self.salt.id))
+
+        self.assertEqual(ids, [self.vegan_only.id])
+
+    def test_filter_by_ranges(self):
+        self.assertEqual(
+            self.ids(min_time=20), [self.plain.id, self.vegan_only.id]
+        )
+        self.assertEqual(
+            self.ids(max_price="8.00"), [self.vegan_only.id, self.both.id]
+        )
+        self.assertEqual(
+            self.ids(min_time=20, max_price="10"), [self.vegan_only.id]
+        )
+
+    def test_filter_invalid_params(self):
+        for params in (
+            {"tags": "a,b"},
+            {"tags": "1", "tags_match": "some"},
+            {"min_price": "cheap"},
+        ):
+
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeSearchTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+
+    def search(self, text, **params):
+        res = self.client.get(SEARCH_URL, {"q": text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res
+
+    def test_search_ranks_title_matches_first(self):
+        in_description = Recipe.objects.create(
+            user=self.user, title="Stew",
+            time_minutes=5, price=Decimal("1.00"),
+            description="Slow cooked with tomatoes",
+        )
+        in_title = Recipe.objects.create(
+            user=self.user, title="Tomato soup",
+            time_minutes=5, price=Decimal("1.00"),
+        )
+        Recipe.objects.create(
+            user=self.user, title="Pancakes",
+            time_minutes=5, price=Decimal("1.00"),
+        )
+
+        res = self.search("tomato")
+
+        ids = [item["id"] for item in res.data["results"]]
+        self.assertEqual(ids, [in_title.id, in_description.id])
+        first = res.data["results"][0]
+        self.assertIn("<mark>Tomato</mark>", first["headline"])
+        self.assertGreater(first["rank"], 0)
+
+    def test_search_headline_escaped(self):
+        Recipe.objects.create(
+            user=self.user, title="Tomato <img src=x onerror=alert(1)",
+            description="\x02Tomato\x03 & basil",
+            time_minutes=5, price=Decimal("1.00"),
+        )
+
+        headline = self.search("tomato").data["results"][0]["headline"]
+
+        self.assertIn(" &amp; basil", headline)
+        self.assertEqual(headline.count("<mark>"), 2)
+        self.assertEqual(headline.count("</mark>"), 2)
+        self.assertNotIn(
+            "<", headline.replace("<mark>", "").replace("</mark>", "")
+        )
+
+    def test_search_matches_tags_and_ingredients(self):
+        recipe = create_recipe(user=self.user, title="Dinner")
+        recipe.tags.add(Tag.objects.create(name="Vegetarian"))
+
+        self.assertEqual(
+            self.search("vegetarian").data["results"][0]["id"], recipe.id
+        )
+
+        recipe.ingredients.set([Ingredient.objects.create(name="Paprika")])
+
+        self.assertEqual(len(self.search("paprika").data["results"]), 1)
+        self.assertEqual(len(self.search("vegetarian").data["results"]), 1)
+
+    def test_search_follows_tag_rename(self):
+        recipe = create_recipe(user=self.user)
+        tag = recipe.tags.first()
+        tag.name = "Barbecue"
+        tag.save()
+
+        self.assertEqual(
+            self.search("barbecue").data["results"][0]["id"], recipe.id
+        )
+
+    def test_search_limited_to_user(self):
+        other_user = create_user(email="other@example.com", password="test123")
+        create_recipe(user=other_user, title="Secret curry")
+
+        self.assertEqual(self.search("curry").data["results"], [])
+
+    def test_search_paginated(self):
+        for i in range(3):
+            create_recipe(user=self.user, title=f"Curry {i}")
+
+        res = self.search("curry", page_size=2)
+
+        self.assertEqual(len(res.data["results"]), 2)
+        res = self.client.get(res.data["next"])
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertIsNone(res.data["next"])
+
+    def test_bulk_created_recipes_searchable(self):
+        self.client.post(
+            BULK_URL,
+            data=json.dumps(
+                [{"title": "Lentil dal", "time_minutes": 1, "price": "1.00"}]
+            ),
+            content_type="application/json",
+        )
+
+        self.assertEqual(len(self.search("lentil").data["results"]), 1)
+
+    def test_search_requires_query(self):
+        res = self.client.get(SEARCH_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeQueryCountTests(TestCase):
+    """Guard against N+1 queries on the recipe read endpoints."""
+
+    # recipes + prefetched tags + prefetched ingredients
+    LIST_QUERIES = 3
+    DETAIL_QUERIES = 3
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count):
+        return [create_recipe(user=self.user) for _ in range(count)]
+
+    def test_list_query_count_is_constant(self):
+        for count in (1, 10):
+            self.create_recipes(count)
+            with self.assertNumQueries(self.LIST_QUERIES):
+                res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deep_page_query_count(self):
+        self.create_recipes(5)
+        res = self.client.get(RECIPES_URL, {"page_size": 1})
+        for _ in range(3):
+            res = self.client.get(res.data["next"])
+
+        with self.assertNumQueries(self.LIST_QUERIES):
+            res = self.client.get(res.data["next"])
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_detail_query_count(self):
+        recipe = self.create_recipes(1)[0]
+
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["tags"]), 2)
+        self.assertEqual(len(res.data["ingredients"]), 2)
+
+    def test_partial_update_returns_fresh_relations(self):
+        recipe = self.create_recipes(1)[0]
+        payload = {"tags": [{"name": "Updated Tag"}]}
+
+        res = self.client.patch(
+            detail_url(recipe.id),
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag["name"] for tag in res.data["tags"]], ["Updated Tag"]
+        )
+
+
+class SparseFieldsTests(TestCase):
+    """?fields= and ?expand= on the recipe read endpoints."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_fields_trim_response_and_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {"fields": "id,title"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["results"],
+            [{"id": self.recipe.id, "title": "Sample recipe"}],
+        )
+        # No prefetches, and only the requested columns
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("description", queries[0]["sql"])
+        self.assertNotIn("price", queries[0]["sql"])
+
+    def test_expand_adds_relation(self):
+        with self.assertNumQueries(2):
+            res = self.client.get(
+                RECIPES_URL, {"fields": "title", "expand": "tags"}
+            )
+
+        self.assertEqual(list(res.data["results"][0]), ["title", "tags"])
+        self.assertEqual(len(res.data["results"][0]["tags"]), 2)
+
+    def test_expand_alone_keeps_scalar_fields(self):
+        res = self.client.get(
+            detail_url(self.recipe.id), {"expand": "ingredients"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("description", res.data)
+        self.assertIn("ingredients", res.data)
+        self.assertNotIn("tags", res.data)
+
+    def test_no_params_returns_everything(self):
+        res = self.client.get(detail_url(self.recipe.id))
+
+        serializer = RecipeDetailSerializer(self.recipe)
+        self.assertEqual(res.data, serializer.data)
+
+    def test_unknown_fields_rejected(self):
+        res = self.client.get(
+            RECIPES_URL, {"fields": "id,secret", "expand": "title"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("fields", res.data)
+        self.assertIn("expand", res.data)
+
+    def test_search_fields(self):
+        res = self.client.get(SEARCH_URL, {"q": "sample", "fields": "id,rank"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(res.data["results"][0]), ["id", "rank"])
+
+
+class RecipeStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+
+    def assertSummaryCurrent(self):
+        # The incrementally kept row matches a fresh aggregate, and both
+        # ways of answering agree
+        summary = RecipeSummary.objects.get(user=self.user)
+        RecipeSummary.objects.refresh([self.user.id])
+        fresh = RecipeSummary.objects.get(user=self.user)
+
+        def values(row):
+            return (
+                row.recipe_count, row.time_minutes_total, row.price_total,
+                row.price_buckets,
+            )
+
+        self.assertEqual(values(summary), values(fresh))
+        cache.clear()
+        with_summary = self.client.get(STATS_URL).data
+        cache.clear()
+        with override_settings(RECIPE_STATS_SUMMARY=False):
+            without_summary = self.client.get(STATS_URL).data
+        self.assertEqual(with_summary, without_summary)
+        return with_summary
+
+    def test_stats(self):
+        create_recipe(user=self.user, time_minutes=10, price=Decimal("4.50"))
+        recipe = create_recipe(
+            user=self.user, time_minutes=30, price=Decimal("12.00")
+        )
+        recipe.tags.add(Tag.objects.create(name="Vegan"))
+        create_recipe(
+            user=create_user(email="other@example.com", password="test123")
+        )
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["recipe_count"], 2)
+        self.assertEqual(res.data["average_time_minutes"], 20.0)
+        self.assertEqual(res.data["average_price"], "8.25")
+        self.assertEqual(
+            [
+                (bucket["min"], bucket["max"], bucket["recipe_count"])
+                for bucket in res.data["price_distribution"]
+            ],
+            [("0.00", "5.00", 1), ("5.00", "10.00", 0), ("10.00", "20.00", 1),
+             ("20.00", "50.00", 0), ("50.00", None, 0)],
+        )
+        self.assertEqual(
+            [
+                (tag["name"], tag["recipe_count"])
+                for tag in res.data["top_tags"]
+            ],
+            [("Original Tag 1", 2), ("Original Tag 2", 2), ("Vegan", 1)],
+        )
+        self.assertEqual(len(res.data["top_ingredients"]), 2)
+
+    def test_no_recipes(self):
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data["recipe_count"], 0)
+        self.assertIsNone(res.data["average_price"])
+        self.assertEqual(res.data["top_tags"], [])
+
+    def test_top_limit(self):
+        create_recipe(user=self.user)
+
+        with override_settings(RECIPE_STATS_TOP=1):
+            res = self.client.get(STATS_URL)
+
+        self.assertEqual(len(res.data["top_tags"]), 1)
+
+    def test_query_count(self):
+        create_recipe(user=self.user)
+
+        # Summary row, tags and ingredients
+        with self.assertNumQueries(3):
+            self.client.get(STATS_URL)
+        # Then the cached response
+        with self.assertNumQueries(0):
+            self.client.get(STATS_URL)
+
+    def test_summary_follows_single_writes(self):
+        recipe = create_recipe(user=self.user, price=Decimal("3.00"))
+        self.client.post(
+            RECIPES_URL,
+            {"title": "New", "time_minutes": 40, "price": "60.00"},
+            format="json",
+        )
+        self.client.patch(
+            detail_url(recipe.id),
+            {"price": "15.00", "time_minutes": 5},
+            format="json",
+        )
+        self.assertEqual(self.assertSummaryCurrent()["recipe_count"], 2)
+
+        self.client.delete(detail_url(recipe.id))
+        data = self.assertSummaryCurrent()
+        self.assertEqual(data["recipe_count"], 1)
+        self.assertEqual(data["average_price"], "60.00")
+
+    def test_summary_follows_bulk_writes(self):
+        res = self.client.post(BULK_URL, [
+            {"title": "One", "time_minutes": 5, "price": "2.00"},
+            {"title": "Two", "time_minutes": 15, "price": "25.00"},
+        ], format="json")
+        ids = [item["id"] for item in res.data]
+        self.assertSummaryCurrent()
+
+        self.client.patch(
+            BULK_URL, [{"id": ids[0], "price": "7.00"}], format="json"
+        )
+        buckets = self.assertSummaryCurrent()["price_distribution"]
+        self.assertEqual(buckets[1]["recipe_count"], 1)
+
+        self.client.delete(BULK_URL, ids[1:], format="json")
+        self.assertEqual(self.assertSummaryCurrent()["recipe_count"], 1)
+
+    def test_deferred_recipe_refreshes_summary(self):
+        recipe = create_recipe(user=self.user, time_minutes=10)
+        deferred = Recipe.objects.only("id", "user_id").get(pk=recipe.pk)
+        deferred.time_minutes = 50
+        deferred.save()
+
+        self.assertEqual(
+            self.assertSummaryCurrent()["average_time_minutes"], 50.0
+        )
+
+    def test_user_delete(self):
+        create_recipe(user=self.user)
+
+        self.user.delete()
+
+        self.assertFalse(RecipeSummary.objects.exists())
+
+
+class UsageCountTests(TestCase):
+    """Tag and ingredient usage_count follows every way of linking recipes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+
+    def assertCounts(self, model, expected):
+        # Maintained counts equal a recount, which therefore fixes nothing
+        self.assertEqual(
+            dict(model.objects.values_list("name", "usage_count")), expected
+        )
+        self.assertEqual(usage.recount(model), 0)
+
+    def test_api_writes(self):
+        payload = {
+            "title": "Soup", "time_minutes": 10, "price": "2.00",
+            "tags": [{"name": "Dinner"}, {"name": "Quick"}],
+            "ingredients": [{"name": "Salt"}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format="json")
+        recipe_id = res.data["id"]
+        self.client.post(RECIPES_URL, payload, format="json")
+        self.assertCounts(Tag, {"Dinner": 2, "Quick": 2})
+
+        self.client.patch(
+            detail_url(recipe_id),
+            {"tags": [{"name": "Dinner"}, {"name": "Vegan"}]},
+            format="json",
+        )
+        self.assertCounts(Tag, {"Dinner": 2, "Quick": 1, "Vegan": 1})
+
+        self.client.delete(detail_url(recipe_id))
+        self.assertCounts(Tag, {"Dinner": 1, "Quick": 1, "Vegan": 0})
+        self.assertCounts(Ingredient, {"Salt": 1})
+
+    def test_bulk_writes(self):
+        res = self.client.post(BULK_URL, [
+            {
+                "title": "One", "time_minutes": 5, "price": "2.00",
+                "tags": [{"name": "Dinner"}],
+            },
+            {
+                "title": "Two", "time_minutes": 5, "price": "2.00",
+                "tags": [{"name": "Dinner"}, {"name": "Quick"}],
+            },
+        ], format="json")
+        ids = [item["id"] for item in res.data]
+        self.assertCounts(Tag, {"Dinner": 2, "Quick": 1})
+
+        self.client.patch(BULK_URL, [
+            {"id": ids[0], "tags": [{"name": "Quick"}]},
+            {"id": ids[1], "tags": [{"name": "Quick"}, {"name": "Vegan"}]},
+        ], format="json")
+        self.assertCounts(Tag, {"Dinner": 0, "Quick": 2, "Vegan": 1})
+
+        self.client.delete(BULK_URL, ids, format="json")
+        self.assertCounts(Tag, {"Dinner": 0, "Quick": 0, "Vegan": 0})
+
+    def test_names_differing_in_case_count_once(self):
+        Tag.objects.create(name="Salt")
+
+        self.client.post(BULK_URL, [
+            {
+                "title": "One", "time_minutes": 5, "price": "2.00",
+                "tags": [{"name": "Salt"}, {"name": "salt"}],
+            },
+        ], format="json")
+
+        self.assertCounts(Tag, {"Salt": 1})
+
+    def test_related_manager_writes(self):
+        dinner = Tag.objects.create(name="Dinner")
+        quick = Tag.objects.create(name="Quick")
+        first = Recipe.objects.create(
+            user=self.user, title="One", time_minutes=5, price=Decimal("1")
+        )
+        second = Recipe.objects.create(
+            user=self.user, title="Two", time_minutes=5, price=Decimal("1")
+        )
+
+        first.tags.add(dinner, quick)
+        dinner.recipe_set.add(first, second)
+        self.assertCounts(Tag, {"Dinner": 2, "Quick": 1})
+
+        # Removing links that do not exist changes nothing
+        second.tags.remove(dinner, quick)
+        dinner.recipe_set.remove(second)
+        self.assertCounts(Tag, {"Dinner": 1, "Quick": 1})
+
+        first.tags.clear()
+        self.assertCounts(Tag, {"Dinner": 0, "Quick": 0})
+
+        dinner.recipe_set.add(first, second)
+        dinner.recipe_set.clear()
+        self.assertCounts(Tag, {"Dinner": 0, "Quick": 0})
+
+    def test_user_delete(self):
+        create_recipe(user=self.user)
+
+        self.user.delete()
+
+        self.assertCounts(Tag, {"Original Tag 1": 0, "Original Tag 2": 0})
+
+    def test_recount_repairs_drift(self):
+        create_recipe(user=self.user)
+        Tag.objects.update(usage_count=7)
+
+        self.assertEqual(usage.recount(Tag, batch_size=1), 2)
+        self.assertCounts(Tag, {"Original Tag 1": 1, "Original Tag 2": 1})
+
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        autocomplete.clear_cache()
+        self.addCleanup(autocomplete.clear_cache)
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+        uses = [
+            ("Tomato", 3), ("tomatillo", 5), ("Tofu", 1), ("Thyme", 9),
+            ("Tom_yum", 0),
+        ]
+        for name, count in uses:
+            Ingredient.objects.create(name=name)
+            Ingredient.objects.filter(name=name).update(usage_count=count)
+
+    def names(self, res):
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item["name"] for item in res.data]
+
+    def suggest(self, params, url=INGREDIENT_AUTOCOMPLETE_URL):
+        return self.names(self.client.get(url, params))
+
+    def test_prefix_matches_by_usage(self):
+        res = self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {"q": "TO"})
+
+        self.assertEqual(
+            self.names(res), ["tomatillo", "Tomato", "Tofu", "Tom_yum"]
+        )
+        self.assertEqual(
+            res.data[0],
+            {"id": res.data[0]["id"], "name": "tomatillo", "usage_count": 5},
+        )
+
+    def test_limit_and_wildcards(self):
+        self.assertEqual(
+            self.suggest({"q": "to", "limit": 2}), ["tomatillo", "Tomato"]
+        )
+        self.assertEqual(self.suggest({"q": "tom_"}), ["Tom_yum"])
+
+    def test_prefix_required(self):
+        res = self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {"q": " "})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_longer_prefixes_served_from_cache(self):
+        self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {"q": "to"})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.suggest({"q": "toma"}), ["tomatillo", "Tomato"]
+            )
+
+    def test_cached_matches_agree_with_database(self):
+        # Whatever LOWER() does with non-ASCII names under the database
+        # locale, filtering a cached answer must give the same result
+        Ingredient.objects.create(name="Éclair")
+        queried = self.suggest({"q": "éc"})
+        autocomplete.clear_cache()
+        self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {"q": "é"})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest({"q": "éc"}), queried)
+
+    def test_incomplete_prefix_not_reused(self):
+        self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {"q": "t", "limit": 2})
+
+        with self.assertNumQueries(1):
+            names = self.suggest({"q": "tof", "limit": 2})
+        self.assertEqual(names, ["Tofu"])
+
+    def test_writes_invalidate_cache(self):
+        self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {"q": "to"})
+
+        self.client.post(reverse("recipe:ingredient-list"), {"name": "Toast"})
+        self.assertIn("Toast", self.suggest({"q": "toa"}))
+
+        tofu = Ingredient.objects.get(name="Tofu")
+        self.client.patch(
+            reverse("recipe:ingredient-detail", args=[tofu.id]),
+            {"name": "Bean curd"},
+        )
+        self.assertNotIn("Tofu", self.suggest({"q": "to"}))
+
+    @override_settings(
+        AUTOCOMPLETE_CACHE={**settings.AUTOCOMPLETE_CACHE, "ENABLED": False}
+    )
+    def test_cache_can_be_turned_off(self):
+        self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {"q": "to"})
+
+        with self.assertNumQueries(1):
+            self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {"q": "to"})
+
+    def test_tags(self):
+        Tag.objects.create(name="Dinner")
+        Tag.objects.create(name="Breakfast")
+
+        self.assertEqual(
+            self.suggest({"q": "din"}, url=TAG_AUTOCOMPLETE_URL), ["Dinner"]
+        )
+
+    def test_prefix_index_used(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+        plan = Ingredient.objects.filter_name_prefix("tom").explain()
+
+        self.assertIn("core_ingredient_name_prefix", plan)
+
+
+class RecipeWriteQueryTests(TestCase):
+    """Tag and ingredient names are resolved in bulk on writes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+
+    def post_recipe(self, tag_count, ingredient_count):
+        payload = {
+            "title": "Bulk recipe",
+            "time_minutes": 10,
+            "price": "5.00",
+            "tags": [{"name": f"Tag {i}"} for i in range(tag_count)],
+            "ingredients": [
+                {"name": f"Ingredient {i}"} for i in range(ingredient_count)
+            ],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(
+                RECIPES_URL,
+                data=json.dumps(payload),
+                content_type="application/json",
+            )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return len(queries)
+
+    def test_create_query_count_independent_of_relations(self):
+        small = self.post_recipe(tag_count=2, ingredient_count=2)
+        large = self.post_recipe(tag_count=10, ingredient_count=30)
+
+        self.assertEqual(small, large)
+
+    def test_create_reuses_existing_names(self):
+        existing = Tag.objects.create(name="Dinner")
+        payload = {
+            "title": "Soup",
+            "time_minutes": 10,
+            "price": "5.00",
+            "tags": [
+                {"name": "Dinner"}, {"name": "Quick"}, {"name": "dinner"}
+            ],
+        }
+
+        res = self.client.post(
+            RECIPES_URL,
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data["id"])
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertIn(existing, recipe.tags.all())
+        self.assertEqual(recipe.tags.count(), 2)
+
+    def test_update_query_count_independent_of_relations(self):
+        recipe = create_recipe(user=self.user)
+        counts = []
+        for size in (2, 30):
+            payload = {
+                "ingredients": [
+                    {"name": f"New {size} {i}"} for i in range(size)
+                ]
+            }
+
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.patch(
+                    detail_url(recipe.id),
+                    data=json.dumps(payload),
+                    content_type="application/json",
+                )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(recipe.ingredients.count(), 30)
+
+
+class BulkRecipeAPITests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, payload):
+        return getattr(self.client, method)(
+            BULK_URL, data=json.dumps(payload), content_type="application/json"
+        )
+
+    def test_bulk_create(self):
+        payload = [
+            {
+                "title": f"Recipe {i}",
+                "time_minutes": 10,
+                "price": "5.00",
+                "tags": [{"name": "Shared"}, {"name": f"Tag {i}"}],
+                "ingredients": [{"name": "Salt"}],
+            }
+            for i in range(3)
+        ]
+
+        res = self.send("post", payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [item["title"] for item in res.data],
+            ["Recipe 0", "Recipe 1", "Recipe 2"],
+        )
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Tag.objects.filter(name="Shared").count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        for item in res.data:
+            recipe = Recipe.objects.get(id=item["id"])
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.ingredients.count(), 1)
+
+    def test_bulk_create_invalid_item_creates_nothing(self):
+        payload = [
+            {"title": "Valid", "time_minutes": 10, "price": "5.00"},
+            {"title": "Missing price", "time_minutes": 10},
+        ]
+
+        res = self.send("post", payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn("price", res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_BULK_MAX_ITEMS=1)
+    def test_bulk_create_limit(self):
+        payload = [{"title": "A", "time_minutes": 1, "price": "1.00"}] * 2
+
+        res = self.send("post", payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update(self):
+        first = create_recipe(user=self.user, title="First")
+        second = create_recipe(user=self.user, title="Second")
+        payload = [
+            {"id": second.id, "title": "Second updated"},
+            {"id": first.id, "tags": [{"name": "Replaced"}]},
+        ]
+
+        res = self.send("patch", payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["id"] for item in res.data], [second.id, first.id]
+        )
+        second.refresh_from_db()
+        self.assertEqual(second.title, "Second updated")
+        self.assertEqual(second.tags.count(), 2)
+        self.assertEqual([tag.name for tag in first.tags.all()], ["Replaced"])
+
+    def test_bulk_update_other_users_recipe(self):
+        other_user = create_user(email="other@example.com", password="test123")
+        recipe = create_recipe(user=other_user)
+
+        res = self.send("patch", [{"id": recipe.id, "title": "Hijacked"}])
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "Sample recipe")
+
+    def test_bulk_boolean_ids_rejected(self):
+        # True would otherwise be looked up as recipe 1
+        res = self.send("patch", [{"id": True, "title": "Changed"}])
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.send("delete", [True, False])
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_delete(self):
+        own = create_recipe(user=self.user)
+        other_user = create_user(email="other@example.com", password="test123")
+        other = create_recipe(user=other_user)
+
+        res = self.send("delete", [own.id, other.id])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data, {"deleted": [own.id], "not_found": [other.id]}
+        )
+        self.assertFalse(Recipe.objects.filter(id=own.id).exists())
+        self.assertTrue(Recipe.objects.filter(id=other.id).exists())
+
+
+class RecipeExportTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        res = self.client.get(EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return b"".join(res.streaming_content).decode()
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_ndjson(self):
+        recipes = [
+            create_recipe(user=self.user, title=f"Recipe {i}")
+            for i in range(3)
+        ]
+        other_user = create_user(email="other@example.com", password="test123")
+        create_recipe(user=other_user)
+
+        lines = self.export().splitlines()
+
+        self.assertEqual(len(lines), 3)
+        first = json.loads(lines[0])
+        self.assertEqual(first["id"], recipes[0].id)
+        self.assertEqual(first["price"], "5.25")
+        self.assertEqual(first["tags"], ["Original Tag 1", "Original Tag 2"])
+        self.assertEqual(
+            first["ingredients"], ["Ingredient 1", "Ingredient 2"]
+        )
+
+    def test_export_csv(self):
+        create_recipe(user=self.user)
+
+        rows = list(csv.DictReader(io.StringIO(self.export(output="csv"))))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["title"], "Sample recipe")
+        self.assertEqual(rows[0]["tags"], "Original Tag 1|Original Tag 2")
+
+    def test_csv_names_round_trip(self):
+        names = ["Sweet|Sour", 'Say "cheese"', "Plain"]
+
+        cell = exports.join_names(names)
+
+        self.assertEqual(exports.join_names(["Plain", "Quick"]), "Plain|Quick")
+        self.assertEqual(exports.split_names(cell), names)
+        self.assertEqual(exports.split_names(""), [])
+
+    def test_export_unknown_output(self):
+        res = self.client.get(EXPORT_URL, {"output": "xml"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_repeated_reads_served_from_cache(self):
+        self.client.get(RECIPES_URL)
+        self.client.get(detail_url(self.recipe.id))
+
+        with self.assertNumQueries(0):
+            list_res = self.client.get(RECIPES_URL)
+            detail_res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(list_res.data["results"][0]["id"], self.recipe.id)
+        self.assertEqual(detail_res.data["id"], self.recipe.id)
+
+    def test_if_none_match_returns_not_modified(self):
+        res = self.client.get(detail_url(self.recipe.id))
+        etag = res["ETag"]
+
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res["ETag"], etag)
+
+    def test_if_none_match_list(self):
+        etag = self.client.get(detail_url(self.recipe.id))["ETag"]
+
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_NONE_MATCH=f'"other", W/{etag}',
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A tag containing the current one is a different tag
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_NONE_MATCH=f'"x{etag[1:-1]}x"',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_if_none_match_any(self):
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH="*"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertTrue(res["ETag"])
+
+        res = self.client.get(detail_url(0), HTTP_IF_NONE_MATCH="*")
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_invalidates_cache(self):
+        res = self.client.get(detail_url(self.recipe.id))
+        etag = res["ETag"]
+
+        self.client.patch(detail_url(self.recipe.id), {"title": "Changed"})
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["title"], "Changed")
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_tag_rename_invalidates_cache(self):
+        self.client.get(RECIPES_URL)
+        tag = self.recipe.tags.first()
+
+        tag.name = "Renamed"
+        tag.save()
+        res = self.client.get(RECIPES_URL)
+
+        names = [t["name"] for t in res.data["results"][0]["tags"]]
+        self.assertIn("Renamed", names)
+
+    def test_bulk_create_invalidates_cache(self):
+        self.client.get(RECIPES_URL)
+
+        self.client.post(
+            BULK_URL,
+            data=json.dumps(
+                [{"title": "Bulk", "time_minutes": 1, "price": "1.00"}]
+            ),
+            content_type="application/json",
+        )
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data["results"]), 2)
+
+    def test_other_users_do_not_share_cache(self):
+        self.client.get(RECIPES_URL)
+        other_user = create_user(email="other@example.com", password="test123")
+        self.client.force_authenticate(other_user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data["results"], [])
+
+
 class ImageUploadTests(TestCase):
 
     def setUp(self):
@@ -329,4 +1402,304 @@ class ImageUploadTests(TestCase):
         payload = {'image': 'notanimage'}
         res = self.client.post(url, payload, format='multipart')
 
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StreamingImageUploadTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+        self.upload_dir = os.path.join(
+            settings.MEDIA_ROOT, "uploads", "recipe"
+        )
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.existing = set(os.listdir(self.upload_dir))
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        self.recipe.image.delete()
+
+    def post(self, content, name="photo.png"):
+        upload = io.BytesIO(content)
+        upload.name = name
+        return self.client.post(
+            image_upload_url(self.recipe.id), {"image": upload},
+            format="multipart",
+        )
+
+    def png(self, size=(10, 10)):
+        buffer = io.BytesIO()
+        Image.new("RGB", size).save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def jpeg_with_long_header(self):
+        # The dimensions follow a 4 KB comment segment
+        buffer = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(buffer, "JPEG", comment=b"x" * 4096)
+        return buffer.getvalue()
+
+    def assertNoNewFiles(self):
+        self.assertEqual(set(os.listdir(self.upload_dir)), self.existing)
+
+    def test_upload_moved_into_place(self):
+        with patch(
+            "django.core.files.storage.file_move_safe", wraps=file_move_safe
+        ) as move:
+            res = self.post(self.png())
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # Renamed from where the handler wrote it, not copied
+        move.assert_called_once()
+        self.recipe.refresh_from_db()
+        digest = hashlib.sha256(self.png()).hexdigest()
+        self.assertEqual(
+            self.recipe.image.name, f"uploads/recipe/{digest}.png"
+        )
+        with open(self.recipe.image.path, "rb") as f:
+            self.assertEqual(f.read(), self.png())
+        self.assertEqual(
+            set(os.listdir(self.upload_dir)) - self.existing, {f"{digest}.png"}
+        )
+
+    @override_settings(RECIPE_IMAGE_UPLOAD_CHUNK_SIZE=1024)
+    def test_header_spanning_chunks(self):
+        res = self.post(self.jpeg_with_long_header(), name="photo.jpg")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_non_image_rejected(self):
+        res = self.post(b"not an image" * 10000, name="photo.jpg")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", res.data)
+        self.assertNoNewFiles()
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=99)
+    def test_too_many_pixels_rejected(self):
+        res = self.post(self.png())
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data["image"], ["The image has too many pixels."])
+        self.assertNoNewFiles()
+
+    @override_settings(
+        RECIPE_IMAGE_UPLOAD_CHUNK_SIZE=1024, RECIPE_IMAGE_SNIFF_SIZE=2048
+    )
+    def test_header_beyond_sniff_size_rejected(self):
+        res = self.post(self.jpeg_with_long_header(), name="photo.jpg")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNoNewFiles()
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_too_large_rejected(self):
+        res = self.post(self.png() + bytes(100 * 1024))
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+        self.assertNoNewFiles()
+
+    def test_truncated_image_removed(self):
+        res = self.post(self.png((200, 200))[:60])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNoNewFiles()
+
+
+class SharedImageTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+        self.recipes = [create_recipe(user=self.user) for _ in range(2)]
+
+    def tearDown(self):
+        for recipe in Recipe.objects.all():
+            recipe.image.delete(save=False)
+
+    def upload(self, recipe, color="red"):
+        buffer = io.BytesIO()
+        Image.new("RGB", (10, 10), color=color).save(buffer, "PNG")
+        buffer.seek(0)
+        buffer.name = "photo.png"
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                image_upload_url(recipe.id), {"image": buffer},
+                format="multipart",
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        return recipe.image.name
+
+    def test_identical_uploads_share_a_file(self):
+        first = self.upload(self.recipes[0])
+        second = self.upload(self.recipes[1])
+
+        self.assertEqual(first, second)
+        self.assertEqual(ImageBlob.objects.get(name=first).ref_count, 2)
+
+    def test_replaced_image_deleted_when_unused(self):
+        shared = self.upload(self.recipes[0])
+        self.upload(self.recipes[1])
+
+        self.upload(self.recipes[0], color="blue")
+        self.assertTrue(default_storage.exists(shared))
+        self.assertEqual(ImageBlob.objects.get(name=shared).ref_count, 1)
+
+        self.upload(self.recipes[1], color="blue")
+        self.assertFalse(default_storage.exists(shared))
+        self.assertFalse(ImageBlob.objects.filter(name=shared).exists())
+
+    def test_deleting_recipe_releases_image(self):
+        name = self.upload(self.recipes[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.delete(detail_url(self.recipes[0].id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0)
+class ImageProcessingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com", password="test123")
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        for path in self.recipe.image_renditions.values():
+            default_storage.delete(path)
+        self.recipe.image.delete()
+
+    def upload(self, size=(1600, 800), image_format="JPEG", **options):
+        img = Image.new("RGB", size, color="red")
+        if "exif" not in options:
+            exif = Image.Exif()
+            exif[0x0112] = 6  # orientation: rotate 90 degrees
+            exif[0x010F] = "Camera maker"
+            options["exif"] = exif
+        buffer = io.BytesIO()
+        img.save(buffer, image_format, **options)
+        buffer.seek(0)
+        buffer.name = f"photo.{image_format.lower()}"
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                image_upload_url(self.recipe.id), {"image": buffer},
+                format="multipart",
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res
+
+    def test_upload_creates_renditions(self):
+        res = self.upload()
+
+        self.assertEqual(res.data["image_status"], Recipe.IMAGE_PENDING)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+        renditions = self.recipe.image_renditions
+        self.assertEqual(set(renditions), set(images.RENDITIONS))
+
+        with default_storage.open(renditions["thumbnail"]) as f:
+            thumbnail = Image.open(f)
+            # EXIF rotation applied, metadata stripped
+            self.assertEqual(thumbnail.size, (100, 200))
+            self.assertEqual(len(thumbnail.getexif()), 0)
+        with default_storage.open(renditions["large_webp"]) as f:
+            self.assertEqual(Image.open(f).format, "WEBP")
+
+    def test_original_replaced_without_exif(self):
+        res = self.upload()
+
+        self.recipe.refresh_from_db()
+        original = self.recipe.image.name
+        uploaded = os.path.join(
+            os.path.dirname(original), os.path.basename(res.data["image"])
+        )
+        self.assertNotEqual(original, uploaded)
+        self.assertEqual(ImageBlob.objects.get(name=original).ref_count, 1)
+        # Released while processing; the deletion runs after that commits
+        self.assertEqual(ImageBlob.objects.get(name=uploaded).ref_count, 0)
+        self.assertTrue(ImageBlob.objects.delete_orphan(uploaded))
+        self.assertFalse(default_storage.exists(uploaded))
+        with self.recipe.image.open() as f:
+            image = Image.open(f)
+            self.assertEqual(image.size, (800, 1600))
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_original_without_metadata_kept(self):
+        res = self.upload(exif=b"")
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            os.path.basename(self.recipe.image.name),
+            os.path.basename(res.data["image"]),
+        )
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+
+    def test_lossless_webp_stays_lossless(self):
+        self.upload(size=(40, 20), image_format="WEBP", lossless=True)
+
+        self.recipe.refresh_from_db()
+        with self.recipe.image.open() as f:
+            self.assertTrue(images.is_lossless_webp(f))
+            f.seek(0)
+            image = Image.open(f)
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(len(image.getexif()), 0)
+            # Rotated, but not a pixel changed
+            self.assertEqual(image.size, (20, 40))
+            self.assertEqual(
+                image.convert("RGB").getcolors(), [(800, (255, 0, 0))]
+            )
+
+    def test_image_status_endpoint(self):
+        self.upload()
+
+        res = self.client.get(image_status_url(self.recipe.id))
+
+        self.assertEqual(res.data["image_status"], Recipe.IMAGE_READY)
+        self.assertTrue(
+            res.data["renditions"]["thumbnail"].startswith(
+                "http://testserver/"
+            )
+        )
+
+    def test_replacing_image_removes_old_renditions(self):
+        self.upload()
+        self.recipe.refresh_from_db()
+        old = list(self.recipe.image_renditions.values())
+        old_image = self.recipe.image.name
+
+        self.upload()
+
+        for path in old:
+            self.assertFalse(default_storage.exists(path))
+        default_storage.delete(old_image)
+
+    def test_failed_processing_reported(self):
+        with patch("recipe.images.render", side_effect=OSError("broken")):
+            self.upload()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_FAILED)
+        self.assertEqual(self.recipe.image_renditions, {})
+
+    @override_settings(RECIPE_IMAGE_WORKERS=2)
+    def test_processing_submitted_to_pool(self):
+        with patch("recipe.images.get_executor") as get_executor:
+            images._submit(self.recipe.id)
+
+        get_executor.return_value.submit.assert_called_once_with(
+            images._run_in_worker, self.recipe.id
+        )
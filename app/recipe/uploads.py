@@ -0,0 +1,173 @@
+"""
+Streaming upload handler for recipe images
+
+Django's default handlers store the whole upload in memory or a temporary
+file before the serializer looks at it. ``RecipeImageUploadHandler`` checks
+the declared request size before reading the body, recognises the image
+format from the first bytes and reads the dimensions from the header, so
+junk and decompression bombs are refused while the rest of the body is
+still unread. Accepted images are written straight into the image storage
+directory and hashed on the way, so saving them is a rename to their
+content-addressed name.
+"""
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image, UnidentifiedImageError
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from core.models import recipe_image_file_path
+from core.storage import image_storage
+
+
+FIELD_NAME = 'image'
+
+# Leading bytes of the accepted formats
+SIGNATURES = (
+    b'\xff\xd8\xff',  # JPEG
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+)
+IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+# Room for the multipart boundaries and part headers around the image
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The image is too large.'
+    default_code = 'upload_too_large'
+
+
+def _invalid(message):
+    return ValidationError({FIELD_NAME: [message]})
+
+
+def _is_image(header):
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return True
+    return header.startswith(SIGNATURES)
+
+
+class StoredImageUpload(UploadedFile):
+    """An upload already written to ``storage_name`` in ``image_storage``"""
+
+    def __init__(self, file, storage_name, sha256, **kwargs):
+        super().__init__(file, name=os.path.basename(storage_name), **kwargs)
+        self.storage_name = storage_name
+        # Read by ContentAddressedStorage instead of hashing the file again
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def discard(self):
+        self.close()
+        image_storage.delete(self.storage_name)
+
+
+class RecipeImageUploadHandler(FileUploadHandler):
+    """Stream the ``image`` part of a recipe image upload to disk.
+
+    ``image_storage`` is a ``FileSystemStorage``, whose ``path()`` gives the
+    file's location on disk.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.chunk_size = settings.RECIPE_IMAGE_UPLOAD_CHUNK_SIZE
+        self.file = None
+        self.storage_name = None
+        self.header = None
+        self.digest = None
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        # Clients sending a Content-Length are refused before the body is read
+        limit = settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+        if content_length > limit:
+            raise UploadTooLarge()
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name != FIELD_NAME or self.storage_name is not None:
+            raise SkipFile()
+        self.header = bytearray()
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            self.upload_interrupted()
+            raise UploadTooLarge()
+
+        if self.file is None:
+            self.header += raw_data
+            if not self._sniff():
+                return None
+            raw_data, self.header = bytes(self.header), None
+
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.file is None:
+            # The whole file was sniffed without finding a readable header
+            raise _invalid('Upload a valid image.')
+
+        self.file.flush()
+        self.file.seek(0)
+        return StoredImageUpload(
+            self.file,
+            self.storage_name,
+            self.digest.hexdigest(),
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        if self.file is not None:
+            self.file.close()
+            image_storage.delete(self.storage_name)
+            self.file = None
+            self.storage_name = None
+
+    def _sniff(self):
+        """Open the destination once the buffered header checks out.
+
+        Returns False while more data is needed to read the dimensions.
+        """
+        if len(self.header) >= 12 and not _is_image(self.header):
+            raise _invalid('Upload a valid image.')
+
+        try:
+            header = io.BytesIO(self.header)
+            with Image.open(header, formats=IMAGE_FORMATS) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            raise _invalid('The image has too many pixels.')
+        except (UnidentifiedImageError, OSError):
+            # Header still incomplete
+            if len(self.header) < settings.RECIPE_IMAGE_SNIFF_SIZE:
+                return False
+            raise _invalid('Upload a valid image.')
+
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise _invalid('The image has too many pixels.')
+
+        name = recipe_image_file_path(None, self.file_name)
+        path = image_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'xb+')
+        self.storage_name = name
+        return True
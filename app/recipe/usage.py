@@ -0,0 +1,104 @@
+"""
+Usage counts of tags and ingredients
+
+``Tag.usage_count`` and ``Ingredient.usage_count`` hold the number of
+recipes linked to each row, so the lists can be ordered by popularity
+without counting the M2M tables. ``relations_changed`` and
+``recipe_deleting`` keep them current from the signal handlers in
+``recipe.signals``. The bulk write paths send no signals and call
+``count_links`` with the rows they wrote. ``recount`` repairs the counts.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from core.models import Ingredient, Recipe, Tag
+
+
+RELATIONS = {'tags': Tag, 'ingredients': Ingredient}
+
+
+def _column(model):
+    # The through table column pointing at ``model``
+    return f'{model._meta.model_name}_id'
+
+
+def _decrement(queryset):
+    queryset.update(usage_count=Greatest(F('usage_count') - 1, Value(0)))
+
+
+def count_links(model, added=(), removed=()):
+    """Count the links to ``model`` ids written or deleted in bulk"""
+    changes = Counter(added)
+    changes.subtract(removed)
+    model.objects.add_usage(changes)
+
+
+def relations_changed(through, instance, action, reverse, model, pk_set):
+    """Apply an ``m2m_changed`` signal of ``Recipe.tags/ingredients``"""
+    if not reverse:
+        # instance is a recipe; pk_set holds ids of model
+        if action == 'post_add' and pk_set:
+            model.objects.add_usage(dict.fromkeys(pk_set, 1))
+        elif action == 'pre_remove' and pk_set:
+            # Ids that are not linked may be passed; only linked ones count
+            _decrement(model.objects.filter(recipe=instance, id__in=pk_set))
+        elif action == 'pre_clear':
+            _decrement(model.objects.filter(recipe=instance))
+        return
+
+    # instance is a tag or ingredient; pk_set holds recipe ids
+    target = type(instance)
+    if action == 'post_add' and pk_set:
+        target.objects.add_usage({instance.pk: len(pk_set)})
+    elif action == 'pre_remove' and pk_set:
+        linked = through.objects.filter(
+            recipe_id__in=pk_set, **{_column(target): instance.pk}
+        ).count()
+        target.objects.add_usage({instance.pk: -linked})
+    elif action == 'pre_clear':
+        target.objects.filter(pk=instance.pk).update(usage_count=0)
+
+
+def recipe_deleting(recipe):
+    """Uncount a recipe's links before the delete cascades to them"""
+    for model in RELATIONS.values():
+        _decrement(model.objects.filter(recipe=recipe))
+
+
+def recount(model, batch_size=1000):
+    """Recompute ``model`` usage counts in id order, one UPDATE per batch.
+
+    Returns the number of rows whose count was wrong.
+    """
+    field = next(
+        field for field, target in RELATIONS.items() if target is model
+    )
+
+    through = getattr(Recipe, field).through
+    column = _column(model)
+    actual = Coalesce(Subquery(
+        through.objects.filter(**{column: OuterRef('pk')})
+        .values(column)
+        .annotate(total=Count('id'))
+        .values('total')
+    ), 0)
+
+    fixed = 0
+    last = 0
+    while True:
+        ids = list(
+            model.objects.filter(id__gt=last)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return fixed
+        fixed += (
+            model.objects.filter(id__in=ids)
+            .annotate(actual=actual)
+            .exclude(usage_count=F('actual'))
+            .update(usage_count=actual)
+        )
+        last = ids[-1]
@@ -1,30 +1,175 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import (
+    extend_schema,
+    extend_schema_view,
+    OpenApiParameter,
+)
 
-from core.models import Recipe, Ingredient
-from recipe import serializers
+from core.authentication import CachedTokenAuthentication
+from core.autocomplete import AutocompleteMixin
+from core.fastpath import FastListMixin
+from core.filters import filter_assigned
+from core.models import Recipe, Ingredient, Tag
+from core.pagination import OrderedCursorPagination, RankedPagination
+from core.routers import (
+    ReplicaReadMixin,
+    is_pinned_to_primary,
+    reading_from_replicas,
+)
+from core.sparse import SparseFieldsViewMixin
+from recipe import cache, exports, filters, images, serializers, stats, uploads
+from recipe.search import search_recipes
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+def _is_id(value):
+    # JSON true and false arrive as bools, which are ints to isinstance()
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        "fields", OpenApiTypes.STR,
+        description="Comma separated fields to return",
+    ),
+    OpenApiParameter(
+        "expand", OpenApiTypes.STR,
+        description="Comma separated relations to include",
+    ),
+]
+
+
+@extend_schema_view(
+    list=extend_schema(
+        parameters=SPARSE_FIELDS_PARAMETERS + [
+            OpenApiParameter(
+                "tags", OpenApiTypes.STR,
+                description="Comma separated tag ids",
+            ),
+            OpenApiParameter(
+                "tags_match", OpenApiTypes.STR, enum=filters.MATCH_MODES
+            ),
+            OpenApiParameter(
+                "ingredients", OpenApiTypes.STR,
+                description="Comma separated ingredient ids",
+            ),
+            OpenApiParameter(
+                "ingredients_match", OpenApiTypes.STR,
+                enum=filters.MATCH_MODES,
+            ),
+            OpenApiParameter("min_time", OpenApiTypes.INT),
+            OpenApiParameter("max_time", OpenApiTypes.INT),
+            OpenApiParameter("min_price", OpenApiTypes.DECIMAL),
+            OpenApiParameter("max_price", OpenApiTypes.DECIMAL),
+        ]
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+)
+class RecipeViewSet(
+    ReplicaReadMixin,
+    SparseFieldsViewMixin,
+    FastListMixin,
+    viewsets.ModelViewSet,
+):
+
 
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    # Relations each action serializes. Fetching them up front keeps the
+    # query count flat instead of two extra queries per recipe. Update and
+    # partial_update re-read the relations after saving, so prefetching them
+    # there would only be thrown away by DRF. Relations are ordered by id,
+    # as the list fast path returns them.
+    relations = [
+        Prefetch("tags", queryset=Tag.objects.order_by("id")),
+        Prefetch("ingredients", queryset=Ingredient.objects.order_by("id")),
+    ]
+    prefetch_by_action = {
+        "list": relations,
+        "retrieve": relations,
+        "search": relations,
+    }
+    sparse_fields_actions = ("list", "retrieve", "search")
+
     def get_queryset(self):
         # overiding queryset method to retirve recipes for self.user
+        queryset = self.queryset.filter(user=self.request.user).order_by("-id")
+
+        if self.action == "list":
+            queryset = filters.filter_recipes(
+                queryset, self.request.query_params
+            )
+
+        # ?fields=/?expand= narrow the columns and the prefetches
+        queryset, prefetch = self.sparse_queryset(
+            queryset, self.prefetch_by_action.get(self.action, [])
+        )
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+
+        return queryset
 
-        return self.queryset.filter(user=self.request.user).order_by("-id")
+    def list(self, request, *args, **kwargs):
+        return self._cached_read(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_read(super().retrieve, request, *args, **kwargs)
+
+    def _cached_read(self, read, request, *args, **kwargs):
+        # Serve from the per-user cache, or a bodiless 304 when the client
+        # already holds the current version
+        key, etag = cache.response_key(request, self.action, kwargs.get("pk"))
+        etags = parse_etags(request.headers.get("If-None-Match", ""))
+        if cache.etag_listed(etag, etags):
+            return self._not_modified(etag)
+
+        data = cache.get_response(key)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = read(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            # A write that committed during a replica read may be missing
+            # from it, yet the key holds the version bumped by that write
+            concurrent_write = (
+                reading_from_replicas()
+                and is_pinned_to_primary(request.user.pk)
+            )
+            if not concurrent_write:
+                cache.set_response(key, response.data)
+
+        if "*" in etags:
+            # Matches whichever version exists
+            return self._not_modified(etag)
+        response["ETag"] = etag
+        return response
+
+    def _not_modified(self, etag):
+        return Response(
+            status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
 
     def get_serializer_class(self):
         if self.action == "list":
             return serializers.RecipeSerializer
-        elif self.action == "upload_image":
+        elif self.action == "search":
+            return serializers.RecipeSearchSerializer
+        elif self.action in ("upload_image", "image_status"):
             return serializers.RecipeImageSerializer
+        elif self.action == "stats":
+            return serializers.RecipeStatsSerializer
 
         return super().get_serializer_class()
 
@@ -32,27 +177,215 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # Assign the current user to the recipe before saving
         return serializer.save(user=self.request.user)
 
+    @action(methods=["POST", "PATCH", "DELETE"], detail=False, url_path="bulk")
+    def bulk(self, request):
+        # POST creates, PATCH updates ({"id": ..., ...}) and DELETE removes
+        # (a list of ids) up to RECIPE_BULK_MAX_ITEMS recipes in one
+        # transaction
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {"detail": "Expected a list of items."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > settings.RECIPE_BULK_MAX_ITEMS:
+            return Response(
+                {
+                    "detail": f"At most {settings.RECIPE_BULK_MAX_ITEMS} "
+                    "items per request."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if request.method == "POST":
+            return self._bulk_create(items)
+        if request.method == "PATCH":
+            return self._bulk_update(items)
+        return self._bulk_delete(items)
+
+    def _bulk_create(self, items):
+        serializer = self.get_serializer(data=items, many=True)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        recipes = serializer.save(user=self.request.user)
+        cache.bump_version(self.request.user.pk)
+        return self._bulk_results(recipes, status.HTTP_201_CREATED)
+
+    def _bulk_update(self, items):
+        ids = [
+            item.get("id") if isinstance(item, dict) else None
+            for item in items
+        ]
+        unique = len(set(ids)) == len(ids)
+        if not all(_is_id(pk) for pk in ids) or not unique:
+            return Response(
+                {"detail": "Each item needs a unique integer id."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        recipes = Recipe.objects.filter(user=self.request.user).in_bulk(ids)
+        not_found = [pk for pk in ids if pk not in recipes]
+        if not_found:
+            return Response(
+                {"not_found": not_found}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids], data=items, many=True, partial=True
+        )
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        recipes = serializer.save()
+        cache.bump_version(self.request.user.pk)
+        return self._bulk_results(recipes, status.HTTP_200_OK)
+
+    def _bulk_delete(self, ids):
+        if not all(_is_id(pk) for pk in ids):
+            return Response(
+                {"detail": "Expected a list of recipe ids."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        recipes = Recipe.objects.filter(user=self.request.user, id__in=ids)
+        with transaction.atomic():
+            found = set(recipes.values_list("id", flat=True))
+            recipes.delete()
+
+        return Response(
+            {
+                "deleted": [pk for pk in ids if pk in found],
+                "not_found": [pk for pk in ids if pk not in found],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def _bulk_results(self, recipes, status_code):
+        # Re-read with prefetching so the response does not go N+1, in input
+        # order
+
+        ids = [recipe.id for recipe in recipes]
+        by_id = Recipe.objects.prefetch_related(*self.relations).in_bulk(ids)
+        serializer = self.get_serializer([by_id[pk] for pk in ids], many=True)
+        return Response(serializer.data, status=status_code)
+
+    @extend_schema(
+        parameters=[OpenApiParameter("q", OpenApiTypes.STR, required=True)]
+        + SPARSE_FIELDS_PARAMETERS
+    )
+    @action(methods=["GET"], detail=False, pagination_class=RankedPagination)
+    def search(self, request):
+        # Ranked full-text search over title, description, tags and ingredients
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            return Response(
+                {"q": "This parameter is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        recipes = search_recipes(self.get_queryset(), text)
+        page = self.paginate_queryset(recipes)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=["GET"], detail=False)
+    def stats(self, request):
+        # Totals, averages, price distribution and most used tags and
+        # ingredients, cached with the user's other recipe reads
+        return self._cached_read(self._stats, request)
+
+    def _stats(self, request):
+        serializer = self.get_serializer(stats.user_stats(request.user))
+        return Response(serializer.data)
+
+    @action(methods=["GET"], detail=False, url_path="export")
+    def export(self, request):
+        # ?output=ndjson (default) or ?output=csv; "format" is taken by DRF
+        output = request.query_params.get("output", "ndjson")
+        if output not in exports.FORMATS:
+            return Response(
+                {"output": f"Choose one of: {', '.join(exports.FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        lines, content_type, extension = exports.FORMATS[output]
+        recipes = Recipe.objects.filter(user=request.user).order_by("id")
+        response = StreamingHttpResponse(
+            lines(recipes, settings.RECIPE_EXPORT_CHUNK_SIZE),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="recipes.{extension}"'
+        )
+
+        return response
+
     @action(methods=["POST"], detail=True, url_path="upload-image")
     def upload_image(self, request, pk=None):
         recipe = self.get_object()
+        # Stream the file to its final path, refusing bad uploads before
+        # the rest of the body is read
+        request._request.upload_handlers = [
+            uploads.RecipeImageUploadHandler(request._request)
+        ]
         serializer = self.get_serializer(
             recipe, data=request.data
         )  # Passing the recipe object into the serializer ensures that the serializer performs a partial update on the correct instance of the Recipe model, rather than creating a new one or modifying the wrong object. It provides context for the serializer to know which recipe is being modified and how to handle the incoming data in relation to that object.
 
         if serializer.is_valid():
-            serializer.save()
+            # Storing the file and counting its reference in one transaction
+            # keeps the blob row locked in between
+            with transaction.atomic():
+                # Renditions are made in the background; image_status tracks
+                # them
+
+                recipe = serializer.save(image_status=Recipe.IMAGE_PENDING)
+                images.schedule_renditions(recipe.id)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
+        for upload in request.FILES.values():
+            if isinstance(upload, uploads.StoredImageUpload):
+                upload.discard()
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=["GET"], detail=True, url_path="image-status")
+    def image_status(self, request, pk=None):
+        serializer = self.get_serializer(self.get_object())
+        return Response(serializer.data)
+
 
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter("assigned_only", OpenApiTypes.INT, enum=[0, 1]),
+            OpenApiParameter("ordering", OpenApiTypes.STR, enum=["popular"]),
+        ]
+    )
+)
 class IngredientViewSet(
+    ReplicaReadMixin,
+    AutocompleteMixin,
+    FastListMixin,
     mixins.UpdateModelMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     viewsets.GenericViewSet,
 ):
-    serializer_class = serializers.IngredientSerializer
+    serializer_class = serializers.IngredientDetailSerializer
     queryset = Ingredient.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderedCursorPagination
+    # Most used first, on the core_ingredient_usage index
+    cursor_orderings = {"popular": ("-usage_count", "-id")}
+
+    def get_queryset(self):
+        return filter_assigned(
+            self.queryset, "ingredients",
+            self.request.query_params, self.request.user,
+        )
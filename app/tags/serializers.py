@@ -1,11 +1,43 @@
+from django.utils.translation import gettext as translate
 from rest_framework import serializers
 
+from core.metrics import TimedListSerializer, TimedSerializerMixin
 from core.models import Tag
 
 
-class TagSerializer(serializers.ModelSerializer):
+class UniqueNameMixin:
+    """Reject names that already exist in any case.
+
+    Only applies when the serializer is used on its own; nested under
+    RecipeSerializer an existing name is linked rather than created.
+    """
+
+    def validate_name(self, value):
+        if self.parent is None:
+            model = self.Meta.model
+            existing = model.objects.filter_name_iexact(value)
+            if self.instance is not None:
+                existing = existing.exclude(pk=self.instance.pk)
+            if existing.exists():
+                msg = translate('An entry with this name already exists.')
+                raise serializers.ValidationError(msg, code='unique')
+        return value
+
+
+class TagSerializer(
+    UniqueNameMixin, TimedSerializerMixin, serializers.ModelSerializer
+):
+
 
     class Meta:
         model=Tag
         fields = ['id','name']
-        read_only = ['id']
\ No newline at end of file
+        read_only = ['id']
+        list_serializer_class = TimedListSerializer
+
+
+class TagDetailSerializer(TagSerializer):
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['usage_count']
+        read_only_fields = ['usage_count']
@@ -6,7 +6,7 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Recipe, Tag
-from tags.serializers import TagSerializer
+from tags.serializers import TagDetailSerializer
 
 TAGS_URL = reverse("tags:tag-list")
 
@@ -61,10 +61,10 @@ class PrivateRecipeAPITests(TestCase):
 
         res = self.client.get(TAGS_URL)
 
-        tags = Tag.objects.all()
-        serializer = TagSerializer(tags, many=True)
+        tags = Tag.objects.all().order_by("-id")
+        serializer = TagDetailSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
 
     def test_create_tag(self):
@@ -79,5 +79,83 @@ class PrivateRecipeAPITests(TestCase):
 
         self.assertEqual(tag.id, res.data["id"])
 
+    def test_create_duplicate_tag_rejected(self):
+        Tag.objects.create(name="Dinner")
 
+        res = self.client.post(TAGS_URL, {"name": "dinner"})
 
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_filter_assigned_only(self):
+        assigned = Tag.objects.create(name="Assigned")
+        Tag.objects.create(name="Unassigned")
+        other_user = create_user(email="other@example.com", password="test123")
+        other_tag = Tag.objects.create(name="Other")
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(assigned)
+        create_recipe(user=self.user).tags.add(assigned)
+        create_recipe(user=other_user).tags.add(other_tag)
+
+        res = self.client.get(TAGS_URL, {"assigned_only": 1})
+
+        assigned.refresh_from_db()
+        self.assertEqual(
+            res.data["results"], [TagDetailSerializer(assigned).data]
+        )
+
+    def test_usage_count_and_popular_ordering(self):
+        rare = Tag.objects.create(name="Rare")
+        common = Tag.objects.create(name="Common")
+        unused = Tag.objects.create(name="Unused")
+        create_recipe(user=self.user).tags.add(rare, common)
+        create_recipe(user=self.user).tags.add(common)
+
+        res = self.client.get(
+            TAGS_URL, {"ordering": "popular", "page_size": 2}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(tag["name"], tag["usage_count"]) for tag in res.data["results"]],
+            [("Common", 2), ("Rare", 1)],
+        )
+        res = self.client.get(res.data["next"])
+        self.assertEqual(
+            [tag["id"] for tag in res.data["results"]], [unused.id]
+        )
+
+    def test_popular_ordering_pages_through_ties(self):
+        recipe = create_recipe(user=self.user)
+        tags = [Tag.objects.create(name=f"Tag {index}") for index in range(7)]
+        recipe.tags.add(*tags[:5])
+        expected = (
+            [tag.id for tag in reversed(tags[:5])] + [tags[6].id, tags[5].id]
+        )
+
+        pages = []
+        res = self.client.get(
+            TAGS_URL, {"ordering": "popular", "page_size": 2}
+        )
+        while True:
+            pages.append([tag["id"] for tag in res.data["results"]])
+            if res.data["next"] is None:
+                break
+            res = self.client.get(res.data["next"])
+
+        self.assertEqual(sum(pages, []), expected)
+        res = self.client.get(res.data["previous"])
+        self.assertEqual([tag["id"] for tag in res.data["results"]], pages[-2])
+
+    def test_invalid_cursor(self):
+        res = self.client.get(
+            TAGS_URL, {"ordering": "popular", "cursor": "bm9wZQ=="}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unknown_ordering_rejected(self):
+        res = self.client.get(TAGS_URL, {"ordering": "name"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("ordering", res.data)
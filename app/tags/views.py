@@ -1,15 +1,50 @@
 from rest_framework import mixins, viewsets
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import (
+    extend_schema,
+    extend_schema_view,
+    OpenApiParameter,
+)
 
+
+from core.authentication import CachedTokenAuthentication
+from core.autocomplete import AutocompleteMixin
+from core.fastpath import FastListMixin
+from core.filters import filter_assigned
 from core.models import Tag
+from core.pagination import OrderedCursorPagination
+from core.routers import ReplicaReadMixin
 from tags import serializers
 
 
-class TagViewSet(mixins.UpdateModelMixin, mixins.CreateModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter("assigned_only", OpenApiTypes.INT, enum=[0, 1]),
+            OpenApiParameter("ordering", OpenApiTypes.STR, enum=["popular"]),
+        ]
+    )
+)
+class TagViewSet(
+    ReplicaReadMixin,
+    AutocompleteMixin,
+    FastListMixin,
+    mixins.UpdateModelMixin,
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    viewsets.GenericViewSet,
+):
 
-    serializer_class = serializers.TagSerializer
+    serializer_class = serializers.TagDetailSerializer
     queryset = Tag.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderedCursorPagination
+    # Most used first, on the core_tag_usage index
+    cursor_orderings = {"popular": ("-usage_count", "-id")}
 
+    def get_queryset(self):
+        return filter_assigned(
+            self.queryset, "tags", self.request.query_params, self.request.user
+        )
@@ -2,7 +2,10 @@ from django.contrib.auth import get_user_model, authenticate
 from rest_framework import serializers
 from django.utils.translation import gettext as translate
 
-class UserSerializer(serializers.ModelSerializer):
+from core.metrics import TimedSerializerMixin
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = get_user_model()